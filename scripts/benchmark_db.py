@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарки слоя базы данных AutoParts
+
+Запуск:
+    python scripts/benchmark_db.py connections [--parts 100000]
+    python scripts/benchmark_db.py pragmas [--sales 2000]
+    python scripts/benchmark_db.py article [--parts 100000]
+    python scripts/benchmark_db.py page [--parts 100000]
+    python scripts/benchmark_db.py import [--rows 20000]
+    python scripts/benchmark_db.py checkout [--sales 300]
+    python scripts/benchmark_db.py records [--parts 100000]
+    python scripts/benchmark_db.py cache [--parts 100000]
+    python scripts/benchmark_db.py table [--parts 10000 100000 500000]
+    python scripts/benchmark_db.py search [--parts 100000]
+    python scripts/benchmark_db.py stats [--parts 100000]
+    python scripts/benchmark_db.py money [--items 1000000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+# Добавляем путь к src для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database_simple import LOW_STOCK_THRESHOLD, SimpleDatabase
+from money import from_kopecks
+from search_index import register_search_functions
+from sqlite_pragmas import PRAGMA_PROFILES
+
+BRANDS = ["Toyota", "Honda", "BMW", "Lada", "Kia", "Hyundai", "Nissan", "Ford"]
+CATEGORIES = ["Двигатель", "Трансмиссия", "Тормозная система", "Подвеска",
+              "Электрика", "Кузов", "Салон", "Прочее"]
+NAMES = ["Масляный фильтр", "Воздушный фильтр", "Тормозные колодки",
+         "Свеча зажигания", "Ремень ГРМ", "Амортизатор", "Стойка стабилизатора"]
+
+
+def fill_catalog(db_path: str, count: int):
+    """Заполнить таблицу parts синтетическим каталогом"""
+    rnd = random.Random(42)
+    now = datetime.now().isoformat()
+    rows = (
+        (f"ART{i:07d}", f"{rnd.choice(NAMES)} {i}", rnd.choice(BRANDS),
+         f"Model {i % 500}", rnd.choice(CATEGORIES), rnd.randint(0, 50),
+         # Цены в копейках
+         rnd.randint(1000, 500000), rnd.randint(2000, 800000), "", now, now)
+        for i in range(count)
+    )
+    with sqlite3.connect(db_path) as conn:
+        # Нужны триггерам колонок *_cf и article_key
+        register_search_functions(conn)
+        conn.executemany('''
+        INSERT INTO parts (article, name, brand, car_model, category,
+                           quantity, buy_price, sell_price, description,
+                           created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+
+def measure(func, iterations: int) -> float:
+    """Среднее время одного вызова в миллисекундах"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def report(title: str, before_ms: float, after_ms: float):
+    """Напечатать строку сравнения"""
+    speedup = before_ms / after_ms if after_ms else float('inf')
+    print(f"  {title:<20} до: {before_ms:9.3f} мс   после: {after_ms:9.3f} мс   "
+          f"ускорение: x{speedup:.1f}")
+
+
+def bench_connections(args):
+    """Задержка вызова: новое соединение на каждый вызов против менеджера соединений"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # Без кэша чтений: повторные id и запросы иначе отвечались бы из кэша,
+        # а сравнивается только переиспользование соединений
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'), cache_size=0)
+        fill_catalog(db.db_path, args.parts)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        ids = [random.randint(1, args.parts) for _ in range(args.iterations)]
+        queries = ["фильтр 12", "toyota", "ART00001", "model 42"]
+
+        # "До": поведение прежней версии - новое соединение на каждый вызов
+        def legacy_get_part_by_id(i):
+            with sqlite3.connect(db.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM parts WHERE id = ?', (ids[i],))
+                row = cursor.fetchone()
+                columns = [desc[0] for desc in cursor.description]
+                return dict(zip(columns, row, strict=True))
+
+        def legacy_search_parts(i):
+            search_query = f"%{queries[i % len(queries)].lower()}%"
+            with sqlite3.connect(db.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                SELECT * FROM parts
+                WHERE LOWER(article) LIKE ? OR LOWER(name) LIKE ?
+                   OR LOWER(brand) LIKE ? OR LOWER(car_model) LIKE ?
+                   OR LOWER(category) LIKE ?
+                ORDER BY article
+                ''', (search_query,) * 5)
+                columns = [desc[0] for desc in cursor.description]
+                return [dict(zip(columns, row, strict=True)) for row in cursor.fetchall()]
+
+        search_iterations = max(1, args.iterations // 100)
+
+        print("🔎 get_part_by_id")
+        report("get_part_by_id",
+               measure(legacy_get_part_by_id, args.iterations),
+               measure(lambda i: db.get_part_by_id(ids[i]), args.iterations))
+
+        print("🔎 search_parts")
+        report("search_parts",
+               measure(legacy_search_parts, search_iterations),
+               measure(lambda i: db.search_parts(queries[i % len(queries)]),
+                       search_iterations))
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_pragmas(args):
+    """Продажи в секунду и задержка параллельного чтения для каждого профиля PRAGMA"""
+    for profile in PRAGMA_PROFILES:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'), pragma_profile=profile)
+            fill_catalog(db.db_path, args.parts)
+            with sqlite3.connect(db.db_path) as conn:
+                conn.execute('UPDATE parts SET quantity = 1000000')
+
+            stop = threading.Event()
+            read_latencies = []
+
+            # Переменные итерации связываются сразу (ruff B023)
+            def reader(db=db, stop=stop, read_latencies=read_latencies):
+                rnd = random.Random(7)
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    db.get_part_by_id(rnd.randint(1, args.parts))
+                    read_latencies.append((time.perf_counter() - start) * 1000)
+
+            thread = threading.Thread(target=reader)
+            thread.start()
+
+            rnd = random.Random(1)
+            start = time.perf_counter()
+            for _ in range(args.sales):
+                items = [{'part_id': rnd.randint(1, args.parts), 'quantity': 1, 'price': 100.0}
+                         for _ in range(3)]
+                db.create_sale(items)
+            elapsed = time.perf_counter() - start
+
+            stop.set()
+            thread.join()
+            db.close()
+
+            read_latencies.sort()
+            p95 = read_latencies[int(len(read_latencies) * 0.95)] if read_latencies else 0.0
+            print(f"  {profile:<6} продаж/с: {args.sales / elapsed:9.1f}   "
+                  f"чтение p50: {statistics.median(read_latencies or [0.0]):.3f} мс   "
+                  f"p95: {p95:.3f} мс   чтений: {len(read_latencies)}")
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_article(args):
+    """Поиск по артикулу: сканирование LIKE против индекса article_key"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'))
+        fill_catalog(db.db_path, args.parts)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        rnd = random.Random(3)
+        # Пользователь вводит артикул с лишними разделителями
+        typed = [f"ART-{rnd.randint(0, args.parts - 1):07d}" for _ in range(args.iterations)]
+
+        def legacy_find(i):
+            pattern = '%'.join(typed[i].replace('-', ''))
+            cursor = db._connections.reader().cursor()
+            cursor.execute('SELECT * FROM parts WHERE UPPER(article) LIKE ?', (pattern,))
+            return cursor.fetchall()
+
+        print("🔎 Точный поиск")
+        report("find_by_article",
+               measure(legacy_find, max(1, args.iterations // 10)),
+               measure(lambda i: db.find_by_article(typed[i]), args.iterations))
+
+        def legacy_prefix(i):
+            # LIKE без COLLATE NOCASE не использует индекс и сканирует таблицу
+            cursor = db._connections.reader().cursor()
+            cursor.execute('SELECT * FROM parts WHERE article LIKE ? ORDER BY article LIMIT 50',
+                           (typed[i][:7].replace('-', '') + '%',))
+            return cursor.fetchall()
+
+        print("🔎 Поиск по префиксу")
+        report("prefix",
+               measure(legacy_prefix, max(1, args.iterations // 10)),
+               measure(lambda i: db.find_parts_by_article_prefix(typed[i][:7]), args.iterations))
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_page(args):
+    """Первая отрисовка каталога: весь список против первой страницы с итогами"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'))
+        fill_catalog(db.db_path, args.parts)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        def first_page(i):
+            db.get_parts_page(limit=args.page_size)
+            db.get_parts_summary()
+
+        report("первая страница",
+               measure(lambda i: db.get_all_parts(), args.iterations),
+               measure(first_page, args.iterations))
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_import(args):
+    """Загрузка прайс-листа: add_part на каждую строку против import_parts"""
+    rows = [{'article': f"IMP{i:07d}", 'name': f"{NAMES[i % len(NAMES)]} {i}",
+             'brand': BRANDS[i % len(BRANDS)], 'car_model': f"Model {i % 500}",
+             'category': CATEGORIES[i % len(CATEGORIES)], 'quantity': i % 50,
+             'buy_price': 100.0, 'sell_price': 150.0}
+            for i in range(args.rows)]
+    timings = []
+    for use_import in (False, True):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'))
+            start = time.perf_counter()
+            if use_import:
+                db.import_parts(iter(rows))
+            else:
+                # add_part печатает только ошибки, поэтому вывод не мешает замеру
+                for row in rows:
+                    db.add_part(description="", **row)
+            timings.append((time.perf_counter() - start) * 1000)
+            db.close()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f"📦 Строк: {args.rows}")
+    report("импорт", *timings)
+
+
+def legacy_create_sale(db: SimpleDatabase, items):
+    """Прежняя реализация create_sale: SELECT, INSERT и UPDATE на каждую позицию"""
+    with db._connections.writer() as conn:
+        cursor = conn.cursor()
+        for item in items:
+            cursor.execute('SELECT quantity FROM parts WHERE id = ?', (item['part_id'],))
+            result = cursor.fetchone()
+            if not result or result[0] < item['quantity']:
+                raise ValueError(f"Недостаточно товара на складе (ID: {item['part_id']})")
+        total = sum(item['quantity'] * item['price'] for item in items)
+        cursor.execute('INSERT INTO sales (date, total) VALUES (?, ?)',
+                       (datetime.now().isoformat(), total))
+        sale_id = cursor.lastrowid
+        for item in items:
+            cursor.execute('INSERT INTO sale_items (sale_id, part_id, quantity, price) '
+                           'VALUES (?, ?, ?, ?)',
+                           (sale_id, item['part_id'], item['quantity'], item['price']))
+            cursor.execute('UPDATE parts SET quantity = quantity - ?, updated_at = ? WHERE id = ?',
+                           (item['quantity'], datetime.now().isoformat(), item['part_id']))
+    return True
+
+
+def bench_checkout(args):
+    """Задержка оформления продажи на 1, 20 и 200 позиций"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'), pragma_profile='fast')
+        fill_catalog(db.db_path, args.parts)
+        with sqlite3.connect(db.db_path) as conn:
+            conn.execute('UPDATE parts SET quantity = 1000000')
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        for lines in (1, 20, 200):
+            rnd = random.Random(lines)
+            sales = [[{'part_id': part_id, 'quantity': 1, 'price': 100.0}
+                      for part_id in rnd.sample(range(1, args.parts + 1), lines)]
+                     for _ in range(args.sales)]
+            report(f"{lines} поз.",
+                   measure(lambda i, sales=sales: legacy_create_sale(db, sales[i]), args.sales),
+                   measure(lambda i, sales=sales: db.checkout(sales[i]), args.sales))
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_records(args):
+    """Память и время загрузки каталога: словари против записей и колонок"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'))
+        fill_catalog(db.db_path, args.parts)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        def legacy_get_all_parts():
+            cursor = db._connections.reader().cursor()
+            cursor.execute('SELECT * FROM parts ORDER BY article')
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row, strict=True)) for row in cursor.fetchall()]
+
+        def stats_columns():
+            return db.get_parts_columns(('article', 'name', 'category', 'brand',
+                                         'quantity', 'buy_price', 'sell_price'))
+
+        for title, func in (("словари", legacy_get_all_parts),
+                            ("записи", db.get_all_parts),
+                            ("колонки статистики", stats_columns)):
+            # Время меряем без tracemalloc: он сильно замедляет выделения
+            elapsed = measure(lambda i, func=func: func(), args.iterations)
+            tracemalloc.start()
+            result = func()
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print(f"  {title:<20} {elapsed:9.1f} мс   {size / 1024 / 1024:8.1f} МБ")
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_cache(args):
+    """Повторные чтения статистики и поиска: без кэша против кэша"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(temp_dir, 'bench.db')
+        uncached = SimpleDatabase(db_path, cache_size=0)
+        fill_catalog(db_path, args.parts)
+        cached = SimpleDatabase(db_path)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        for title, call in (
+            ("сводка", lambda db, i: db.get_parts_summary()),
+            ("первая страница", lambda db, i: db.get_parts_page(limit=50)),
+            ("поиск", lambda db, i: db.search_parts("фильтр")),
+            ("по ID", lambda db, i: db.get_part_by_id(i % 100 + 1)),
+        ):
+            report(title,
+                   measure(lambda i, call=call: call(uncached, i), args.iterations),
+                   measure(lambda i, call=call: call(cached, i), args.iterations))
+
+        # Чтения после каждой записи - кэш только мешает
+        def write_then_read(db, i):
+            db.update_part(1, quantity=i % 50)
+            return db.get_parts_summary()
+
+        report("запись + чтение",
+               measure(lambda i: write_then_read(uncached, i), args.iterations),
+               measure(lambda i: write_then_read(cached, i), args.iterations))
+        print(f"  Кэш: {cached.cache_stats()}")
+
+        uncached.close()
+        cached.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_stats(args):
+    """Вкладка статистики: колонки всего каталога в Python против агрегатов SQL"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'), cache_size=0)
+        fill_catalog(db.db_path, args.parts)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        def legacy_statistics():
+            parts = db.get_parts_columns(('article', 'name', 'category', 'brand',
+                                          'quantity', 'buy_price', 'sell_price'))
+            groups = {}
+            for column in ('category', 'brand'):
+                stats = groups[column] = {}
+                for key, quantity, price in zip(parts[column], parts['quantity'],
+                                                parts['sell_price'], strict=True):
+                    group = stats.setdefault(key, [0, 0, 0])
+                    group[0] += 1
+                    group[1] += quantity
+                    group[2] += price * quantity
+            low_stock = [i for i, quantity in enumerate(parts['quantity'])
+                         if quantity <= LOW_STOCK_THRESHOLD]
+            low_stock.sort(key=lambda i: parts['quantity'][i])
+            return groups, low_stock[:20]
+
+        report("статистика",
+               measure(lambda i: legacy_statistics(), args.iterations),
+               measure(lambda i: db.get_statistics(), args.iterations))
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_money(args):
+    """Отчёт по позициям продаж: суммы REAL и Decimal против целых копеек"""
+    rnd = random.Random(7)
+    items = [(i // 5 + 1, rnd.randint(1, 5000), rnd.randint(1, 10), rnd.randint(100, 500000))
+             for i in range(args.items)]
+    report_sql = 'SELECT part_id, SUM(quantity * price) FROM sale_items GROUP BY part_id'
+    temp_dir = tempfile.mkdtemp()
+    connections = {}
+    try:
+        # Одни и те же позиции: цены в рублях (REAL, как до перехода) и в копейках
+        for kind, price_type, scale in (('real', 'REAL', 100), ('kopecks', 'INTEGER', 1)):
+            conn = sqlite3.connect(os.path.join(temp_dir, f'{kind}.db'))
+            conn.execute('CREATE TABLE sale_items (sale_id INTEGER, part_id INTEGER, '
+                         f'quantity INTEGER, price {price_type})')
+            conn.executemany('INSERT INTO sale_items VALUES (?, ?, ?, ?)',
+                             ((sale_id, part_id, quantity, price / scale)
+                              if scale != 1 else (sale_id, part_id, quantity, price)
+                              for sale_id, part_id, quantity, price in items))
+            conn.commit()
+            connections[kind] = conn
+        print(f"📦 Позиций продаж: {args.items}")
+
+        def decimal_report():
+            # Точно, но каждая цена проходит через Decimal в Python
+            totals = {}
+            for part_id, quantity, price in connections['real'].execute(
+                    'SELECT part_id, quantity, price FROM sale_items'):
+                totals[part_id] = totals.get(part_id, 0) + quantity * Decimal(str(price))
+            return totals
+
+        def real_report():
+            return dict(connections['real'].execute(report_sql))
+
+        def kopecks_report():
+            return {part_id: from_kopecks(total)
+                    for part_id, total in connections['kopecks'].execute(report_sql)}
+
+        kopecks_ms = measure(lambda i: kopecks_report(), args.iterations)
+        report("Decimal в Python", measure(lambda i: decimal_report(), args.iterations),
+               kopecks_ms)
+        report("REAL в SQL", measure(lambda i: real_report(), args.iterations), kopecks_ms)
+
+        exact = kopecks_report()
+        assert decimal_report() == exact
+        inexact = sum(Decimal(repr(total)) != exact[part_id]
+                      for part_id, total in real_report().items())
+        print(f"  Сумм REAL, не равных точной: {inexact} из {len(exact)}")
+    finally:
+        for conn in connections.values():
+            conn.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def current_rss_mb() -> float:
+    """Текущий размер резидентной памяти процесса (Linux), МБ"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        import resource
+        # На других системах - пиковое значение
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_table(args):
+    """Открытие таблицы запчастей: QTableWidget на весь каталог против модели"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtGui import QColor
+    from PySide6.QtWidgets import QApplication, QTableView, QTableWidget, QTableWidgetItem
+    from parts_table_model import PartsTableModel
+
+    app = QApplication.instance() or QApplication([])
+
+    def legacy_table(db):
+        # Прежний PartsWidget.load_parts: 10 элементов и подсветка на каждую строку
+        parts = db.get_all_parts()
+        table = QTableWidget()
+        table.setColumnCount(10)
+        table.setRowCount(len(parts))
+        for row, part in enumerate(parts):
+            items = [
+                QTableWidgetItem(str(part['id'])),
+                QTableWidgetItem(part['article']),
+                QTableWidgetItem(part['name']),
+                QTableWidgetItem(part['brand']),
+                QTableWidgetItem(part['car_model']),
+                QTableWidgetItem(part['category']),
+                QTableWidgetItem(str(part['quantity'])),
+                QTableWidgetItem(f"{float(part['buy_price']):.2f} ₽"),
+                QTableWidgetItem(f"{float(part['sell_price']):.2f} ₽"),
+                QTableWidgetItem(part['description'] or "")
+            ]
+            for col, item in enumerate(items):
+                table.setItem(row, col, item)
+            if part['quantity'] <= LOW_STOCK_THRESHOLD:
+                for col in range(len(items)):
+                    table.item(row, col).setBackground(QColor("#fff3cd"))
+        return table
+
+    def model_table(db):
+        table = QTableView()
+        model = PartsTableModel(db, args.page_size, table)
+        model.reload()
+        table.setModel(model)
+        return table
+
+    def show(table):
+        table.resize(1200, 800)
+        table.show()
+        app.processEvents()
+
+    for count in args.parts:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'), cache_size=0)
+            fill_catalog(db.db_path, count)
+            print(f"📦 Каталог: {count} запчастей")
+
+            variants = [("модель", model_table)]
+            if count <= args.legacy_limit:
+                variants.insert(0, ("QTableWidget", legacy_table))
+            for title, build in variants:
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                table = build(db)
+                show(table)
+                elapsed = (time.perf_counter() - start) * 1000
+                rss = current_rss_mb() - rss_before
+                print(f"  {title:<20} {elapsed:9.1f} мс   +{rss:8.1f} МБ RSS")
+                table.deleteLater()
+                del table
+                app.processEvents()
+
+            # Прокрутка модели до конца каталога - все строки в памяти
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            table = model_table(db)
+            show(table)
+            model = table.model()
+            while model.canFetchMore():
+                model.fetchMore()
+            table.scrollToBottom()
+            app.processEvents()
+            elapsed = (time.perf_counter() - start) * 1000
+            rss = current_rss_mb() - rss_before
+            print(f"  {'модель, весь каталог':<20} {elapsed:9.1f} мс   +{rss:8.1f} МБ RSS")
+            table.deleteLater()
+            del table, model
+            app.processEvents()
+
+            db.close()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_search(args):
+    """Задержка от ввода до показа результатов поиска в таблице запчастей"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication, QTableView
+    from parts_table_model import PartsTableModel
+
+    app = QApplication.instance() or QApplication([])
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # Без кэша: меряем сами запросы
+        db = SimpleDatabase(os.path.join(temp_dir, 'bench.db'), cache_size=0)
+        fill_catalog(db.db_path, args.parts)
+        print(f"📦 Каталог: {args.parts} запчастей")
+
+        table = QTableView()
+        model = PartsTableModel(db, args.page_size, table)
+        table.setModel(model)
+        table.resize(1200, 800)
+        table.show()
+        model.reload()
+        app.processEvents()
+
+        # Прежний filter_parts: перебор текста всех ячеек (без вызовов Qt)
+        all_rows = [[str(value).lower() for value in part.values()[:10]]
+                    for part in db.get_all_parts()]
+
+        def legacy_filter(text):
+            text = text.lower()
+            return sum(1 for row in all_rows if any(text in cell for cell in row))
+
+        for word in args.words:
+            print(f"  Ввод {word!r}:")
+            visible_total = 0.0
+            for end in range(1, len(word) + 1):
+                text = word[:end]
+                filters = {'query': text}
+                start = time.perf_counter()
+                model.reload(filters=filters)
+                app.processEvents()
+                visible = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+                db.get_parts_summary(filters)
+                summary = (time.perf_counter() - start) * 1000
+                start = time.perf_counter()
+                legacy_filter(text)
+                legacy = (time.perf_counter() - start) * 1000
+                visible_total += visible
+                print(f"    {text!r:<14} показ: {visible:7.1f} мс   сводка: {summary:7.1f} мс   "
+                      f"перебор строк: {legacy:7.1f} мс")
+            print(f"    Без задержки запросов: {len(word)}, {visible_total:.1f} мс; "
+                  f"с задержкой ввода: 1, {visible:.1f} мс")
+
+        db.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    """Главная функция"""
+    parser = argparse.ArgumentParser(description="Бенчмарки базы данных AutoParts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    connections = subparsers.add_parser(
+        "connections", help="менеджер соединений против соединения на вызов")
+    connections.add_argument("--parts", type=int, default=100_000)
+    connections.add_argument("--iterations", type=int, default=2000)
+    connections.set_defaults(func=bench_connections)
+
+    pragmas = subparsers.add_parser(
+        "pragmas", help="продажи/с и задержка чтения для профилей PRAGMA")
+    pragmas.add_argument("--parts", type=int, default=10_000)
+    pragmas.add_argument("--sales", type=int, default=2000)
+    pragmas.set_defaults(func=bench_pragmas)
+
+    article = subparsers.add_parser(
+        "article", help="поиск по артикулу: LIKE против индекса article_key")
+    article.add_argument("--parts", type=int, default=100_000)
+    article.add_argument("--iterations", type=int, default=2000)
+    article.set_defaults(func=bench_article)
+
+    page = subparsers.add_parser(
+        "page", help="get_all_parts против get_parts_page")
+    page.add_argument("--parts", type=int, default=100_000)
+    page.add_argument("--page-size", type=int, default=50)
+    page.add_argument("--iterations", type=int, default=5)
+    page.set_defaults(func=bench_page)
+
+    import_parser = subparsers.add_parser(
+        "import", help="add_part построчно против import_parts")
+    import_parser.add_argument("--rows", type=int, default=20_000)
+    import_parser.set_defaults(func=bench_import)
+
+    checkout = subparsers.add_parser(
+        "checkout", help="create_sale построчно против checkout")
+    checkout.add_argument("--parts", type=int, default=10_000)
+    checkout.add_argument("--sales", type=int, default=300)
+    checkout.set_defaults(func=bench_checkout)
+
+    records = subparsers.add_parser(
+        "records", help="память: словари против записей и колонок")
+    records.add_argument("--parts", type=int, default=100_000)
+    records.add_argument("--iterations", type=int, default=3)
+    records.set_defaults(func=bench_records)
+
+    cache = subparsers.add_parser(
+        "cache", help="повторные чтения без кэша и с кэшем")
+    cache.add_argument("--parts", type=int, default=100_000)
+    cache.add_argument("--iterations", type=int, default=50)
+    cache.set_defaults(func=bench_cache)
+
+    table = subparsers.add_parser(
+        "table", help="таблица запчастей: QTableWidget против модели")
+    table.add_argument("--parts", type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    table.add_argument("--page-size", type=int, default=50)
+    table.add_argument("--legacy-limit", type=int, default=500_000,
+                       help="не строить QTableWidget для каталогов больше")
+    table.set_defaults(func=bench_table)
+
+    search = subparsers.add_parser(
+        "search", help="задержка поиска от ввода до показа")
+    search.add_argument("--parts", type=int, default=100_000)
+    search.add_argument("--page-size", type=int, default=50)
+    search.add_argument("--words", nargs='+', default=["масляный", "toyota", "ART00012"])
+    search.set_defaults(func=bench_search)
+
+    stats = subparsers.add_parser(
+        "stats", help="статистика: подсчёт в Python против агрегатов SQL")
+    stats.add_argument("--parts", type=int, default=100_000)
+    stats.add_argument("--iterations", type=int, default=10)
+    stats.set_defaults(func=bench_stats)
+
+    money = subparsers.add_parser(
+        "money", help="отчёт продаж: REAL и Decimal против копеек")
+    money.add_argument("--items", type=int, default=1_000_000)
+    money.add_argument("--iterations", type=int, default=3)
+    money.set_defaults(func=bench_money)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
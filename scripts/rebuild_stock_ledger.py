@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Восстановление журнала движения остатков и месячных снимков
+
+Журнал stock_movements заполняется заново по продажам и поступлениям;
+остаток, который ими не объясняется (данные до ведения журнала, ручные
+правки), записывается начальным остатком на дату создания запчасти.
+
+Запуск:
+    python scripts/rebuild_stock_ledger.py [путь к базе]
+"""
+
+import os
+import shutil
+import sys
+from datetime import datetime
+
+# Добавляем путь к src для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database_simple import SimpleDatabase, get_data_dir
+
+
+def rebuild(db_path: str) -> bool:
+    """Восстановить журнал остатков базы db_path (с резервной копией)"""
+    if not os.path.exists(db_path):
+        print(f"❌ База данных не найдена: {db_path}")
+        return False
+
+    backup_path = f'{db_path}.before_ledger_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+    shutil.copy2(db_path, backup_path)
+    print(f"✅ Создана резервная копия: {backup_path}")
+
+    db = SimpleDatabase(db_path)
+    try:
+        movements = db.rebuild_stock_ledger()
+        if movements < 0:
+            return False
+
+        mismatched = db.check_stock_ledger()
+        print(f"📊 Записано движений: {movements}")
+        if mismatched:
+            print(f"⚠️ Запчастей с остатком, не равным журналу: {len(mismatched)}")
+            for problem in mismatched:
+                print(f"   {problem}")
+            return False
+        return True
+    finally:
+        db.close()
+
+
+def main():
+    """Главная функция"""
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(get_data_dir(), 'autoparts.db')
+    print(f"🔄 Восстановление журнала остатков: {db_path}")
+
+    if rebuild(db_path):
+        print("✅ Журнал остатков восстановлен")
+    else:
+        print("❌ Восстановить журнал остатков не удалось")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Автообновление открытых представлений при изменении базы данных
+
+AutoRefresher раз в auto_refresh_interval секунд сравнивает PRAGMA
+data_version с прежним значением. Проверка не читает таблицы, поэтому
+на простаивающей базе ничего не стоит. Если версия изменилась (запись
+этим или другим процессом), из журнала part_changes в фоне читаются id
+запчастей, изменённых после прошлой отметки, и отправляются сигналом
+parts_changed. Представления перечитывают только эти строки.
+"""
+
+from typing import Optional
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from db_worker import get_db_worker
+
+
+class AutoRefresher(QObject):
+    """Опрос базы данных на изменения"""
+
+    # Список id изменённых запчастей или None, если изменений слишком
+    # много и представлению лучше перезагрузиться целиком
+    parts_changed = Signal(object)
+
+    def __init__(self, database, interval: int, parent=None, worker=None):
+        super().__init__(parent)
+        self.db = database
+        self.worker = worker or get_db_worker()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.task = None
+        self.data_version: Optional[int] = None
+        self.mark: Optional[int] = None
+        self.set_interval(interval)
+
+    def set_interval(self, interval: int):
+        """Интервал опроса в секундах (0 - автообновление выключено)"""
+        # QSettings в ini-файле возвращает строку
+        interval = int(interval)
+        if interval <= 0:
+            self.timer.stop()
+            return
+        if self.mark is None:
+            # Отсчёт изменений - с момента включения
+            self.data_version = self.db.data_version()
+            self.mark = self.db.get_change_mark()
+        self.timer.start(interval * 1000)
+
+    def check(self):
+        """Проверить, менялась ли база, и прочитать изменения"""
+        if self.task is not None:
+            return
+        data_version = self.db.data_version()
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+
+        self.task = self.worker.submit(self.db.get_part_changes, self.mark)
+        self.task.finished.connect(self.on_changes_loaded)
+        self.task.failed.connect(self.on_changes_failed)
+
+    def on_changes_loaded(self, changes):
+        self.task = None
+        self.mark = changes['mark']
+        if changes['part_ids'] != []:
+            self.parts_changed.emit(changes['part_ids'])
+
+    def on_changes_failed(self, message):
+        self.task = None
+        # Повторим при следующей проверке
+        self.data_version = None
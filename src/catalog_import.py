@@ -0,0 +1,164 @@
+"""
+Чтение каталогов поставщиков (CSV, XLSX) для массового импорта запчастей
+
+Файлы читаются потоково: строки отдаются по одной в виде словарей с
+каноническими ключами (article, name, ...), поэтому прайс-лист на сотни
+тысяч позиций не загружается в память целиком. Запись в базу выполняет
+SimpleDatabase.import_parts().
+"""
+
+import csv
+import os
+from typing import Any, Dict, Iterator, Optional
+
+# Колонки parts, которые можно загрузить из файла
+IMPORT_FIELDS = ('article', 'name', 'brand', 'car_model', 'category',
+                 'quantity', 'buy_price', 'sell_price', 'description')
+
+# Заголовки колонок в файлах поставщиков (сравниваются без учёта регистра)
+HEADER_ALIASES = {
+    'article': 'article', 'артикул': 'article', 'код': 'article',
+    'name': 'name', 'наименование': 'name', 'название': 'name',
+    'brand': 'brand', 'марка': 'brand',
+    'car_model': 'car_model', 'модель': 'car_model',
+    'category': 'category', 'категория': 'category',
+    'quantity': 'quantity', 'количество': 'quantity', 'кол-во': 'quantity', 'остаток': 'quantity',
+    'buy_price': 'buy_price', 'закупочная цена': 'buy_price', 'закуп. цена': 'buy_price',
+    'sell_price': 'sell_price', 'розничная цена': 'sell_price', 'розн. цена': 'sell_price',
+    'цена': 'sell_price',
+    'description': 'description', 'описание': 'description',
+}
+
+# Значения по умолчанию - как в диалоге добавления запчасти
+DEFAULT_BRAND = "Универсальная"
+DEFAULT_CATEGORY = "Прочее"
+
+
+def _map_header(header) -> Dict[int, str]:
+    """Номер колонки -> поле parts; неизвестные колонки пропускаются"""
+    mapping = {}
+    for index, title in enumerate(header):
+        field = HEADER_ALIASES.get(str(title or '').strip().lower())
+        if field and field not in mapping.values():
+            mapping[index] = field
+    if 'article' not in mapping.values():
+        raise ValueError("В файле нет колонки с артикулом")
+    return mapping
+
+
+def _parse_number(value: Any, field: str) -> float:
+    """Число из ячейки: допускаются пробелы между разрядами и запятая"""
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).replace('\xa0', '').replace(' ', '').replace(',', '.')
+    try:
+        return float(text)
+    except ValueError as e:
+        raise ValueError(f"{field}: не число ({value!r})") from e
+
+
+def prepare_part_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Проверить строку каталога и привести значения к типам parts.
+    Отсутствующие необязательные поля не добавляются - при обновлении
+    существующей запчасти они остаются прежними.
+    """
+    article = str(row.get('article') or '').strip()
+    name = str(row.get('name') or '').strip()
+    if not article:
+        raise ValueError("пустой артикул")
+
+    prepared = {'article': article}
+    if name:
+        prepared['name'] = name
+
+    for field in ('brand', 'car_model', 'category', 'description'):
+        value = row.get(field)
+        if value is not None and str(value).strip():
+            prepared[field] = str(value).strip()
+
+    if row.get('quantity') not in (None, ''):
+        quantity = _parse_number(row['quantity'], 'количество')
+        if quantity < 0 or quantity != int(quantity):
+            raise ValueError(f"количество: ожидается целое неотрицательное ({row['quantity']!r})")
+        prepared['quantity'] = int(quantity)
+
+    for field, title in (('buy_price', 'закупочная цена'), ('sell_price', 'розничная цена')):
+        if row.get(field) not in (None, ''):
+            price = _parse_number(row[field], title)
+            if price < 0:
+                raise ValueError(f"{title}: отрицательное значение")
+            prepared[field] = float(price)
+
+    return prepared
+
+
+def _sniff_dialect(sample: str):
+    """Разделитель CSV: Excel в русской локали сохраняет через ';'"""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        return csv.excel
+
+
+def read_catalog_csv(path: str) -> Iterator[Dict[str, Any]]:
+    """Построчно прочитать CSV (UTF-8, с BOM или без)"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        dialect = _sniff_dialect(f.read(64 * 1024))
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        mapping = _map_header(next(reader, []))
+        for values in reader:
+            if not any(values):
+                continue
+            yield {field: values[index] for index, field in mapping.items()
+                   if index < len(values)}
+
+
+def read_catalog_xlsx(path: str) -> Iterator[Dict[str, Any]]:
+    """Построчно прочитать первый лист XLSX (нужен пакет openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ImportError("Для импорта XLSX установите пакет openpyxl") from e
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        mapping = _map_header(next(rows, ()))
+        for values in rows:
+            if not any(value not in (None, '') for value in values):
+                continue
+            yield {field: values[index] for index, field in mapping.items()
+                   if index < len(values)}
+    finally:
+        workbook.close()
+
+
+def read_catalog(path: str) -> Iterator[Dict[str, Any]]:
+    """Прочитать каталог, формат определяется по расширению файла"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        return read_catalog_xlsx(path)
+    if extension in ('.csv', '.txt'):
+        return read_catalog_csv(path)
+    raise ValueError(f"Неподдерживаемый формат каталога: {extension}")
+
+
+def count_catalog_rows(path: str) -> Optional[int]:
+    """Примерное число строк данных (для индикатора прогресса)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            return None
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+            return max_row - 1 if max_row else None
+        finally:
+            workbook.close()
+
+    with open(path, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
@@ -0,0 +1,41 @@
+"""
+Журнал изменений каталога для автообновления
+
+part_changes хранит для каждой когда-либо изменённой запчасти номер
+последнего изменения (seq). Триггеры на parts при вставке, изменении и
+удалении присваивают строке следующий номер, поэтому журнал не растёт
+быстрее каталога, а «что изменилось после отметки N» - это выборка по
+индексу seq > N. Отметка журнала - максимальный seq.
+"""
+
+import sqlite3
+
+# Колонки, изменение которых видно пользователю (служебные *_cf и
+# article_key, которые заполняют другие триггеры, не учитываются)
+TRACKED_COLUMNS = ('article', 'name', 'brand', 'car_model', 'category', 'quantity',
+                   'buy_price', 'sell_price', 'description', 'updated_at')
+
+
+def create_part_change_log(cursor: sqlite3.Cursor):
+    """Создать журнал изменений parts и триггеры, которые его ведут"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS part_changes (
+        part_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_part_changes_seq ON part_changes (seq)')
+
+    # UPSERT, а не INSERT OR REPLACE: режим конфликта внешней команды
+    # (например, ON CONFLICT импорта) переопределил бы OR REPLACE триггера
+
+    for name, event, row in (('ai', 'INSERT', 'new'),
+                             ('au', f"UPDATE OF {', '.join(TRACKED_COLUMNS)}", 'new'),
+                             ('ad', 'DELETE', 'old')):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS part_changes_{name} AFTER {event} ON parts BEGIN
+            INSERT INTO part_changes (part_id, seq)
+            VALUES ({row}.id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM part_changes))
+            ON CONFLICT (part_id) DO UPDATE SET seq = excluded.seq;
+        END
+        ''')
@@ -1,9 +1,11 @@
+from search_index import casefold_text
+
 def search_part_by_name(name_query):
     """Поиск запчастей по частичному совпадению наименования (регистронезависимый)."""
     with get_connection() as conn:
         cursor = conn.cursor()
-        # Используем LOWER() для регистронезависимого поиска
-        cursor.execute("SELECT id, article, name, quantity, price FROM parts WHERE LOWER(name) LIKE LOWER(?)", ('%' + name_query + '%',))
+        # LOWER() SQLite понимает только ASCII - сравниваем с колонкой name_cf
+        cursor.execute("SELECT id, article, name, quantity, price FROM parts WHERE instr(name_cf, ?) > 0", (casefold_text(name_query),))
         parts = cursor.fetchall()
         return [dict(row) for row in parts]
 
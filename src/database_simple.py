@@ -1,31 +1,267 @@
+import atexit
 import sqlite3
 import os
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, Callable, Iterable, List, Dict, Optional, Sequence, Tuple
+
+from catalog_import import DEFAULT_BRAND, DEFAULT_CATEGORY, IMPORT_FIELDS, prepare_part_row
+from db_migrations import MigrationError, apply_migrations
+from db_records import Record, fetch_columns, fetch_record, fetch_records
+from inventory_summary import (LOW_STOCK_THRESHOLD, SUMMARY_GROUPS, check_inventory_summary,
+                               rebuild_inventory_summary)
+from money import MONEY_COLUMNS, from_kopecks, money_params, to_kopecks
+from query_cache import DEFAULT_CACHE_SIZE, QueryCache, cached_read
+from search_index import (FTS_RANK, build_fts_query, casefold_text, has_parts_fts,
+                          normalize_article, prefix_upper_bound, register_search_functions)
+from sqlite_pragmas import apply_pragmas, get_pragmas
+from stock_ledger import (movement_source, rebuild_stock_ledger, stock_as_of,
+                          take_stock_snapshots)
+
+# Размер кэша подготовленных выражений на одно соединение
+STATEMENT_CACHE_SIZE = 256
+
+# Поиск по префиксу артикула включается с этой длины нормализованного запроса
+MIN_ARTICLE_PREFIX = 3
+
+# С этого числа найденных строк страница поиска выбирается по индексу сортировки
+BROAD_SEARCH_ROWS = 2000
+
+# Изменённых запчастей, которые автообновление применяет построчно;
+# при большем числе изменений представления перезагружаются целиком
+CHANGES_LIMIT = 500
+
+# Строк каталога в одной транзакции при массовом импорте
+IMPORT_CHUNK_SIZE = 1000
+
+# Колонки запчасти, которые возвращают методы чтения (служебные *_cf
+# и article_key в записи не попадают)
+PART_COLUMNS = ('id', 'article', 'name', 'brand', 'car_model', 'category', 'quantity',
+                'buy_price', 'sell_price', 'description', 'created_at', 'updated_at')
+_PART_SELECT = ', '.join(PART_COLUMNS)
+_PART_SELECT_P = ', '.join(f'p.{column}' for column in PART_COLUMNS)
+
+# Колонки, по которым допускается постраничная сортировка (все NOT NULL,
+# поэтому пара (значение, id) однозначно задаёт позицию строки)
+PAGE_ORDER_COLUMNS = ('article', 'name', 'brand', 'car_model', 'category',
+                      'quantity', 'buy_price', 'sell_price', 'id')
+
+# Колонки с собственным индексом: по ним страницу широкого поиска можно
+# выбирать обходом индекса (см. SimpleDatabase._is_broad_search)
+ORDERED_SCAN_COLUMNS = ('article', 'name', 'quantity', 'sell_price', 'id')
+
+# Подстрока в любом из полей без учёта регистра (если FTS5 недоступен).
+# Индексы здесь не помогают: подстрока ищется сканированием, но без вызова
+# функций Python - артикул сравнивается по article_key (без разделителей)
+_SCAN_CONDITION = '''(instr(article_key, :key) > 0
+   OR instr(name_cf, :q) > 0
+   OR instr(brand_cf, :q) > 0
+   OR instr(car_model_cf, :q) > 0
+   OR instr(category_cf, :q) > 0)'''
+
+
+def get_data_dir() -> str:
+    """Возвращает путь к директории данных приложения"""
+    if os.name == 'nt':  # Windows
+        data_dir = os.path.join(os.environ.get('APPDATA', ''), 'AutoParts')
+    else:
+        data_dir = os.path.join(os.path.expanduser('~'), '.autoparts')
+    
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    
+    return data_dir
+
+
+def _scan_params(query: str) -> Dict[str, Optional[str]]:
+    """Параметры _SCAN_CONDITION: текст в регистре *_cf и ключ артикула"""
+    # Запрос из одних разделителей не совпадает с каждым артикулом
+    return {'q': casefold_text(query), 'key': normalize_article(query) or None}
+
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения с SQLite.
+    
+    Для чтения каждый поток получает своё соединение, которое живёт до
+    закрытия менеджера, поэтому кэш страниц и кэш подготовленных выражений
+    переиспользуются между вызовами. Все записи идут через одно выделенное
+    соединение под блокировкой. К каждому соединению применяется профиль PRAGMA.
+    """
+    
+    def __init__(self, db_path: str, pragmas: Optional[List[Tuple[str, Any]]] = None):
+        self.db_path = db_path
+        self.pragmas = pragmas if pragmas is not None else get_pragmas()
+        self._local = threading.local()
+        self._registry_lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._monitor_lock = threading.Lock()
+        self._monitor: Optional[sqlite3.Connection] = None
+        self._closed = False
+        # Увеличивается после каждой успешной записи через writer()
+        self.write_generation = 0
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть новое соединение и зарегистрировать его для закрытия"""
+        # check_same_thread=False нужен только для закрытия из другого потока:
+        # читающее соединение используется лишь тем потоком, который его создал
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        try:
+            apply_pragmas(conn, self.pragmas)
+            register_search_functions(conn)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        with self._registry_lock:
+            if self._closed:
+                conn.close()
+                raise sqlite3.ProgrammingError("Менеджер соединений закрыт")
+            self._connections.append(conn)
+        return conn
+    
+    def reader(self) -> sqlite3.Connection:
+        """Соединение для чтения, закреплённое за текущим потоком"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    @contextmanager
+    def writer(self):
+        """
+        Выделенное соединение для записи.
+        Блок выполняется в одной транзакции: commit при успехе,
+        rollback при исключении.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self.write_generation += 1
+    
+    def data_version(self) -> int:
+        """
+        PRAGMA data_version отдельного соединения: меняется после любого
+        commit другого соединения, в том числе из другого процесса
+        """
+        with self._monitor_lock:
+            if self._monitor is None:
+                self._monitor = self._connect()
+            return self._monitor.execute('PRAGMA data_version').fetchone()[0]
+    
+    def close(self):
+        """Закрыть все открытые соединения"""
+        with self._write_lock, self._registry_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+            self._writer = None
+            self._monitor = None
+            self._closed = True
+        # Соединение текущего потока больше не действительно
+        self._local = threading.local()
+
+
+class _SaleRejected(Exception):
+    """Продажа отклонена: откатить транзакцию и вернуть ошибки позиций"""
+
+
+def _import_error_message(error: sqlite3.IntegrityError) -> str:
+    """Понятное описание ошибки записи строки каталога"""
+    message = str(error)
+    if 'parts.article_key' in message:
+        return "артикул совпадает с существующим с точностью до разделителей"
+    return message
+
 
 class SimpleDatabase:
     """Простая работа с базой данных SQLite"""
     
-    def __init__(self):
-        # Создаём папку для данных
-        if os.name == 'nt':  # Windows
-            data_dir = os.path.join(os.environ.get('APPDATA', ''), 'AutoParts')
-        else:
-            data_dir = os.path.join(os.path.expanduser('~'), '.autoparts')
-        
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-        
-        self.db_path = os.path.join(data_dir, 'autoparts.db')
+    def __init__(self, db_path: Optional[str] = None, pragma_profile: Optional[str] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self._connections: Optional[ConnectionManager] = None
+        self._fts_enabled = False
+        self._pragmas = get_pragmas(pragma_profile)
+        # Месяц, на начало которого снимки остатков уже сняты (_take_due_snapshots)
+        self._snapshot_month: Optional[date] = None
+        # Кэш чтений; сбрасывается при любой записи в базу
+        self._cache = QueryCache(self._data_version, cache_size)
+        self.db_path = db_path or os.path.join(get_data_dir(), 'autoparts.db')
         self.init_database()
     
+    @property
+    def db_path(self) -> str:
+        """Путь к файлу базы данных"""
+        return self._db_path
+    
+    @db_path.setter
+    def db_path(self, value: str):
+        # При смене файла БД старые соединения закрываются
+        if self._connections is not None:
+            self._connections.close()
+        self._db_path = value
+        self._connections = ConnectionManager(value, self._pragmas)
+        self._cache.clear()
+        self._snapshot_month = None
+    
+    def _take_due_snapshots(self, cursor: sqlite3.Cursor):
+        """
+        Снять снимки остатков, если с прошлой проверки начался новый месяц
+        (в транзакции записи). Приложение может работать без перезапуска
+        через границу месяца, поэтому проверка идёт при записи документов,
+        а в остальных случаях стоит одного сравнения дат.
+        """
+        month = date.today().replace(day=1)
+        if month != self._snapshot_month:
+            take_stock_snapshots(cursor, month)
+            self._snapshot_month = month
+    
+    def _data_version(self) -> Tuple[int, int]:
+        """Версия данных для кэша: записи этого процесса и data_version"""
+        connections = self._connections
+        return connections.write_generation, connections.data_version()
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """Попадания, промахи и сбросы кэша чтений"""
+        return self._cache.stats()
+    
+    def set_pragma_profile(self, profile: str):
+        """Сменить профиль PRAGMA ('safe' или 'fast') для всех соединений"""
+        self._pragmas = get_pragmas(profile)
+        self.close()
+    
+    def close(self):
+        """Закрыть все соединения с базой данных"""
+        if self._connections is not None:
+            self._connections.close()
+            self._connections = ConnectionManager(self._db_path, self._pragmas)
+            self._cache.clear()
+    
     def init_database(self):
         """Инициализация базы данных и создание таблиц"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.writer() as conn:
                 cursor = conn.cursor()
                 
-                # Таблица запчастей
+                # Таблица запчастей (денежные суммы во всех таблицах - целые копейки, см. money)
                 cursor.execute('''
                 CREATE TABLE IF NOT EXISTS parts (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,8 +271,8 @@ class SimpleDatabase:
                     car_model TEXT NOT NULL,
                     category TEXT NOT NULL,
                     quantity INTEGER NOT NULL DEFAULT 0,
-                    buy_price REAL NOT NULL,
-                    sell_price REAL NOT NULL,
+                    buy_price INTEGER NOT NULL,
+                    sell_price INTEGER NOT NULL,
                     description TEXT,
                     created_at TEXT NOT NULL,
                     updated_at TEXT NOT NULL
@@ -48,7 +284,7 @@ class SimpleDatabase:
                 CREATE TABLE IF NOT EXISTS sales (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     date TEXT NOT NULL,
-                    total REAL NOT NULL
+                    total INTEGER NOT NULL
                 )
                 ''')
                 
@@ -57,11 +293,11 @@ class SimpleDatabase:
                 CREATE TABLE IF NOT EXISTS sale_items (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     sale_id INTEGER NOT NULL,
-                    part_id INTEGER NOT NULL,
+                    part_id INTEGER,
                     quantity INTEGER NOT NULL,
-                    price REAL NOT NULL,
+                    price INTEGER NOT NULL,
                     FOREIGN KEY (sale_id) REFERENCES sales (id),
-                    FOREIGN KEY (part_id) REFERENCES parts (id)
+                    FOREIGN KEY (part_id) REFERENCES parts (id) ON DELETE RESTRICT
                 )
                 ''')
                 
@@ -71,7 +307,7 @@ class SimpleDatabase:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     date TEXT NOT NULL,
                     supplier TEXT NOT NULL,
-                    total REAL NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
                     notes TEXT
                 )
                 ''')
@@ -81,17 +317,28 @@ class SimpleDatabase:
                 CREATE TABLE IF NOT EXISTS receipt_items (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     receipt_id INTEGER NOT NULL,
-                    part_id INTEGER NOT NULL,
+                    part_id INTEGER,
                     quantity INTEGER NOT NULL,
-                    buy_price REAL NOT NULL,
+                    buy_price INTEGER NOT NULL,
                     FOREIGN KEY (receipt_id) REFERENCES receipts (id),
-                    FOREIGN KEY (part_id) REFERENCES parts (id)
+                    FOREIGN KEY (part_id) REFERENCES parts (id) ON DELETE RESTRICT
                 )
                 ''')
                 
-                conn.commit()
+                # Индексы и прочие изменения схемы (по PRAGMA user_version)
+                apply_migrations(conn)
+                self._fts_enabled = has_parts_fts(conn)
+                
+                # Снимки остатков за месяцы, начавшиеся после прошлого запуска
+                self._take_due_snapshots(cursor)
+                
                 print(f"✅ База данных инициализирована: {self.db_path}")
                 
+        except MigrationError as e:
+            # Запросы рассчитаны на актуальную схему: без миграции не запускаемся
+            print(f"❌ Ошибка обновления БД: {e}")
+            self.close()
+            raise
         except Exception as e:
             print(f"❌ Ошибка инициализации БД: {e}")
     
@@ -99,73 +346,744 @@ class SimpleDatabase:
                  category: str, quantity: int, buy_price: float, 
                  sell_price: float, description: str = "") -> bool:
         """Добавить запчасть"""
+        return self.add_part_record(article, name, brand, car_model, category, quantity,
+                                    buy_price, sell_price, description) is not None
+    
+    def add_part_record(self, article: str, name: str, brand: str, car_model: str,
+                        category: str, quantity: int, buy_price: float,
+                        sell_price: float, description: str = "") -> Optional[Record]:
+        """Добавить запчасть и вернуть её запись (None при ошибке)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.writer() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().isoformat()
                 
-                cursor.execute('''
+                cursor.execute(f'''
                 INSERT INTO parts (article, name, brand, car_model, category, 
                                  quantity, buy_price, sell_price, description, 
                                  created_at, updated_at)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING {_PART_SELECT}
                 ''', (article, name, brand, car_model, category, quantity, 
-                      buy_price, sell_price, description, now, now))
+                      to_kopecks(buy_price), to_kopecks(sell_price), description, now, now))
                 
-                conn.commit()
-                return True
+                return fetch_record(cursor, 'PartRecord')
                 
         except sqlite3.IntegrityError:
             print(f"❌ Запчасть с артикулом {article} уже существует")
-            return False
+            return None
         except Exception as e:
             print(f"❌ Ошибка добавления запчасти: {e}")
-            return False
+            return None
     
-    def get_all_parts(self) -> List[Dict]:
-        """Получить все запчасти"""
+    def import_parts(self, rows: Iterable[Dict], on_conflict: str = 'update',
+                     chunk_size: int = IMPORT_CHUNK_SIZE,
+                     progress: Optional[Callable[[int], Any]] = None) -> Dict:
+        """
+        Массовый импорт запчастей (строки - словари, см. catalog_import).
+        
+        on_conflict: 'update' - у существующего артикула обновляются поля,
+        заданные в строке; 'skip' - существующие артикулы не трогаются.
+        Строки пишутся пачками по chunk_size через executemany, каждая пачка -
+        одна транзакция. progress(обработано строк) вызывается после каждой
+        пачки; если он вернёт False, импорт прерывается (записанные пачки
+        остаются в базе).
+        
+        Возвращает {'inserted', 'updated', 'skipped', 'errors', 'cancelled'},
+        где errors - список (номер строки, описание ошибки).
+        """
+        if on_conflict == 'update':
+            # Поле, которого нет в строке (None), сохраняет прежнее значение
+            conflict_action = '''DO UPDATE SET
+                name = COALESCE(:name, name),
+                brand = COALESCE(:brand, brand),
+                car_model = COALESCE(:car_model, car_model),
+                category = COALESCE(:category, category),
+                quantity = COALESCE(:quantity, quantity),
+                buy_price = COALESCE(:buy_price, buy_price),
+                sell_price = COALESCE(:sell_price, sell_price),
+                description = COALESCE(:description, description),
+                updated_at = :now'''
+        elif on_conflict == 'skip':
+            conflict_action = 'DO NOTHING'
+        else:
+            raise ValueError(f"Неизвестный режим on_conflict: {on_conflict}")
+        
+        sql = f'''
+        INSERT INTO parts (article, name, brand, car_model, category,
+                           quantity, buy_price, sell_price, description,
+                           created_at, updated_at)
+        VALUES (:article, COALESCE(:name, ''),
+                COALESCE(:brand, '{DEFAULT_BRAND}'),
+                COALESCE(:car_model, '{DEFAULT_BRAND}'),
+                COALESCE(:category, '{DEFAULT_CATEGORY}'),
+                COALESCE(:quantity, 0),
+                COALESCE(:buy_price, 0),
+                COALESCE(:sell_price, :buy_price, 0),
+                COALESCE(:description, ''),
+                :now, :now)
+        ON CONFLICT(article) {conflict_action}
+        '''
+        
+        result = {'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': [], 'cancelled': False}
+        chunk = []
+        processed = 0
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM parts ORDER BY article')
+            for processed, row in enumerate(rows, 1):
+                try:
+                    prepared = prepare_part_row(row)
+                except ValueError as e:
+                    result['errors'].append((processed, str(e)))
+                    continue
                 
-                columns = [desc[0] for desc in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+                chunk.append((processed, money_params(
+                    {field: prepared.get(field) for field in IMPORT_FIELDS})))
+                if len(chunk) >= chunk_size:
+                    self._import_chunk(sql, chunk, result)
+                    chunk = []
+                    if progress is not None and progress(processed) is False:
+                        result['cancelled'] = True
+                        break
+            
+            if chunk and not result['cancelled']:
+                self._import_chunk(sql, chunk, result)
+            if progress is not None and not result['cancelled']:
+                progress(processed)
                 
+        except Exception as e:
+            print(f"❌ Ошибка импорта запчастей: {e}")
+            result['errors'].append((processed, str(e)))
+        
+        result['errors'].sort(key=lambda error: error[0])
+        print(f"📥 Импорт: добавлено {result['inserted']}, обновлено {result['updated']}, "
+              f"пропущено {result['skipped']}, ошибок {len(result['errors'])}")
+        return result
+    
+    def _import_chunk(self, sql: str, chunk: List[Tuple[int, Dict]], result: Dict):
+        """Записать пачку строк импорта одной транзакцией"""
+        now = datetime.now().isoformat()
+        for _, params in chunk:
+            params['now'] = now
+        failed = 0
+        
+        with self._connections.writer() as conn, \
+                movement_source(conn.cursor(), 'import', at=now):
+            cursor = conn.cursor()
+            
+            # Строка без наименования может только обновить существующую запчасть
+            nameless = {params['article'] for _, params in chunk if params['name'] is None}
+            if nameless:
+                known = {params['article'] for _, params in chunk if params['name'] is not None}
+                known.update(self._existing_articles(cursor, nameless))
+                rows = []
+                for number, params in chunk:
+                    if params['name'] is None and params['article'] not in known:
+                        result['errors'].append((number, "не указано наименование"))
+                    else:
+                        rows.append((number, params))
+                chunk = rows
+            
+            # AUTOINCREMENT: новые строки получают id больше текущего максимума
+            last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM parts').fetchone()[0]
+            
+            cursor.execute('SAVEPOINT import_chunk')
+            try:
+                cursor.executemany(sql, [params for _, params in chunk])
+                changed = cursor.rowcount
+                cursor.execute('RELEASE import_chunk')
+            except sqlite3.IntegrityError:
+                # В пачке есть ошибочная строка - пишем построчно, чтобы
+                # сохранить остальные и указать номер ошибочной
+                cursor.execute('ROLLBACK TO import_chunk')
+                cursor.execute('RELEASE import_chunk')
+                changed = 0
+                for number, params in chunk:
+                    cursor.execute('SAVEPOINT import_row')
+                    try:
+                        cursor.execute(sql, params)
+                        changed += cursor.rowcount
+                    except sqlite3.IntegrityError as e:
+                        cursor.execute('ROLLBACK TO import_row')
+                        result['errors'].append((number, _import_error_message(e)))
+                        failed += 1
+                    cursor.execute('RELEASE import_row')
+            
+            inserted = cursor.execute(
+                'SELECT COUNT(*) FROM parts WHERE id > ?', (last_id,)
+            ).fetchone()[0]
+        
+        result['inserted'] += inserted
+        result['updated'] += changed - inserted
+        result['skipped'] += len(chunk) - changed - failed
+    
+    @staticmethod
+    def _existing_articles(cursor: sqlite3.Cursor, articles) -> set:
+        """Какие из артикулов уже есть в parts"""
+        articles = list(articles)
+        found = set()
+        # Не больше 500 параметров - ниже лимита старых сборок SQLite
+        for start in range(0, len(articles), 500):
+            part = articles[start:start + 500]
+            placeholders = ', '.join('?' * len(part))
+            cursor.execute(f'SELECT article FROM parts WHERE article IN ({placeholders})', part)
+            found.update(row[0] for row in cursor.fetchall())
+        return found
+    
+    @cached_read
+    def get_all_parts(self) -> List[Record]:
+        """Получить все запчасти"""
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'SELECT {_PART_SELECT} FROM parts ORDER BY article')
+            
+            return fetch_records(cursor, 'PartRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка получения запчастей: {e}")
             return []
     
-    def search_parts(self, query: str) -> List[Dict]:
-        """Поиск запчастей (без учета регистра)"""
+    def _parts_filter_sql(self, filters: Optional[Dict],
+                          ordered_scan: bool = False) -> Tuple[List[str], Dict]:
+        """
+        Условия WHERE и параметры для фильтров списка запчастей:
+        category/brand/car_model - точное совпадение, max_quantity - остаток
+        не больше значения, query - текст поиска (как в search_parts).
+        
+        ordered_scan - проверять совпадение с FTS у строк, идущих по индексу
+        сортировки, а не выбирать найденные строки по id (см. _is_broad_search).
+        """
+        conditions = []
+        params = {}
+        filters = filters or {}
+        
+        for column in ('category', 'brand', 'car_model'):
+            if filters.get(column):
+                conditions.append(f'{column} = :{column}')
+                params[column] = filters[column]
+        
+        if filters.get('max_quantity') is not None:
+            conditions.append('quantity <= :max_quantity')
+            params['max_quantity'] = filters['max_quantity']
+        
+        query = (filters.get('query') or '').strip()
+        if query:
+            match = build_fts_query(query) if self._fts_enabled else None
+            if match is not None:
+                # "+id" не даёт выбирать строки по найденным rowid
+                id_column = '+id' if ordered_scan else 'id'
+                text_condition = f'{id_column} IN (SELECT rowid FROM parts_fts WHERE parts_fts MATCH :match)'
+                params['match'] = match
+            elif self._fts_enabled:
+                text_condition = None
+            else:
+                text_condition = _SCAN_CONDITION
+                params.update(_scan_params(query))
+            
+            key = normalize_article(query)
+            if len(key) >= MIN_ARTICLE_PREFIX:
+                article_condition = '(article_key >= :key_from AND article_key < :key_to)'
+                params['key_from'] = key
+                params['key_to'] = prefix_upper_bound(key)
+                text_condition = (f'({text_condition} OR {article_condition})'
+                                  if text_condition else article_condition)
+            
+            if text_condition:
+                conditions.append(text_condition)
+        
+        return conditions, params
+    
+    def _is_broad_search(self, filters: Optional[Dict]) -> bool:
+        """
+        Находит ли текст поиска большую часть каталога (не меньше
+        BROAD_SEARCH_ROWS строк). Тогда для страницы выгоднее идти по индексу
+        сортировки до первых подходящих строк, чем сортировать все найденные:
+        короткий префикс при вводе находит тысячи запчастей.
+        """
+        query = ((filters or {}).get('query') or '').strip()
+        match = build_fts_query(query) if query and self._fts_enabled else None
+        if match is None:
+            return False
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                # Приводим поисковый запрос к нижнему регистру
-                search_query = f"%{query.lower()}%"
-                
-                cursor.execute('''
-                SELECT * FROM parts 
-                WHERE LOWER(article) LIKE ? 
-                   OR LOWER(name) LIKE ? 
-                   OR LOWER(brand) LIKE ? 
-                   OR LOWER(car_model) LIKE ?
-                   OR LOWER(category) LIKE ?
-                ORDER BY article
-                ''', (search_query, search_query, search_query, search_query, search_query))
-                
-                columns = [desc[0] for desc in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
-                
+            cursor = self._connections.reader().cursor()
+            cursor.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM parts_fts WHERE parts_fts MATCH ? LIMIT ?
+            )
+            ''', (match, BROAD_SEARCH_ROWS))
+            return cursor.fetchone()[0] >= BROAD_SEARCH_ROWS
+        except sqlite3.Error:
+            return False
+    
+    @cached_read
+    def get_parts_page(self, after_key: Optional[Tuple] = None, limit: int = 50,
+                       order_by: str = 'article',
+                       filters: Optional[Dict] = None) -> Tuple[List[Record], Optional[Tuple]]:
+        """
+        Получить страницу запчастей (keyset-пагинация).
+        
+        order_by - колонка из PAGE_ORDER_COLUMNS, префикс "-" означает
+        обратный порядок. after_key - ключ, возвращённый предыдущим вызовом
+        (None для первой страницы). Возвращает (запчасти, ключ следующей
+        страницы); ключ None, если страница последняя.
+        """
+        descending = order_by.startswith('-')
+        column = order_by.lstrip('-')
+        if column not in PAGE_ORDER_COLUMNS:
+            raise ValueError(f"Недопустимая колонка сортировки: {column}")
+        
+        ordered_scan = column in ORDERED_SCAN_COLUMNS and self._is_broad_search(filters)
+        conditions, params = self._parts_filter_sql(filters, ordered_scan)
+        if after_key is not None:
+            # Сравнение пар (значение, id) - продолжение ровно с места остановки
+            conditions.append(f"({column}, id) {'<' if descending else '>'} (:after_value, :after_id)")
+            params['after_value'], params['after_id'] = after_key
+            if column in MONEY_COLUMNS:
+                params['after_value'] = to_kopecks(params['after_value'])
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        direction = 'DESC' if descending else 'ASC'
+        # Лишняя строка показывает, есть ли следующая страница
+        params['limit'] = limit + 1
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'''
+            SELECT {_PART_SELECT} FROM parts
+            {where}
+            ORDER BY {column} {direction}, id {direction}
+            LIMIT :limit
+            ''', params)
+            
+            parts = fetch_records(cursor, 'PartRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения страницы запчастей: {e}")
+            return [], None
+        
+        if len(parts) <= limit:
+            return parts, None
+        
+        parts = parts[:limit]
+        return parts, (parts[-1][column], parts[-1]['id'])
+    
+    @cached_read
+    def get_parts_columns(self, columns: Sequence[str] = ('category', 'brand', 'quantity',
+                                                          'buy_price', 'sell_price'),
+                          filters: Optional[Dict] = None) -> Dict[str, Sequence]:
+        """
+        Выбранные колонки каталога массивами (см. db_records.fetch_columns) -
+        для обработки всего каталога без записи на каждую строку.
+        Цены в массивах - целые копейки.
+        """
+        for column in columns:
+            if column not in PAGE_ORDER_COLUMNS:
+                raise ValueError(f"Недопустимая колонка: {column}")
+        
+        conditions, params = self._parts_filter_sql(filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f"SELECT {', '.join(columns)} FROM parts {where} ORDER BY id", params)
+            return fetch_columns(cursor)
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения запчастей: {e}")
+            return {column: () for column in columns}
+    
+    def count_parts(self, filters: Optional[Dict] = None) -> int:
+        """Количество запчастей, подходящих под фильтры get_parts_page"""
+        return self.get_parts_summary(filters)['count']
+    
+    @cached_read
+    def get_parts_summary(self, filters: Optional[Dict] = None) -> Dict:
+        """
+        Итоги по запчастям, подходящим под фильтры: количество позиций,
+        розничная стоимость остатков и число позиций с низким остатком.
+        Без фильтров итоги читаются из сводной таблицы, а не считаются.
+        """
+        conditions, params = self._parts_filter_sql(filters)
+        if not conditions:
+            totals = self.get_inventory_totals()
+            return {'count': totals['count'], 'total_value': totals['sell_value'],
+                    'low_stock': totals['low_stock']}
+        
+        params['low_stock'] = LOW_STOCK_THRESHOLD
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'''
+            SELECT COUNT(*),
+                   COALESCE(SUM(sell_price * quantity), 0),
+                   COALESCE(SUM(quantity <= :low_stock), 0)
+            FROM parts
+            WHERE {' AND '.join(conditions)}
+            ''', params)
+            count, total_value, low_stock = cursor.fetchone()
+            return {'count': count, 'total_value': from_kopecks(total_value),
+                    'low_stock': low_stock}
+            
+        except Exception as e:
+            print(f"❌ Ошибка подсчёта запчастей: {e}")
+            return {'count': 0, 'total_value': from_kopecks(0), 'low_stock': 0}
+    
+    @cached_read
+    def get_statistics(self, top_brands: int = 10, low_stock_limit: int = 20) -> Dict:
+        """
+        Статистика склада для вкладки «Статистика»:
+        {'totals': итоги get_inventory_totals, 'categories': все категории,
+         'brands': top_brands марок с наибольшей стоимостью остатков,
+         'low_stock': первые low_stock_limit позиций с низким остатком,
+         'low_stock_count': сколько их всего}.
+        Итоги берутся из сводных таблиц, все запросы выполняются в одной
+        транзакции чтения - цифры согласованы.
+        """
+        conn = self._connections.reader()
+        try:
+            conn.execute('BEGIN')
+            totals = self.get_inventory_totals(conn=conn)
+            return {
+                'totals': totals,
+                'categories': self.get_group_stats('category', conn=conn),
+                'brands': self.get_group_stats('brand', limit=top_brands, conn=conn),
+                'low_stock': self.get_low_stock(low_stock_limit, conn=conn),
+                'low_stock_count': totals['low_stock'],
+            }
+        finally:
+            conn.rollback()
+    
+    def get_inventory_totals(self, conn: Optional[sqlite3.Connection] = None) -> Dict:
+        """
+        Итоги по всему складу из сводной таблицы: наименований, штук,
+        закупочная и розничная стоимость остатков, позиций с низким остатком
+        """
+        try:
+            cursor = (conn or self._connections.reader()).cursor()
+            cursor.execute('''
+            SELECT count, quantity, buy_value, sell_value, low_stock
+            FROM inventory_totals WHERE id = 1
+            ''')
+            count, quantity, buy_value, sell_value, low_stock = cursor.fetchone()
+            return {'count': count, 'quantity': quantity, 'buy_value': from_kopecks(buy_value),
+                    'sell_value': from_kopecks(sell_value), 'low_stock': low_stock}
+            
+        except Exception as e:
+            print(f"❌ Ошибка чтения итогов склада: {e}")
+            return {'count': 0, 'quantity': 0, 'buy_value': from_kopecks(0),
+                    'sell_value': from_kopecks(0), 'low_stock': 0}
+    
+    def get_group_stats(self, column: str, limit: Optional[int] = None,
+                        conn: Optional[sqlite3.Connection] = None) -> List[Record]:
+        """
+        Итоги по категориям (column='category'), маркам ('brand') или
+        моделям ('car_model') из сводных таблиц: записи (key, count, quantity, value, buy_value) -
+        value розничная, buy_value закупочная стоимость остатков.
+        Без limit - все группы по алфавиту, с limit - limit групп
+        с наибольшей стоимостью.
+        """
+        tables = dict(SUMMARY_GROUPS)
+        if column not in tables:
+            raise ValueError(f"Недопустимая колонка группировки: {column}")
+        order = 'key' if limit is None else 'sell_value DESC, key'
+        
+        try:
+            cursor = (conn or self._connections.reader()).cursor()
+            cursor.execute(f'''
+            SELECT key, count, quantity, sell_value AS value, buy_value
+            FROM {tables[column]}
+            ORDER BY {order}
+            LIMIT ?
+            ''', (-1 if limit is None else limit,))
+            return fetch_records(cursor, 'GroupStatsRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка группировки по {column}: {e}")
+            return []
+    
+    @cached_read
+    def get_distinct_values(self, column: str) -> List[str]:
+        """
+        Различные значения category, brand или car_model для подсказок
+        ввода - по алфавиту без учёта регистра. Читаются из сводных таблиц,
+        а не выбираются DISTINCT по всему каталогу.
+        """
+        tables = dict(SUMMARY_GROUPS)
+        if column not in tables:
+            raise ValueError(f"Недопустимая колонка: {column}")
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f"SELECT key FROM {tables[column]} WHERE key <> '' ORDER BY key")
+            # Порядок как у QCompleter.CaseInsensitivelySortedModel:
+            # подсказки ищутся двоичным поиском
+            return sorted((row[0] for row in cursor.fetchall()), key=str.lower)
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения значений {column}: {e}")
+            return []
+    
+    def get_low_stock(self, limit: int = 20,
+                      conn: Optional[sqlite3.Connection] = None) -> List[Record]:
+        """Первые limit запчастей с низким остатком по возрастанию остатка"""
+        try:
+            cursor = (conn or self._connections.reader()).cursor()
+            cursor.execute(f'''
+            SELECT {_PART_SELECT} FROM parts
+            WHERE quantity <= ?
+            ORDER BY quantity, id
+            LIMIT ?
+            ''', (LOW_STOCK_THRESHOLD, limit))
+            return fetch_records(cursor, 'PartRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения низких остатков: {e}")
+            return []
+    
+    def rebuild_summaries(self) -> bool:
+        """Пересчитать сводные таблицы остатков по parts (обслуживание)"""
+        try:
+            with self._connections.writer() as conn:
+                rebuild_inventory_summary(conn.cursor())
+            return True
+            
+        except Exception as e:
+            print(f"❌ Ошибка пересчёта сводок: {e}")
+            return False
+    
+    def check_summaries(self) -> List[str]:
+        """
+        Сверить сводные таблицы с пересчётом по parts.
+        Возвращает описания расхождений (пустой список - сводки верны).
+        """
+        conn = self._connections.reader()
+        try:
+            conn.execute('BEGIN')
+            return check_inventory_summary(conn)
+        finally:
+            conn.rollback()
+    
+    def check_stock_ledger(self) -> List[str]:
+        """
+        Сверить остатки запчастей с суммой движений журнала.
+        Возвращает описания расхождений (пустой список - журнал верен).
+        """
+        rows = self._connections.reader().execute('''
+        SELECT p.id, p.quantity, COALESCE(SUM(m.delta), 0) AS ledger
+        FROM parts p
+        LEFT JOIN stock_movements m ON m.part_id = p.id
+        GROUP BY p.id
+        HAVING p.quantity != ledger
+        ORDER BY p.id
+        ''').fetchall()
+        return [f"запчасть {part_id}: остаток {quantity}, по журналу {ledger}"
+                for part_id, quantity, ledger in rows]
+    
+    @cached_read
+    def get_stock_as_of(self, moment, part_id: Optional[int] = None,
+                        category: Optional[str] = None) -> int:
+        """
+        Остаток на дату (date или 'YYYY-MM-DD' - на конец дня) или момент
+        (datetime) по запчасти, категории или по всему складу. Считается по
+        ближайшему снимку на начало месяца и движениям после него.
+        """
+        try:
+            return stock_as_of(self._connections.reader().cursor(), moment,
+                               part_id=part_id, category=category)
+            
+        except Exception as e:
+            print(f"❌ Ошибка расчёта остатка на дату: {e}")
+            return 0
+    
+    @cached_read
+    def get_stock_movements(self, part_id: int) -> List[Record]:
+        """Движения остатка запчасти по журналу, от старых к новым"""
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute('''
+            SELECT id, part_id, at, delta, kind, document_id
+            FROM stock_movements
+            WHERE part_id = ?
+            ORDER BY at, id
+            ''', (part_id,))
+            
+            return fetch_records(cursor, 'StockMovementRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка чтения журнала остатков: {e}")
+            return []
+    
+    def rebuild_stock_ledger(self) -> int:
+        """
+        Восстановить журнал движения остатков и снимки по продажам и
+        поступлениям (обслуживание). Возвращает число движений или -1 при ошибке.
+        """
+        try:
+            with self._connections.writer() as conn:
+                return rebuild_stock_ledger(conn.cursor())
+            
+        except Exception as e:
+            print(f"❌ Ошибка восстановления журнала остатков: {e}")
+            return -1
+    
+    def data_version(self) -> int:
+        """
+        Номер версии данных (PRAGMA data_version): меняется после каждой
+        записи в базу, в том числе из другого процесса. Проверка не читает
+        таблицы, поэтому её можно выполнять часто.
+        """
+        return self._connections.data_version()
+    
+    def get_change_mark(self) -> int:
+        """Текущая отметка журнала изменений запчастей"""
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM part_changes')
+            return cursor.fetchone()[0]
+            
+        except Exception as e:
+            print(f"❌ Ошибка чтения журнала изменений: {e}")
+            return 0
+    
+    def get_part_changes(self, since: int, limit: int = CHANGES_LIMIT) -> Dict:
+        """
+        Запчасти, изменённые (добавленные, удалённые) после отметки since:
+        {'mark': новая отметка, 'part_ids': [id] или None, если изменений
+        больше limit - тогда представлению проще перезагрузиться целиком}
+        """
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute('''
+            SELECT part_id, seq FROM part_changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+            ''', (since, limit + 1))
+            rows = cursor.fetchall()
+            
+            if len(rows) > limit:
+                cursor.execute('SELECT MAX(seq) FROM part_changes')
+                return {'mark': cursor.fetchone()[0], 'part_ids': None}
+            mark = rows[-1][1] if rows else since
+            return {'mark': mark, 'part_ids': [part_id for part_id, _ in rows]}
+            
+        except Exception as e:
+            print(f"❌ Ошибка чтения журнала изменений: {e}")
+            return {'mark': since, 'part_ids': []}
+    
+    @cached_read
+    def search_parts(self, query: str) -> List[Record]:
+        """
+        Поиск запчастей (без учета регистра).
+        Каждое слово запроса ищется как префикс через FTS5, результаты
+        ранжируются bm25; без FTS5 - сканирование таблицы. Запчасти, чей
+        нормализованный артикул начинается с запроса, идут первыми.
+        """
+        if self._fts_enabled:
+            match = build_fts_query(query)
+            if match is None:
+                return self.get_all_parts()
+            found = self._search_parts_fts(match)
+        else:
+            found = self._search_parts_scan(query)
+        
+        # "0446533450" находит "04465-33450" и наоборот
+        if len(normalize_article(query)) < MIN_ARTICLE_PREFIX:
+            return found
+        by_article = self.find_parts_by_article_prefix(query)
+        if not by_article:
+            return found
+        
+        article_ids = {part['id'] for part in by_article}
+        return by_article + [part for part in found if part['id'] not in article_ids]
+    
+    def _search_parts_fts(self, match: str) -> List[Record]:
+        """Поиск по полнотекстовому индексу parts_fts"""
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'''
+            SELECT {_PART_SELECT_P} FROM parts_fts
+            JOIN parts p ON p.id = parts_fts.rowid
+            WHERE parts_fts MATCH ?
+            ORDER BY {FTS_RANK}, p.article
+            ''', (match,))
+            
+            return fetch_records(cursor, 'PartRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка поиска: {e}")
+            return []
+    
+    def _search_parts_scan(self, query: str) -> List[Record]:
+        """Поиск сканированием таблицы (если FTS5 недоступен)"""
+        try:
+            cursor = self._connections.reader().cursor()
+            # Сравниваем с колонками *_cf, приведёнными к регистру по Unicode
+            cursor.execute(f'''
+            SELECT {_PART_SELECT} FROM parts
+            WHERE {_SCAN_CONDITION}
+            ORDER BY article
+            ''', _scan_params(query))
+            
+            return fetch_records(cursor, 'PartRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка поиска: {e}")
             return []
     
+    @cached_read
+    def find_by_article(self, article: str) -> Optional[Record]:
+        """
+        Найти запчасть по артикулу без учёта разделителей и регистра
+        (точное совпадение по индексу article_key)
+        """
+        key = normalize_article(article)
+        if not key:
+            return None
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'SELECT {_PART_SELECT} FROM parts WHERE article_key = ?', (key,))
+            return fetch_record(cursor, 'PartRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка поиска по артикулу: {e}")
+            return None
+    
+    @cached_read
+    def find_parts_by_article_prefix(self, prefix: str, limit: int = 50) -> List[Record]:
+        """Запчасти, чей нормализованный артикул начинается с prefix"""
+        key = normalize_article(prefix)
+        if not key:
+            return []
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            # Диапазон вместо LIKE, чтобы работал индекс article_key
+            cursor.execute(f'''
+            SELECT {_PART_SELECT} FROM parts
+            WHERE article_key >= ? AND article_key < ?
+            ORDER BY article_key
+            LIMIT ?
+            ''', (key, prefix_upper_bound(key), limit))
+            
+            return fetch_records(cursor, 'PartRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка поиска по артикулу: {e}")
+            return []
+    
     def update_part(self, part_id: int, **kwargs) -> bool:
         """Обновить запчасть"""
+        return self.update_part_record(part_id, **kwargs) is not None
+    
+    def update_part_record(self, part_id: int, **kwargs) -> Optional[Record]:
+        """Обновить запчасть и вернуть её новую запись (None, если не найдена)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.writer() as conn:
                 cursor = conn.cursor()
+                kwargs = money_params(kwargs)
                 
                 # Строим запрос динамически
                 set_clause = ', '.join([f"{key} = ?" for key in kwargs.keys()])
@@ -177,41 +1095,86 @@ class SimpleDatabase:
                 UPDATE parts 
                 SET {set_clause}, updated_at = ?
                 WHERE id = ?
+                RETURNING {_PART_SELECT}
                 ''', values)
                 
-                conn.commit()
-                return cursor.rowcount > 0
+                return fetch_record(cursor, 'PartRecord')
                 
         except Exception as e:
             print(f"❌ Ошибка обновления: {e}")
-            return False
+            return None
     
     def delete_part(self, part_id: int) -> bool:
         """Удалить запчасть"""
+        return self.delete_part_record(part_id) is not None
+    
+    def delete_part_record(self, part_id: int) -> Optional[Record]:
+        """Удалить запчасть и вернуть её последнюю запись (None, если не найдена)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.writer() as conn:
                 cursor = conn.cursor()
-                cursor.execute('DELETE FROM parts WHERE id = ?', (part_id,))
-                conn.commit()
-                return cursor.rowcount > 0
+                cursor.execute(f'DELETE FROM parts WHERE id = ? RETURNING {_PART_SELECT}',
+                               (part_id,))
+                return fetch_record(cursor, 'PartRecord')
                 
+        except sqlite3.IntegrityError:
+            # parts (id) - родитель позиций продаж и поступлений (ON DELETE RESTRICT)
+            print(f"❌ Запчасть ID {part_id} нельзя удалить: по ней есть продажи или поступления")
+            return None
         except Exception as e:
             print(f"❌ Ошибка удаления: {e}")
+            return None
+    
+    def part_matches(self, part_id: int, filters: Optional[Dict] = None) -> bool:
+        """Подходит ли запчасть под фильтры get_parts_page"""
+        conditions, params = self._parts_filter_sql(filters)
+        conditions.append('id = :part_id')
+        params['part_id'] = part_id
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f"SELECT 1 FROM parts WHERE {' AND '.join(conditions)}", params)
+            return cursor.fetchone() is not None
+            
+        except Exception as e:
+            print(f"❌ Ошибка проверки фильтра: {e}")
             return False
     
-    def get_part_by_id(self, part_id: int) -> Optional[Dict]:
+    def get_parts_by_ids(self, part_ids: Sequence[int],
+                         filters: Optional[Dict] = None) -> List[Record]:
+        """
+        Существующие запчасти из part_ids, подходящие под фильтры
+        get_parts_page (удалённые и неподходящие в результат не попадают)
+        """
+        if not part_ids:
+            return []
+        conditions, params = self._parts_filter_sql(filters)
+        placeholders = []
+        for i, part_id in enumerate(part_ids):
+            params[f'id_{i}'] = part_id
+            placeholders.append(f':id_{i}')
+        conditions.append(f"id IN ({', '.join(placeholders)})")
+        
+        try:
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'''
+            SELECT {_PART_SELECT} FROM parts
+            WHERE {' AND '.join(conditions)}
+            ''', params)
+            return fetch_records(cursor, 'PartRecord')
+            
+        except Exception as e:
+            print(f"❌ Ошибка получения запчастей: {e}")
+            return []
+    
+    @cached_read
+    def get_part_by_id(self, part_id: int) -> Optional[Record]:
         """Получить запчасть по ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM parts WHERE id = ?', (part_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    columns = [desc[0] for desc in cursor.description]
-                    return dict(zip(columns, row))
-                return None
-                
+            cursor = self._connections.reader().cursor()
+            cursor.execute(f'SELECT {_PART_SELECT} FROM parts WHERE id = ?', (part_id,))
+            return fetch_record(cursor, 'PartRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка получения запчасти: {e}")
             return None
@@ -221,92 +1184,158 @@ class SimpleDatabase:
         Создать продажу
         items: [{'part_id': int, 'quantity': int, 'price': float}]
         """
+        return self.checkout(items)['sale_id'] is not None
+    
+    def checkout(self, items: List[Dict]) -> Dict:
+        """
+        Оформить продажу одной транзакцией.
+        items: [{'part_id': int, 'quantity': int, 'price': float}]
+        
+        Остатки списываются условным UPDATE (quantity >= списываемого),
+        поэтому параллельная продажа не уведёт склад в минус. Если хотя бы
+        одна позиция не прошла, продажа не создаётся.
+        
+        Возвращает {'sale_id': id или None, 'failures': [...]}, где каждая
+        ошибка - {'line', 'part_id', 'requested', 'available', 'reason'}
+        (line - номер позиции с 1, available - None, если товар не найден).
+        """
+        failures = []
+        # Одна запчасть может встречаться в нескольких позициях
+        requested: Dict[int, int] = {}
+        for line, item in enumerate(items, 1):
+            quantity = item.get('quantity')
+            if not isinstance(quantity, int) or quantity <= 0:
+                failures.append({'line': line, 'part_id': item.get('part_id'),
+                                 'requested': quantity, 'available': None,
+                                 'reason': "количество должно быть больше 0"})
+                continue
+            requested[item['part_id']] = requested.get(item['part_id'], 0) + quantity
+        
+        if not items:
+            failures.append({'line': 0, 'part_id': None, 'requested': 0, 'available': None,
+                             'reason': "не выбраны товары для продажи"})
+        if failures:
+            return {'sale_id': None, 'failures': failures}
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.writer() as conn:
                 cursor = conn.cursor()
+                # Блокировка записи берётся сразу, до проверки остатков
+                cursor.execute('BEGIN IMMEDIATE')
+                now = datetime.now().isoformat()
                 
-                # Начинаем транзакцию
-                cursor.execute('BEGIN TRANSACTION')
+                prices = [to_kopecks(item['price']) for item in items]
+                total = sum(item['quantity'] * price for item, price in zip(items, prices, strict=True))
+                cursor.execute('INSERT INTO sales (date, total) VALUES (?, ?)', (now, total))
+                sale_id = cursor.lastrowid
                 
-                try:
-                    # Проверяем доступность всех товаров
-                    for item in items:
-                        cursor.execute('SELECT quantity FROM parts WHERE id = ?', (item['part_id'],))
-                        result = cursor.fetchone()
-                        if not result or result[0] < item['quantity']:
-                            raise ValueError(f"Недостаточно товара на складе (ID: {item['part_id']})")
-                    
-                    # Создаем продажу
-                    total = sum(item['quantity'] * item['price'] for item in items)
-                    cursor.execute('''
-                    INSERT INTO sales (date, total)
-                    VALUES (?, ?)
-                    ''', (datetime.now().isoformat(), total))
-                    
-                    sale_id = cursor.lastrowid
-                    
-                    # Добавляем позиции продажи и списываем со склада
-                    for item in items:
-                        # Добавляем позицию
-                        cursor.execute('''
-                        INSERT INTO sale_items (sale_id, part_id, quantity, price)
-                        VALUES (?, ?, ?, ?)
-                        ''', (sale_id, item['part_id'], item['quantity'], item['price']))
-                        
-                        # Списываем со склада
-                        cursor.execute('''
-                        UPDATE parts SET quantity = quantity - ?, updated_at = ?
-                        WHERE id = ?
-                        ''', (item['quantity'], datetime.now().isoformat(), item['part_id']))
-                    
-                    cursor.execute('COMMIT')
-                    return True
-                    
-                except Exception as e:
-                    cursor.execute('ROLLBACK')
-                    print(f"❌ Ошибка транзакции: {e}")
-                    return False
+                # Движения остатков в журнале ссылаются на продажу
+                with movement_source(cursor, 'sale', sale_id, now):
+                    if not self._decrement_stock(cursor, requested, now):
+                        # Откатываем частичное списание и смотрим остатки до продажи
+                        conn.rollback()
+                        failures = self._stock_failures(cursor, items, requested)
+                        raise _SaleRejected()
+                
+                cursor.executemany('''
+                INSERT INTO sale_items (sale_id, part_id, quantity, price)
+                VALUES (?, ?, ?, ?)
+                ''', [(sale_id, item['part_id'], item['quantity'], price)
+                      for item, price in zip(items, prices, strict=True)])
                 
+                self._take_due_snapshots(cursor)
+                return {'sale_id': sale_id, 'failures': []}
+        
+        except _SaleRejected:
+            for failure in failures:
+                print(f"❌ Ошибка транзакции: {failure['reason']} (ID: {failure['part_id']})")
+            return {'sale_id': None, 'failures': failures}
         except Exception as e:
             print(f"❌ Ошибка создания продажи: {e}")
-            return False
+            return {'sale_id': None, 'failures': [
+                {'line': 0, 'part_id': None, 'requested': 0, 'available': None, 'reason': str(e)}
+            ]}
     
-    def get_all_sales(self) -> List[Dict]:
+    @staticmethod
+    def _decrement_stock(cursor: sqlite3.Cursor, requested: Dict[int, int], now: str) -> bool:
+        """
+        Списать остатки всех запчастей продажи.
+        Возвращает False, если хотя бы у одной не хватило остатка
+        (частичное списание откатывает вызывающий).
+        """
+        cursor.executemany('''
+        UPDATE parts SET quantity = quantity - ?, updated_at = ?
+        WHERE id = ? AND quantity >= ?
+        ''', [(quantity, now, part_id, quantity) for part_id, quantity in requested.items()])
+        # Для executemany rowcount - сумма изменённых строк по всем запчастям
+        return cursor.rowcount == len(requested)
+    
+    @staticmethod
+    def _stock_failures(cursor: sqlite3.Cursor, items: List[Dict],
+                        requested: Dict[int, int]) -> List[Dict]:
+        """Позиции, которым не хватило остатка"""
+        part_ids = list(requested)
+        available = {}
+        for start in range(0, len(part_ids), 500):
+            chunk = part_ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f'SELECT id, quantity FROM parts WHERE id IN ({placeholders})', chunk)
+            available.update(cursor.fetchall())
+        
+        failures = []
+        for line, item in enumerate(items, 1):
+            part_id = item['part_id']
+            if part_id not in available:
+                failures.append({'line': line, 'part_id': part_id,
+                                 'requested': requested[part_id], 'available': None,
+                                 'reason': "товар не найден"})
+            elif available[part_id] < requested[part_id]:
+                failures.append({'line': line, 'part_id': part_id,
+                                 'requested': requested[part_id],
+                                 'available': available[part_id],
+                                 'reason': "недостаточно товара на складе"})
+        return failures
+
+    @cached_read
+    def get_all_sales(self) -> List[Record]:
         """Получить все продажи"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                SELECT s.id, s.date, s.total,
-                       COUNT(si.id) as items_count
-                FROM sales s
-                LEFT JOIN sale_items si ON s.id = si.sale_id
-                GROUP BY s.id, s.date, s.total
-                ORDER BY s.date DESC
-                ''')
-                
-                columns = ['id', 'date', 'total', 'items_count']
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
-                
+            cursor = self._connections.reader().cursor()
+            # Подзапрос вместо GROUP BY: сортировка идёт по idx_sales_date,
+            # подсчёт позиций - по idx_sale_items_sale
+            cursor.execute('''
+            SELECT s.id, s.date, s.total,
+                   (SELECT COUNT(*) FROM sale_items si
+                    WHERE si.sale_id = s.id) as items_count
+            FROM sales s
+            ORDER BY s.date DESC
+            ''')
+            
+            return fetch_records(cursor, 'SaleRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка получения продаж: {e}")
             return []
     
-    def get_sale_items(self, sale_id: int) -> List[Dict]:
-        """Получить позиции продажи"""
+    @cached_read
+    def get_sale_items(self, sale_id: int) -> List[Record]:
+        """
+        Получить позиции продажи с артикулом и названием запчасти
+        (один запрос по idx_sale_items_sale и первичному ключу parts;
+        у позиций без запчасти article и name - None)
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                SELECT si.*, p.article, p.name
-                FROM sale_items si
-                JOIN parts p ON si.part_id = p.id
-                WHERE si.sale_id = ?
-                ''', (sale_id,))
-                
-                columns = [desc[0] for desc in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
-                
+            cursor = self._connections.reader().cursor()
+            cursor.execute('''
+            SELECT si.*, p.article, p.name
+            FROM sale_items si
+            LEFT JOIN parts p ON p.id = si.part_id
+            WHERE si.sale_id = ?
+            ORDER BY si.id
+            ''', (sale_id,))
+            
+            return fetch_records(cursor, 'SaleItemRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка получения позиций: {e}")
             return []
@@ -317,87 +1346,82 @@ class SimpleDatabase:
         items: [{'part_id': int, 'quantity': int, 'buy_price': float}]
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connections.writer() as conn:
                 cursor = conn.cursor()
                 
-                # Начинаем транзакцию
-                cursor.execute('BEGIN TRANSACTION')
+                # Создаем поступление
+                now = datetime.now().isoformat()
+                prices = [to_kopecks(item['buy_price']) for item in items]
+                total = sum(item['quantity'] * price for item, price in zip(items, prices, strict=True))
+                cursor.execute('''
+                INSERT INTO receipts (date, supplier, total, notes)
+                VALUES (?, ?, ?, ?)
+                ''', (now, supplier, total, notes))
                 
-                try:
-                    # Создаем поступление
-                    total = sum(item['quantity'] * item['buy_price'] for item in items)
-                    cursor.execute('''
-                    INSERT INTO receipts (date, supplier, total, notes)
-                    VALUES (?, ?, ?, ?)
-                    ''', (datetime.now().isoformat(), supplier, total, notes))
-                    
-                    receipt_id = cursor.lastrowid
-                    
-                    # Добавляем позиции поступления и увеличиваем остатки на складе
-                    for item in items:
+                receipt_id = cursor.lastrowid
+                
+                # Добавляем позиции поступления и увеличиваем остатки на складе
+                with movement_source(cursor, 'receipt', receipt_id, now):
+                    for item, price in zip(items, prices, strict=True):
                         # Добавляем позицию
                         cursor.execute('''
                         INSERT INTO receipt_items (receipt_id, part_id, quantity, buy_price)
                         VALUES (?, ?, ?, ?)
-                        ''', (receipt_id, item['part_id'], item['quantity'], item['buy_price']))
+                        ''', (receipt_id, item['part_id'], item['quantity'], price))
                         
                         # Увеличиваем остаток на складе
                         cursor.execute('''
                         UPDATE parts SET quantity = quantity + ?, updated_at = ?
                         WHERE id = ?
-                        ''', (item['quantity'], datetime.now().isoformat(), item['part_id']))
-                    
-                    cursor.execute('COMMIT')
-                    return True
-                    
-                except Exception as e:
-                    cursor.execute('ROLLBACK')
-                    print(f"❌ Ошибка транзакции: {e}")
-                    return False
+                        ''', (item['quantity'], now, item['part_id']))
+                
+                self._take_due_snapshots(cursor)
+                return True
                 
         except Exception as e:
             print(f"❌ Ошибка создания поступления: {e}")
             return False
     
-    def get_all_receipts(self) -> List[Dict]:
+    @cached_read
+    def get_all_receipts(self) -> List[Record]:
         """Получить все поступления"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                SELECT r.id, r.date, r.supplier, r.total, r.notes,
-                       COUNT(ri.id) as items_count
-                FROM receipts r
-                LEFT JOIN receipt_items ri ON r.id = ri.receipt_id
-                GROUP BY r.id, r.date, r.supplier, r.total, r.notes
-                ORDER BY r.date DESC
-                ''')
-                
-                columns = ['id', 'date', 'supplier', 'total', 'notes', 'items_count']
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
-                
+            cursor = self._connections.reader().cursor()
+            cursor.execute('''
+            SELECT r.id, r.date, r.supplier, r.total, r.notes,
+                   (SELECT COUNT(*) FROM receipt_items ri
+                    WHERE ri.receipt_id = r.id) as items_count
+            FROM receipts r
+            ORDER BY r.date DESC
+            ''')
+            
+            return fetch_records(cursor, 'ReceiptRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка получения поступлений: {e}")
             return []
     
-    def get_receipt_items(self, receipt_id: int) -> List[Dict]:
-        """Получить позиции поступления"""
+    @cached_read
+    def get_receipt_items(self, receipt_id: int) -> List[Record]:
+        """Получить позиции поступления с артикулом и названием запчасти"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                SELECT ri.*, p.article, p.name
-                FROM receipt_items ri
-                JOIN parts p ON ri.part_id = p.id
-                WHERE ri.receipt_id = ?
-                ''', (receipt_id,))
-                
-                columns = [desc[0] for desc in cursor.description]
-                return [dict(zip(columns, row)) for row in cursor.fetchall()]
-                
+            cursor = self._connections.reader().cursor()
+            cursor.execute('''
+            SELECT ri.*, p.article, p.name
+            FROM receipt_items ri
+            LEFT JOIN parts p ON p.id = ri.part_id
+            WHERE ri.receipt_id = ?
+            ORDER BY ri.id
+            ''', (receipt_id,))
+            
+            return fetch_records(cursor, 'ReceiptItemRecord')
+            
         except Exception as e:
             print(f"❌ Ошибка получения позиций поступления: {e}")
             return []
 
 # Глобальный экземпляр базы данных
-db = SimpleDatabase() 
\ No newline at end of file
+db = SimpleDatabase()
+
+# Закрываем соединения при завершении приложения
+atexit.register(db.close)
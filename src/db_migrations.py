@@ -0,0 +1,238 @@
+"""
+Версионные миграции схемы SimpleDatabase
+
+Версия схемы хранится в PRAGMA user_version. При запуске приложения
+init_database() применяет все миграции с номером больше текущей версии,
+каждую в отдельной транзакции вместе с обновлением user_version.
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from change_log import create_part_change_log
+from inventory_summary import (create_inventory_summary, drop_inventory_summary,
+                               drop_inventory_summary_triggers)
+from money import convert_money_columns
+from part_links import column_type, rebuild_item_table, rename_legacy_part_column
+from search_index import (create_article_key_column, create_casefold_columns, create_parts_fts,
+                          drop_casefold_indexes)
+from stock_ledger import create_stock_ledger, rebuild_stock_ledger
+
+
+class MigrationError(Exception):
+    """Миграция не применена: со схемой старой версии база не работает"""
+
+
+def _migration_1_indexes(cursor: sqlite3.Cursor):
+    """Вторичные индексы для соединений, сортировок и статистики"""
+    # В базе моделей peewee id запчасти позиции продажи - в колонке part
+    rename_legacy_part_column(cursor)
+
+    # Позиции продаж/поступлений: соединение по документу, покрывающие
+    # для get_sale_items/get_receipt_items и подсчёта позиций
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sale_items_sale
+    ON sale_items (sale_id, part_id, quantity, price)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt
+    ON receipt_items (receipt_id, part_id, quantity, buy_price)
+    ''')
+
+    # Обратный поиск документов по запчасти
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sale_items_part ON sale_items (part_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipt_items_part ON receipt_items (part_id)')
+
+    # Журналы документов сортируются по дате
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (date)')
+
+    # Группировки статистики и фильтр низких остатков
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_parts_category
+    ON parts (category, quantity, buy_price, sell_price)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_parts_brand
+    ON parts (brand, quantity, buy_price, sell_price)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_quantity ON parts (quantity)')
+
+
+def _migration_2_parts_fts(cursor: sqlite3.Cursor):
+    """Полнотекстовый индекс каталога (пропускается без FTS5)"""
+    create_parts_fts(cursor)
+
+
+def _migration_3_casefold_columns(cursor: sqlite3.Cursor):
+    """Регистронезависимые (Unicode) копии name/brand/car_model/category"""
+    create_casefold_columns(cursor)
+
+
+def _migration_4_article_key(cursor: sqlite3.Cursor):
+    """Нормализованный артикул с уникальным индексом"""
+    create_article_key_column(cursor)
+
+
+def _migration_5_page_order_indexes(cursor: sqlite3.Cursor):
+    """Индексы для постраничного вывода каталога с сортировкой"""
+    # rowid входит в любой индекс, поэтому ORDER BY <col>, id идёт по индексу
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_name ON parts (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_sell_price ON parts (sell_price)')
+
+
+def _migration_6_inventory_summary(cursor: sqlite3.Cursor):
+    """Сводные таблицы остатков, поддерживаемые триггерами"""
+    create_inventory_summary(cursor)
+
+
+def _migration_7_part_change_log(cursor: sqlite3.Cursor):
+    """Журнал изменений запчастей для автообновления"""
+    create_part_change_log(cursor)
+
+
+def _migration_8_car_model_summary(cursor: sqlite3.Cursor):
+    """Сводка по моделям автомобилей (и список моделей для подсказок)"""
+    # Триггеры пересоздаются с новой группой, сводки пересчитываются
+    drop_inventory_summary_triggers(cursor)
+    create_inventory_summary(cursor)
+
+
+def _create_sale_items_v9(cursor: sqlite3.Cursor, price_type: str):
+    cursor.execute(f'''
+    CREATE TABLE sale_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sale_id INTEGER NOT NULL,
+        part_id INTEGER,
+        quantity INTEGER NOT NULL,
+        price {price_type} NOT NULL,
+        FOREIGN KEY (sale_id) REFERENCES sales (id),
+        FOREIGN KEY (part_id) REFERENCES parts (id) ON DELETE RESTRICT
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX idx_sale_items_sale ON sale_items (sale_id, part_id, quantity, price)
+    ''')
+    cursor.execute('CREATE INDEX idx_sale_items_part ON sale_items (part_id)')
+
+
+def _create_receipt_items_v9(cursor: sqlite3.Cursor, price_type: str):
+    cursor.execute(f'''
+    CREATE TABLE receipt_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        receipt_id INTEGER NOT NULL,
+        part_id INTEGER,
+        quantity INTEGER NOT NULL,
+        buy_price {price_type} NOT NULL,
+        FOREIGN KEY (receipt_id) REFERENCES receipts (id),
+        FOREIGN KEY (part_id) REFERENCES parts (id) ON DELETE RESTRICT
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX idx_receipt_items_receipt
+    ON receipt_items (receipt_id, part_id, quantity, buy_price)
+    ''')
+    cursor.execute('CREATE INDEX idx_receipt_items_part ON receipt_items (part_id)')
+
+
+def _migration_9_part_foreign_keys(cursor: sqlite3.Cursor):
+    """Проверяемые внешние ключи позиций документов на parts"""
+    # part_id допускает NULL только для позиций, чья запчасть была
+    # удалена до включения проверки ссылок. Тип цен сохраняется: рубли
+    # (REAL, DECIMAL) переводит в копейки миграция 10, а INTEGER (база
+    # моделей peewee с MoneyField) уже в копейках
+    sale_price = column_type(cursor, 'sale_items', 'price')
+    receipt_price = column_type(cursor, 'receipt_items', 'buy_price')
+    rebuild_item_table(cursor, 'sale_items', ('sale_id', 'sales'),
+                       ('id', 'sale_id', 'quantity', 'price'),
+                       lambda cursor: _create_sale_items_v9(cursor, sale_price))
+    rebuild_item_table(cursor, 'receipt_items', ('receipt_id', 'receipts'),
+                       ('id', 'receipt_id', 'quantity', 'buy_price'),
+                       lambda cursor: _create_receipt_items_v9(cursor, receipt_price))
+
+
+def _migration_10_money_kopecks(cursor: sqlite3.Cursor):
+    """Денежные колонки - целые копейки вместо REAL"""
+    # Сводки пересоздаются уже в копейках после перевода parts
+    drop_inventory_summary(cursor)
+    convert_money_columns(cursor)
+    create_inventory_summary(cursor)
+
+
+def _migration_11_stock_ledger(cursor: sqlite3.Cursor):
+    """Журнал движения остатков со снимками на начало месяца"""
+    # Историю существующей базы восстанавливаем по продажам и поступлениям
+    create_stock_ledger(cursor)
+    rebuild_stock_ledger(cursor)
+
+
+def _migration_12_drop_casefold_indexes(cursor: sqlite3.Cursor):
+    """Индексы *_cf не используются поиском подстроки"""
+    drop_casefold_indexes(cursor)
+
+
+# (версия, описание, функция миграции) - строго по возрастанию версии
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "Индексы для соединений, сортировок и статистики", _migration_1_indexes),
+    (2, "Полнотекстовый индекс запчастей (FTS5)", _migration_2_parts_fts),
+    (3, "Регистронезависимые колонки для поиска", _migration_3_casefold_columns),
+    (4, "Нормализованный артикул для быстрого поиска", _migration_4_article_key),
+    (5, "Индексы для постраничного вывода каталога", _migration_5_page_order_indexes),
+    (6, "Сводные таблицы остатков склада", _migration_6_inventory_summary),
+    (7, "Журнал изменений запчастей", _migration_7_part_change_log),
+    (8, "Сводка по моделям автомобилей", _migration_8_car_model_summary),
+    (9, "Внешние ключи позиций документов на запчасти", _migration_9_part_foreign_keys),
+    (10, "Денежные суммы в копейках", _migration_10_money_kopecks),
+    (11, "Журнал движения остатков", _migration_11_stock_ledger),
+    (12, "Удаление неиспользуемых индексов *_cf", _migration_12_drop_casefold_indexes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы базы данных"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Применить недостающие миграции.
+    Возвращает количество применённых миграций; если миграция не прошла,
+    её изменения откатываются и выбрасывается MigrationError.
+    """
+    current = get_schema_version(conn)
+    if current >= SCHEMA_VERSION:
+        return 0
+    applied = 0
+
+    # Миграции перестраивают таблицы (DROP + RENAME), а удаление parts при
+    # включённой проверке ссылок запрещено: на время миграций она выключается
+    # (вне транзакции, иначе PRAGMA не действует)
+    foreign_keys = conn.execute('PRAGMA foreign_keys').fetchone()[0]
+    conn.execute('PRAGMA foreign_keys = OFF')
+    try:
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            try:
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
+                cursor.execute('COMMIT')
+            except Exception as e:
+                cursor.execute('ROLLBACK')
+                raise MigrationError(f"миграция до версии {version} ({description}): {e}") from e
+
+            print(f"🔄 Миграция БД до версии {version}: {description}")
+            applied += 1
+    finally:
+        conn.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+
+    violations = conn.execute('PRAGMA foreign_key_check').fetchall()
+    if violations:
+        print(f"⚠️ После миграции нарушены ссылки: {len(violations)} строк")
+
+    return applied
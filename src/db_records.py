@@ -0,0 +1,134 @@
+"""
+Компактные записи результатов запросов SimpleDatabase
+
+Вместо словаря на каждую строку выборки создаётся кортеж с именованными
+полями (namedtuple, __slots__ = ()): строка занимает в несколько раз меньше
+памяти и создаётся на стороне C. Для совместимости с прежним кодом запись
+поддерживает доступ как у словаря - record['article'], record.get(...),
+keys()/items() и dict(record); поля доступны и как атрибуты: record.article.
+Как и у sqlite3.Row, итерация по записи перебирает значения, а не ключи.
+Денежные колонки (money.MONEY_COLUMNS) хранятся в базе копейками и
+попадают в запись уже как Money в рублях.
+
+Для массовой обработки (статистика) есть колоночное представление:
+по массиву значений на каждую колонку.
+"""
+
+import sqlite3
+from array import array
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from money import MONEY_COLUMNS, from_kopecks
+
+# Типы записей по (имя, колонки): набор колонок зависит от запроса
+_record_types: Dict[Tuple[str, Tuple[str, ...]], type] = {}
+
+
+class Record:
+    """Доступ к полям кортежа по имени колонки, как у словаря"""
+
+    __slots__ = ()
+    # Имена колонок как в запросе (_fields namedtuple может их переименовать)
+    _columns: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Значение поля или default, если такой колонки нет"""
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._columns
+
+    def values(self) -> Tuple[Any, ...]:
+        return tuple(self)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return zip(self._columns, self, strict=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Обычный словарь (например, для изменения значений)"""
+        return dict(zip(self._columns, self, strict=True))
+
+
+def record_type(name: str, columns: Sequence[str]) -> type:
+    """Тип записи для набора колонок (создаётся один раз и кэшируется)"""
+    key = (name, tuple(columns))
+    cls = _record_types.get(key)
+    if cls is None:
+        # rename=True: колонка, не являющаяся идентификатором, не ломает тип
+        base = namedtuple(name, key[1], rename=True)
+        cls = type(name, (Record, base), {
+            '__slots__': (),
+            '_columns': key[1],
+            '_index': {column: i for i, column in enumerate(key[1])},
+        })
+        cls._from_row = staticmethod(_row_maker(
+            cls, [i for i, column in enumerate(key[1]) if column in MONEY_COLUMNS]))
+        _record_types[key] = cls
+    return cls
+
+
+def _row_maker(cls: type, money: Sequence[int]) -> Callable[[Sequence], Record]:
+    """Функция строка -> запись; копейки денежных колонок переводятся в Money"""
+    make = cls._make
+    if not money:
+        return make
+
+    def make_with_money(row):
+        row = list(row)
+        for index in money:
+            if row[index] is not None:
+                row[index] = from_kopecks(row[index])
+        return make(row)
+    return make_with_money
+
+
+def _cursor_type(cursor: sqlite3.Cursor, name: str) -> type:
+    return record_type(name, [desc[0] for desc in cursor.description])
+
+
+def fetch_records(cursor: sqlite3.Cursor, name: str) -> List[Record]:
+    """Все строки выполненного запроса в виде записей"""
+    make = _cursor_type(cursor, name)._from_row
+    return [make(row) for row in cursor.fetchall()]
+
+
+def fetch_record(cursor: sqlite3.Cursor, name: str) -> Optional[Record]:
+    """Первая строка выполненного запроса или None"""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return _cursor_type(cursor, name)._from_row(row)
+
+
+def fetch_columns(cursor: sqlite3.Cursor) -> Dict[str, Sequence]:
+    """
+    Результат запроса по колонкам: {колонка: значения}.
+    Целые и вещественные колонки хранятся в array ('q' и 'd'),
+    остальные - в кортежах. Денежные колонки остаются в копейках
+    (array 'q'): для массовых расчётов так точнее и быстрее.
+    """
+    columns = [desc[0] for desc in cursor.description]
+    rows = cursor.fetchall()
+    if not rows:
+        return {column: () for column in columns}
+
+    result = {}
+    for column, values in zip(columns, zip(*rows, strict=True), strict=True):
+        if all(type(value) is int for value in values):
+            result[column] = array('q', values)
+        elif all(type(value) in (int, float) for value in values):
+            result[column] = array('d', values)
+        else:
+            result[column] = values
+    return result
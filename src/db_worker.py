@@ -0,0 +1,150 @@
+"""
+Фоновое выполнение запросов к базе данных для интерфейса
+
+Виджеты не вызывают SimpleDatabase напрямую из потока интерфейса, а
+передают вызов в DbWorker и получают DbTask - объект-«обещание» с
+сигналами finished(результат) и failed(текст ошибки). Сигналы приходят
+в поток интерфейса, поэтому в обработчиках можно обновлять виджеты.
+
+Чтения выполняются в пуле потоков параллельно (у каждого потока своё
+соединение-читатель SimpleDatabase, потоки пула не завершаются по простою,
+поэтому соединений не больше, чем потоков), записи - в отдельном пуле из одного
+потока, строго по очереди. Отменённая задача не запускается, если ещё не
+начата, а результат уже выполняющейся отбрасывается (запись при этом
+всё равно завершится или откатится целиком).
+"""
+
+import traceback
+from typing import Any, Callable, Optional
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+# Потоков для чтения: SQLite в режиме WAL читает параллельно
+READ_THREADS = 4
+
+
+class DbTask(QObject):
+    """Результат фонового вызова"""
+
+    finished = Signal(object)
+    failed = Signal(str)
+    # Из рабочего потока: доставляются в поток задачи через очередь событий
+    _completed = Signal(object)
+    _errored = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cancelled = False
+        self.done = False
+        self._completed.connect(self._deliver_result)
+        self._errored.connect(self._deliver_error)
+
+    def cancel(self):
+        """Отменить задачу: обработчики finished/failed не будут вызваны"""
+        self._cancelled = True
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+    def _deliver_result(self, result: Any):
+        self.done = True
+        if not self._cancelled:
+            self.finished.emit(result)
+
+    def _deliver_error(self, message: str):
+        self.done = True
+        if not self._cancelled:
+            self.failed.emit(message)
+
+
+class _DbCall(QRunnable):
+    """Вызов функции в потоке пула"""
+
+    def __init__(self, task: DbTask, func: Callable, args, kwargs):
+        super().__init__()
+        self.task = task
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        if self.task.is_cancelled():
+            # Всё равно сообщаем о завершении: DbWorker считает активные задачи
+            self.task._completed.emit(None)
+            return
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self.task._errored.emit(str(e))
+        else:
+            self.task._completed.emit(result)
+
+
+class DbWorker(QObject):
+    """Очередь фоновых вызовов базы данных"""
+
+    # True - есть незавершённые задачи (для индикатора загрузки)
+    busy_changed = Signal(bool)
+
+    def __init__(self, read_threads: int = READ_THREADS, parent=None):
+        super().__init__(parent)
+        self._read_pool = QThreadPool(self)
+        self._read_pool.setMaxThreadCount(read_threads)
+        self._write_pool = QThreadPool(self)
+        self._write_pool.setMaxThreadCount(1)
+        # Соединение-читатель закреплено за потоком и живёт до закрытия базы:
+        # потоки не завершаются по простою (по умолчанию через 30 с), иначе
+        # каждый новый поток пула открывал бы ещё одно соединение
+        for pool in (self._read_pool, self._write_pool):
+            pool.setExpiryTimeout(-1)
+        # Незавершённые задачи: ссылка не даёт сборщику мусора удалить
+        # задачу, пока её результат идёт через очередь событий
+        self._tasks = set()
+
+    def submit(self, func: Callable, *args, **kwargs) -> DbTask:
+        """Выполнить чтение в фоне"""
+        return self._start(self._read_pool, func, args, kwargs)
+
+    def submit_write(self, func: Callable, *args, **kwargs) -> DbTask:
+        """Выполнить запись в фоне (записи выполняются по очереди)"""
+        return self._start(self._write_pool, func, args, kwargs)
+
+    def is_busy(self) -> bool:
+        return bool(self._tasks)
+
+    def wait_for_done(self, msecs: int = -1) -> bool:
+        """Дождаться завершения всех запущенных задач (при выходе, в тестах)"""
+        read_done = self._read_pool.waitForDone(msecs)
+        write_done = self._write_pool.waitForDone(msecs)
+        return read_done and write_done
+
+    def _start(self, pool: QThreadPool, func: Callable, args, kwargs) -> DbTask:
+        # Задача создаётся в потоке интерфейса - туда и придут её сигналы
+        task = DbTask()
+        task._completed.connect(self._task_done)
+        task._errored.connect(self._task_done)
+
+        self._tasks.add(task)
+        if len(self._tasks) == 1:
+            self.busy_changed.emit(True)
+
+        pool.start(_DbCall(task, func, args, kwargs))
+        return task
+
+    def _task_done(self, _result=None):
+        self._tasks.discard(self.sender())
+        if not self._tasks:
+            self.busy_changed.emit(False)
+
+
+# Глобальный экземпляр
+_db_worker: Optional[DbWorker] = None
+
+
+def get_db_worker() -> DbWorker:
+    """Получить общий для приложения DbWorker"""
+    global _db_worker
+    if _db_worker is None:
+        _db_worker = DbWorker()
+    return _db_worker
@@ -1,10 +1,10 @@
 """Главное приложение системы учёта автозапчастей"""
 import sys
-from datetime import datetime
+import time
 
 # --- ВАЖНО: Импортируем скомпилированные ресурсы ---
 try:
-    import resources_rc
+    import resources_rc  # noqa: F401 - регистрирует ресурсы Qt
 except ImportError:
     print("⚠️ Файл ресурсов (resources_rc.py) не найден.")
     print("   Пожалуйста, запустите скрипт scripts/compile_resources.py")
@@ -12,32 +12,61 @@ except ImportError:
 
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QTabWidget, QPushButton, QLabel, 
-                             QMessageBox, QDialog, QFormLayout, QLineEdit,
-                             QSpinBox, QDoubleSpinBox, QTextEdit, QTableWidget,
-                             QTableWidgetItem, QHeaderView, QComboBox,
-                             QAbstractItemView, QSplitter, QDateEdit, QGroupBox,
-                             QScrollArea, QFrame, QGridLayout, QCheckBox,
-                             QTreeView)
-from PySide6.QtCore import Qt, QTimer, QDate
-from PySide6.QtGui import (QFont, QAction, QColor, QStandardItemModel,
-                           QStandardItem)
-from datetime import datetime, timedelta
+                             QMessageBox, QDialog, QLineEdit,
+                             QHeaderView, QAbstractItemView, QGroupBox,
+                             QScrollArea, QTableView)
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QAction
 
-from database_simple import db
-from styles_enhanced import get_enhanced_complete_style, ENHANCED_COLORS, ICONS, ENHANCED_DIALOG_STYLES
+from database_simple import db, LOW_STOCK_THRESHOLD
+from styles_enhanced import get_enhanced_complete_style
 from settings_manager import get_settings
 from settings_dialog import show_settings_dialog
-from parts_dialogs import AddPartDialog, EditPartDialog
+from parts_dialogs import AddPartDialog, EditPartDialog, import_catalog
+from parts_table_model import PartsTableModel
+from db_worker import get_db_worker
+from auto_refresh import AutoRefresher
+from modern_widgets import LazyTab, LoadingSpinner
 
 # --- Глобальные переменные ---
 APP_NAME = "Система учёта автозапчастей"
 
+# Этапы запуска для отчёта о времени старта
+STARTUP_STAGES = ('window_shown', 'first_data')
+
 class PartsWidget(QWidget):
     """Виджет для управления запчастями с базой данных"""
     
+    # Поля запчасти по колонкам таблицы (None - сортировка недоступна)
+    COLUMN_FIELDS = ['id', 'article', 'name', 'brand', 'car_model',
+                     'category', 'quantity', 'buy_price', 'sell_price', None]
+    
+    # Пауза в наборе, после которой выполняется поиск
+    SEARCH_DELAY_MS = 250
+    
     def __init__(self, main_window=None):
         super().__init__()
         self.main_window = main_window
+        # Каталог подгружается страницами по мере прокрутки
+        # QSettings в ini-файле возвращает строку
+        self.page_size = int(get_settings().items_per_page)
+        self.order_by = 'article'
+        self.loaded_filters = {}
+        self.summary = None
+        # Время последней загрузки списка (поиск, сортировка), мс
+        self.load_started = None
+        self.load_time_ms = None
+        # Запросы к БД выполняются в фоне, интерфейс не ждёт их
+        self.worker = get_db_worker()
+        self.summary_task = None
+        
+        # Поиск запускается, когда пользователь перестал печатать:
+        # каждое нажатие перезапускает таймер и отменяет прежний запрос
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.load_parts)
+        
         self.setup_ui()
         self.load_parts()
     
@@ -80,6 +109,11 @@ class PartsWidget(QWidget):
         delete_btn.clicked.connect(self.delete_part)
         buttons_layout.addWidget(delete_btn)
         
+        import_btn = QPushButton("📥 Импорт")
+        import_btn.setToolTip("Загрузить каталог поставщика из CSV или XLSX")
+        import_btn.clicked.connect(self.import_parts)
+        buttons_layout.addWidget(import_btn)
+        
         buttons_layout.addStretch()
         
         refresh_btn = QPushButton("🔄 Обновить")
@@ -88,19 +122,17 @@ class PartsWidget(QWidget):
         
         layout.addLayout(buttons_layout)
         
-        # Таблица запчастей
-        self.parts_table = QTableWidget()
+        # Таблица запчастей: модель подгружает страницы из БД при прокрутке
+        self.parts_model = PartsTableModel(db, self.page_size, self, worker=self.worker)
+        self.parts_model.page_loaded.connect(self.on_page_loaded)
+        self.parts_model.rowsInserted.connect(self.on_rows_inserted)
+        self.parts_table = QTableView()
+        self.parts_table.setModel(self.parts_model)
         self.parts_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.parts_table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.parts_table.setAlternatingRowColors(True)
-        self.parts_table.setSortingEnabled(True)
         self.parts_table.doubleClicked.connect(self.edit_part)
         
-        # Настройка колонок
-        headers = ["ID", "Артикул", "Наименование", "Марка", "Модель", 
-                  "Категория", "Кол-во", "Закуп. цена", "Розн. цена", "Описание"]
-        self.parts_table.setColumnCount(len(headers))
-        self.parts_table.setHorizontalHeaderLabels(headers)
-        
         # Скрываем колонку ID
         self.parts_table.setColumnHidden(0, True)
         
@@ -109,6 +141,12 @@ class PartsWidget(QWidget):
         header.setStretchLastSection(True)
         header.setSectionResizeMode(2, QHeaderView.Stretch)  # Наименование
         
+        # Сортировка выполняется в БД: в таблице только загруженные страницы
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(1, Qt.AscendingOrder)
+        header.setSectionsClickable(True)
+        header.sortIndicatorChanged.connect(self.sort_by_column)
+        
         layout.addWidget(self.parts_table)
         
         # Статистика
@@ -116,101 +154,235 @@ class PartsWidget(QWidget):
         self.stats_label.setProperty("class", "info-text")
         layout.addWidget(self.stats_label)
     
+    def current_filters(self):
+        """Фильтры списка по строке поиска"""
+        return {'query': self.search_input.text()}
+    
     def load_parts(self):
-        """Загрузить запчасти из базы данных"""
-        parts = db.get_all_parts()
-        
-        self.parts_table.setRowCount(len(parts))
-        
-        for row, part in enumerate(parts):
-            # Создаем элементы таблицы
-            items = [
-                QTableWidgetItem(str(part['id'])),
-                QTableWidgetItem(part['article']),
-                QTableWidgetItem(part['name']),
-                QTableWidgetItem(part['brand']),
-                QTableWidgetItem(part['car_model']),
-                QTableWidgetItem(part['category']),
-                QTableWidgetItem(str(part['quantity'])),
-                QTableWidgetItem(f"{float(part['buy_price']):.2f} ₽"),
-                QTableWidgetItem(f"{float(part['sell_price']):.2f} ₽"),
-                QTableWidgetItem(part['description'] or "")
-            ]
-            
-            # Добавляем в таблицу
-            for col, item in enumerate(items):
-                self.parts_table.setItem(row, col, item)
-            
-            # Выделяем строки с низким остатком
-            if part['quantity'] <= 5:
-                for col in range(len(items)):
-                    self.parts_table.item(row, col).setBackground(QColor("#fff3cd"))
+        """Загрузить первую страницу запчастей из базы данных (в фоне)"""
+        # Отложенный поиск больше не нужен - загружаем по текущему тексту
+        self.search_timer.stop()
+        self.load_started = time.perf_counter()
+        
+        # Незавершённая загрузка прежней страницы отменяется моделью;
+        # следующие страницы запросит таблица при прокрутке (fetchMore)
+        self.loaded_filters = self.current_filters()
+        self.parts_model.reload(self.order_by, self.loaded_filters)
+    
+    def on_page_loaded(self):
+        """Первая страница показана - считаем сводку"""
+        self.load_time_ms = (time.perf_counter() - self.load_started) * 1000
+        self.update_shown_count()
+        self.update_stats()
+        
+        # Если первая страница не заполнила таблицу, прокрутки не будет и
+        # таблица сама не запросит продолжение - догружаем после раскладки
+        QTimer.singleShot(0, self.fill_viewport)
+    
+    def on_rows_inserted(self, *args):
+        """Подгружена очередная страница"""
+        self.update_shown_count()
+        QTimer.singleShot(0, self.fill_viewport)
+    
+    def fill_viewport(self):
+        """Подгружать по странице, пока в таблице не появится прокрутка"""
+        # Скрытая таблица не знает своей высоты - дождёмся showEvent
+        if not self.parts_table.isVisible() or not self.parts_model.canFetchMore():
+            return
+        if self.parts_table.verticalScrollBar().maximum() == 0:
+            # Продолжение - из on_rows_inserted, когда страница придёт
+            self.parts_model.fetchMore()
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        QTimer.singleShot(0, self.fill_viewport)
+    
+    def sort_by_column(self, column, order):
+        """Сортировать каталог по колонке (повторный клик меняет направление)"""
+        field = self.COLUMN_FIELDS[column]
+        if field is None:
+            # Восстанавливаем индикатор текущей сортировки
+            header = self.parts_table.horizontalHeader()
+            current = self.COLUMN_FIELDS.index(self.order_by.lstrip('-'))
+            current_order = Qt.DescendingOrder if self.order_by.startswith('-') else Qt.AscendingOrder
+            header.blockSignals(True)
+            header.setSortIndicator(current, current_order)
+            header.blockSignals(False)
+            return
         
-        # Обновляем статистику
-        self.update_stats(parts)
+        self.order_by = f"-{field}" if order == Qt.DescendingOrder else field
+        self.load_parts()
+    
+    def update_stats(self):
+        """Обновить статистику (считается в БД по всему каталогу с учётом поиска)"""
+        # Сводка для прежнего запроса уже не нужна
+        if self.summary_task is not None:
+            self.summary_task.cancel()
+        self.summary_task = self.worker.submit(db.get_parts_summary, self.loaded_filters)
+        self.summary_task.finished.connect(self.on_summary_loaded)
     
-    def update_stats(self, parts):
-        """Обновить статистику"""
-        total_parts = len(parts)
-        total_value = sum(float(part['sell_price']) * part['quantity'] for part in parts)
-        low_stock = sum(1 for part in parts if part['quantity'] <= 5)
+    def on_summary_loaded(self, summary):
+        self.summary_task = None
+        self.summary = summary
+        self.update_shown_count()
+    
+    def update_shown_count(self):
+        """Обновить строку статистики с числом загруженных строк"""
+        if self.summary is None:
+            return
         
-        stats_text = (f"📊 Всего запчастей: {total_parts} | "
-                     f"💰 Общая стоимость: {total_value:.2f} ₽ | "
-                     f"⚠️ Низкий остаток: {low_stock}")
+        stats_text = (f"📊 Всего запчастей: {self.summary['count']} "
+                     f"(показано: {self.parts_model.rowCount()}) | "
+                     f"💰 Общая стоимость: {self.summary['total_value']:.2f} ₽ | "
+                     f"⚠️ Низкий остаток: {self.summary['low_stock']}")
+        if self.loaded_filters.get('query') and self.load_time_ms is not None:
+            stats_text += f" | ⏱ Поиск: {self.load_time_ms:.0f} мс"
         
         self.stats_label.setText(stats_text)
     
     def filter_parts(self):
-        """Фильтровать запчасти по поисковому запросу"""
-        search_text = self.search_input.text().lower()
-        
-        for row in range(self.parts_table.rowCount()):
-            show_row = False
-            
-            # Проверяем каждую колонку (кроме ID)
-            for col in range(1, self.parts_table.columnCount()):
-                item = self.parts_table.item(row, col)
-                if item and search_text in item.text().lower():
-                    show_row = True
-                    break
-            
-            self.parts_table.setRowHidden(row, not show_row)
+        """Фильтровать запчасти по поисковому запросу (поиск в БД после паузы в наборе)"""
+        self.search_timer.start()
     
     def add_part(self):
         """Добавить новую запчасть"""
         dialog = AddPartDialog(self)
         if dialog.exec() == QDialog.Accepted:
+            self.show_part_change(None, dialog.saved_part)
+    
+    def show_part_change(self, old_part, new_part):
+        """
+        Отразить добавление или изменение одной запчасти без перезагрузки
+        списка. Подходит ли она под строку поиска, проверяет БД.
+        """
+        filters = self.loaded_filters
+        task = self.worker.submit(db.part_matches, new_part['id'], filters)
+        task.finished.connect(
+            lambda matches: self.apply_part_change(old_part, new_part if matches else None))
+    
+    def apply_part_change(self, old_part, new_part):
+        """
+        Применить изменение к таблице и сводке: old_part - запись до
+        изменения (None для новой), new_part - после (None, если запчасть
+        удалена или больше не подходит под поиск)
+        """
+        part_id = (new_part or old_part)['id']
+        was_selected = (self.selected_part() or {}).get('id') == part_id
+        # Прежняя версия не из списка могла не подходить под поиск -
+        # тогда она не учтена в сводке. Это известно, только если её место
+        # среди загруженных строк; за ними - сводку считаем заново
+        recount = False
+        old_listed = self.parts_model.row_of(part_id) >= 0
+        if old_part is not None and not old_listed and self.loaded_filters.get('query'):
+            recount = self.parts_model.is_beyond_loaded(old_part)
+            old_part = None
+        
+        if new_part is None:
+            self.parts_model.remove_part(part_id)
+        else:
+            row = self.parts_model.put_part(new_part)
+            if row >= 0 and (was_selected or old_part is None):
+                # Выделяем строку, не сдвигая прокрутку
+                scroll_bar = self.parts_table.verticalScrollBar()
+                position = scroll_bar.value()
+                self.parts_table.selectRow(row)
+                scroll_bar.setValue(position)
+        
+        if recount:
+            self.update_stats()
+        else:
+            self.apply_summary_delta(old_part, new_part)
+    
+    def apply_summary_delta(self, old_part, new_part):
+        """Поправить сводку на разницу между версиями запчасти"""
+        if self.summary is None or self.summary_task is not None:
+            # Сводка ещё считается - она может уже учитывать изменение
+            self.update_stats()
+            return
+        
+        summary = dict(self.summary)
+        for part, sign in ((old_part, -1), (new_part, 1)):
+            if part is None:
+                continue
+            summary['count'] += sign
+            summary['total_value'] += sign * part['sell_price'] * part['quantity']
+            summary['low_stock'] += sign * (part['quantity'] <= LOW_STOCK_THRESHOLD)
+        self.summary = summary
+        self.update_shown_count()
+    
+    def refresh_changed_parts(self, part_ids):
+        """
+        Перечитать запчасти, изменённые в базе (автообновление): в таблице
+        меняются только их строки. None - изменений много, загружаем заново.
+        """
+        if part_ids is None:
+            self.load_parts()
+            return
+        # Загружаемая страница уже будет содержать изменения
+        if self.parts_model.is_loading():
+            return
+        
+        filters = self.loaded_filters
+        task = self.worker.submit(db.get_parts_by_ids, part_ids, filters)
+        task.finished.connect(
+            lambda parts: self.apply_changed_parts(part_ids, parts, filters))
+    
+    def apply_changed_parts(self, part_ids, parts, filters):
+        """Обновить строки изменённых запчастей; нет в parts - строку убрать"""
+        # За время запроса поиск сменился - новая загрузка всё учтёт
+        if filters is not self.loaded_filters or self.parts_model.is_loading():
+            return
+        
+        found = {part['id']: part for part in parts}
+        for part_id in part_ids:
+            part = found.get(part_id)
+            if part is None:
+                self.parts_model.remove_part(part_id)
+            else:
+                self.parts_model.put_part(part)
+        
+        # Прежние версии строк могли быть не загружены - сводку пересчитываем
+        self.update_stats()
+    
+    def import_parts(self):
+        """Импортировать каталог поставщика"""
+        if import_catalog(self):
             self.load_parts()
     
+    def selected_part(self):
+        """Запись выбранной в таблице запчасти или None"""
+        return self.parts_model.part_at(self.parts_table.currentIndex().row())
+    
     def edit_part(self):
         """Редактировать выбранную запчасть"""
-        current_row = self.parts_table.currentRow()
-        if current_row < 0:
+        part = self.selected_part()
+        if part is None:
             QMessageBox.warning(self, "Предупреждение", "Выберите запчасть для редактирования")
             return
         
-        # Получаем ID запчасти
-        part_id = int(self.parts_table.item(current_row, 0).text())
-        part_data = db.get_part_by_id(part_id)
-        
+        # Перечитываем запчасть: строка таблицы могла устареть
+        task = self.worker.submit(db.get_part_by_id, part['id'])
+        task.finished.connect(self.open_edit_dialog)
+    
+    def open_edit_dialog(self, part_data):
+        """Открыть диалог редактирования для загруженной запчасти"""
         if part_data:
             dialog = EditPartDialog(part_data, self)
             if dialog.exec() == QDialog.Accepted:
-                self.load_parts()
+                self.show_part_change(part_data, dialog.saved_part)
         else:
             QMessageBox.warning(self, "Ошибка", "Не удалось загрузить данные запчасти")
     
     def delete_part(self):
         """Удалить выбранную запчасть"""
-        current_row = self.parts_table.currentRow()
-        if current_row < 0:
+        part = self.selected_part()
+        if part is None:
             QMessageBox.warning(self, "Предупреждение", "Выберите запчасть для удаления")
             return
         
         # Получаем данные запчасти
-        article = self.parts_table.item(current_row, 1).text()
-        name = self.parts_table.item(current_row, 2).text()
+        article = part['article']
+        name = part['name']
         
         # Подтверждение удаления
         reply = QMessageBox.question(
@@ -221,13 +393,17 @@ class PartsWidget(QWidget):
         )
         
         if reply == QMessageBox.Yes:
-            part_id = int(self.parts_table.item(current_row, 0).text())
-            
-            if db.delete_part(part_id):
-                QMessageBox.information(self, "Успех", "Запчасть успешно удалена!")
-                self.load_parts()
-            else:
-                QMessageBox.warning(self, "Ошибка", "Не удалось удалить запчасть")
+            task = self.worker.submit_write(db.delete_part_record, part['id'])
+            task.finished.connect(self.on_part_deleted)
+    
+    def on_part_deleted(self, part):
+        if part is not None:
+            self.apply_part_change(part, None)
+            QMessageBox.information(self, "Успех", "Запчасть успешно удалена!")
+        else:
+            QMessageBox.warning(self, "Ошибка",
+                                "Не удалось удалить запчасть.\n"
+                                "Запчасть, по которой есть продажи или поступления, удалить нельзя.")
 
 
 class StatisticsWidget(QWidget):
@@ -235,9 +411,21 @@ class StatisticsWidget(QWidget):
     
     def __init__(self):
         super().__init__()
+        self.load_task = None
         self.setup_ui()
+    
+    def showEvent(self, event):
+        """Статистика загружается, когда вкладку открывают"""
+        super().showEvent(event)
         self.load_statistics()
     
+    def hideEvent(self, event):
+        """Скрытой вкладке незачем дожидаться статистики"""
+        super().hideEvent(event)
+        if self.load_task is not None:
+            self.load_task.cancel()
+            self.load_task = None
+    
     def setup_ui(self):
         layout = QVBoxLayout(self)
         
@@ -287,35 +475,45 @@ class StatisticsWidget(QWidget):
         
         return group
     
+    def refresh_if_visible(self, part_ids=None):
+        """Данные изменились: обновить статистику, если вкладка открыта"""
+        if self.isVisible():
+            self.load_statistics()
+    
     def load_statistics(self):
-        """Загрузить статистику"""
-        parts = db.get_all_parts()
+        """Загрузить статистику (агрегаты считает БД, запрос выполняется в фоне)"""
+        if self.load_task is not None:
+            self.load_task.cancel()
+        
+        self.load_task = get_db_worker().submit(
+            db.get_statistics, top_brands=10, low_stock_limit=20)
+        self.load_task.finished.connect(self.show_statistics)
+    
+    def show_statistics(self, stats):
+        """Показать статистику, посчитанную get_statistics"""
+        self.load_task = None
         
         # Общая статистика
-        self.update_general_stats(parts)
+        self.update_general_stats(stats['totals'])
         
         # Статистика по категориям
-        self.update_category_stats(parts)
+        self.update_category_stats(stats['categories'])
         
         # Статистика по маркам
-        self.update_brand_stats(parts)
+        self.update_brand_stats(stats['brands'])
         
         # Низкие остатки
-        self.update_low_stock_stats(parts)
+        self.update_low_stock_stats(stats['low_stock'], stats['low_stock_count'])
     
-    def update_general_stats(self, parts):
+    def update_general_stats(self, totals):
         """Обновить общую статистику"""
-        total_parts = len(parts)
-        total_quantity = sum(part['quantity'] for part in parts)
-        total_buy_value = sum(float(part['buy_price']) * part['quantity'] for part in parts)
-        total_sell_value = sum(float(part['sell_price']) * part['quantity'] for part in parts)
-        potential_profit = total_sell_value - total_buy_value
+        potential_profit = totals['sell_value'] - totals['buy_value']
         
         stats_text = f"""
-        🔢 Всего наименований: {total_parts}
-        📦 Общее количество: {total_quantity} шт.
-        💸 Закупочная стоимость: {total_buy_value:.2f} ₽
-        💰 Розничная стоимость: {total_sell_value:.2f} ₽
+        🔢 Всего наименований: {totals['count']}
+        📦 Общее количество: {totals['quantity']} шт.
+        💸 Закупочная стоимость: {totals['buy_value']:.2f} ₽
+        💰 Розничная стоимость: {totals['sell_value']:.2f} ₽
         📈 Потенциальная прибыль: {potential_profit:.2f} ₽
         """
         
@@ -323,70 +521,40 @@ class StatisticsWidget(QWidget):
         label = layout.itemAt(0).widget()
         label.setText(stats_text.strip())
     
-    def update_category_stats(self, parts):
+    def format_group_stats(self, groups):
+        """Строки статистики по группам (категориям или маркам)"""
+        return [
+            f"• {group['key']}: {group['count']} наим., "
+            f"{group['quantity']} шт., {group['value']:.2f} ₽"
+            for group in groups
+        ]
+    
+    def update_category_stats(self, categories):
         """Обновить статистику по категориям"""
-        categories = {}
-        
-        for part in parts:
-            category = part['category']
-            if category not in categories:
-                categories[category] = {'count': 0, 'quantity': 0, 'value': 0}
-            
-            categories[category]['count'] += 1
-            categories[category]['quantity'] += part['quantity']
-            categories[category]['value'] += float(part['sell_price']) * part['quantity']
-        
-        stats_lines = []
-        for category, stats in sorted(categories.items()):
-            stats_lines.append(
-                f"• {category}: {stats['count']} наим., "
-                f"{stats['quantity']} шт., {stats['value']:.2f} ₽"
-            )
+        stats_lines = self.format_group_stats(categories)
         
         layout = self.category_stats.layout()
         label = layout.itemAt(0).widget()
         label.setText('\n'.join(stats_lines) if stats_lines else "Нет данных")
     
-    def update_brand_stats(self, parts):
-        """Обновить статистику по маркам"""
-        brands = {}
-        
-        for part in parts:
-            brand = part['brand']
-            if brand not in brands:
-                brands[brand] = {'count': 0, 'quantity': 0, 'value': 0}
-            
-            brands[brand]['count'] += 1
-            brands[brand]['quantity'] += part['quantity']
-            brands[brand]['value'] += float(part['sell_price']) * part['quantity']
-        
-        # Сортируем по стоимости (убывание)
-        sorted_brands = sorted(brands.items(), key=lambda x: x[1]['value'], reverse=True)
-        
-        stats_lines = []
-        for brand, stats in sorted_brands[:10]:  # Топ 10
-            stats_lines.append(
-                f"• {brand}: {stats['count']} наим., "
-                f"{stats['quantity']} шт., {stats['value']:.2f} ₽"
-            )
+    def update_brand_stats(self, brands):
+        """Обновить статистику по маркам (топ по стоимости уже отобран БД)"""
+        stats_lines = self.format_group_stats(brands)
         
         layout = self.brand_stats.layout()
         label = layout.itemAt(0).widget()
         label.setText('\n'.join(stats_lines) if stats_lines else "Нет данных")
     
-    def update_low_stock_stats(self, parts):
+    def update_low_stock_stats(self, low_stock, low_stock_count):
         """Обновить статистику низких остатков"""
-        low_stock_parts = [part for part in parts if part['quantity'] <= 5]
-        low_stock_parts.sort(key=lambda x: x['quantity'])
-        
-        if low_stock_parts:
+        if low_stock_count:
             stats_lines = []
-            for part in low_stock_parts[:20]:  # Показываем до 20 позиций
+            for part in low_stock:
                 stats_lines.append(
                     f"• {part['article']} ({part['name']}): {part['quantity']} шт."
                 )
             
-            stats_text = f"⚠️ Найдено {len(low_stock_parts)} позиций с низким остатком:\n\n" + '\n'.join(stats_lines)
+            stats_text = f"⚠️ Найдено {low_stock_count} позиций с низким остатком:\n\n" + '\n'.join(stats_lines)
         else:
             stats_text = "✅ Все запчасти в достаточном количестве!"
         
@@ -398,14 +566,24 @@ class StatisticsWidget(QWidget):
 class MainWindow(QMainWindow):
     """Главное окно приложения"""
     
-    def __init__(self):
+    def __init__(self, started_at=None):
         super().__init__()
         self.setWindowTitle(APP_NAME)
         self.setMinimumSize(1200, 800)
         
+        # Замер запуска: этап -> мс от started_at
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.startup_times = {}
+        self.parts_widget = None
+        
         # Инициализация базы данных
+        db.set_pragma_profile(get_settings().database_pragma_profile)
         db.init_database()
         
+        # Опрос базы на изменения: открытые вкладки обновляют только
+        # изменившиеся строки
+        self.auto_refresher = AutoRefresher(db, get_settings().auto_refresh_interval, self)
+        
         self.setup_ui()
         self.setup_menu()
         
@@ -414,6 +592,13 @@ class MainWindow(QMainWindow):
         
         # Статусная строка
         self.statusBar().showMessage("Готов к работе")
+        
+        # Индикатор фоновых запросов к базе данных
+        self.db_spinner = LoadingSpinner(16)
+        self.db_spinner.setToolTip("Выполняется запрос к базе данных")
+        self.db_spinner.hide()
+        self.statusBar().addPermanentWidget(self.db_spinner)
+        get_db_worker().busy_changed.connect(self.set_db_busy)
     
     def setup_ui(self):
         """Настройка интерфейса"""
@@ -431,13 +616,16 @@ class MainWindow(QMainWindow):
         self.tabs = QTabWidget()
         self.tabs.setProperty("class", "main-tabs")
         
+        # Содержимое вкладок создаётся при первом открытии
         # Вкладка управления запчастями
-        self.parts_widget = PartsWidget(self)
-        self.tabs.addTab(self.parts_widget, "🔧 Запчасти")
+        self.parts_tab = LazyTab(lambda: PartsWidget(self))
+        self.parts_tab.created.connect(self.on_parts_created)
+        self.tabs.addTab(self.parts_tab, "🔧 Запчасти")
         
         # Вкладка статистики
-        self.stats_widget = StatisticsWidget()
-        self.tabs.addTab(self.stats_widget, "📊 Статистика")
+        self.stats_tab = LazyTab(StatisticsWidget)
+        self.stats_tab.created.connect(self.on_stats_created)
+        self.tabs.addTab(self.stats_tab, "📊 Статистика")
         
         layout.addWidget(self.tabs)
     
@@ -467,9 +655,45 @@ class MainWindow(QMainWindow):
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
     
+    def on_parts_created(self, parts_widget):
+        """Вкладка запчастей создана - ждём первую страницу для замера запуска"""
+        self.parts_widget = parts_widget
+        parts_widget.parts_model.page_loaded.connect(
+            lambda: self.mark_startup('first_data'))
+        self.auto_refresher.parts_changed.connect(parts_widget.refresh_changed_parts)
+    
+    def on_stats_created(self, stats_widget):
+        self.auto_refresher.parts_changed.connect(stats_widget.refresh_if_visible)
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Окно отрисуется, когда очередь событий дойдёт до таймера
+        QTimer.singleShot(0, lambda: self.mark_startup('window_shown'))
+    
+    def mark_startup(self, stage):
+        """Запомнить время этапа запуска; когда пройдены все - вывести отчёт"""
+        if stage in self.startup_times:
+            return
+        self.startup_times[stage] = (time.perf_counter() - self.started_at) * 1000
+        
+        if len(self.startup_times) == len(STARTUP_STAGES):
+            parts_count = db.get_inventory_totals()['count']
+            print(f"⏱ Запуск ({parts_count} запчастей): окно показано через "
+                  f"{self.startup_times['window_shown']:.0f} мс, первые данные через "
+                  f"{self.startup_times['first_data']:.0f} мс")
+    
+    def set_db_busy(self, busy):
+        """Показать или скрыть индикатор загрузки"""
+        self.db_spinner.setVisible(busy)
+        if busy:
+            self.db_spinner.start()
+        else:
+            self.db_spinner.stop()
+    
     def show_settings(self):
         """Показать настройки"""
         show_settings_dialog(self)
+        self.auto_refresher.set_interval(get_settings().auto_refresh_interval)
     
     def show_about(self):
         """Показать информацию о программе"""
@@ -493,12 +717,17 @@ class MainWindow(QMainWindow):
 
 def main():
     """Главная функция приложения"""
+    started_at = time.perf_counter()
     app = QApplication(sys.argv)
     app.setApplicationName(APP_NAME)
     app.setApplicationVersion("1.0.0")
     
+    # При выходе дожидаемся фоновых запросов и закрываем соединения с БД
+    app.aboutToQuit.connect(lambda: get_db_worker().wait_for_done())
+    app.aboutToQuit.connect(db.close)
+    
     # Создание и показ главного окна
-    window = MainWindow()
+    window = MainWindow(started_at)
     window.show()
     
     # Запуск приложения
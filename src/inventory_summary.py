@@ -0,0 +1,196 @@
+"""
+Сводные таблицы остатков склада
+
+Итоги, которые показывают вкладка «Статистика» и строка итогов каталога,
+хранятся готовыми и поддерживаются триггерами на parts при каждой
+вставке, изменении и удалении:
+
+- inventory_totals: одна строка с итогами по складу (наименований, штук,
+  закупочная и розничная стоимость остатков, позиций с низким остатком);
+- category_summary, brand_summary, car_model_summary: те же итоги по
+  каждой категории, марке и модели; ключи этих таблиц - заодно списки
+  различных значений для подсказок ввода.
+
+Поэтому чтение статистики не зависит от размера каталога. Стоимости -
+целые копейки (см. money): триггеры и пересчёт дают одни и те же суммы
+независимо от порядка сложения. Порог низкого остатка вшит в триггеры:
+после его изменения нужно пересоздать сводки (rebuild_inventory_summary).
+check_inventory_summary сверяет сводки с пересчётом по parts.
+"""
+
+import sqlite3
+from typing import List
+
+# Остаток, при котором запчасть считается заканчивающейся
+LOW_STOCK_THRESHOLD = 5
+
+# Колонка parts -> сводная таблица по её значениям
+SUMMARY_GROUPS = (('category', 'category_summary'), ('brand', 'brand_summary'),
+                  ('car_model', 'car_model_summary'))
+
+# Триггеры на parts, которые ведут сводки
+SUMMARY_TRIGGERS = ('inventory_summary_ai', 'inventory_summary_ad', 'inventory_summary_au')
+
+# Итоги по строкам parts: одинаково для таблицы итогов и групп
+_AGGREGATES = '''
+    COUNT(*),
+    COALESCE(SUM(quantity), 0),
+    COALESCE(SUM(buy_price * quantity), 0),
+    COALESCE(SUM(sell_price * quantity), 0)
+'''
+
+_TRIGGER_COLUMNS = 'category, brand, car_model, quantity, buy_price, sell_price'
+
+
+def _group_delta(table: str, key: str, row: str, sign: str) -> str:
+    """Прибавить (sign='+') или вычесть ('-') строку row к группе key"""
+    return f'''
+        INSERT INTO {table} (key, count, quantity, buy_value, sell_value)
+        VALUES ({row}.{key}, {sign}1, {sign}{row}.quantity,
+                {sign}{row}.buy_price * {row}.quantity,
+                {sign}{row}.sell_price * {row}.quantity)
+        ON CONFLICT (key) DO UPDATE SET
+            count = count + excluded.count,
+            quantity = quantity + excluded.quantity,
+            buy_value = buy_value + excluded.buy_value,
+            sell_value = sell_value + excluded.sell_value;
+    '''
+
+
+def _totals_delta(row: str, sign: str) -> str:
+    """Прибавить или вычесть строку row к итогам склада"""
+    return f'''
+        UPDATE inventory_totals SET
+            count = count {sign} 1,
+            quantity = quantity {sign} {row}.quantity,
+            buy_value = buy_value {sign} {row}.buy_price * {row}.quantity,
+            sell_value = sell_value {sign} {row}.sell_price * {row}.quantity,
+            low_stock = low_stock {sign} ({row}.quantity <= {LOW_STOCK_THRESHOLD})
+        WHERE id = 1;
+    '''
+
+
+def _trigger_body(rows) -> str:
+    """Тело триггера: применить (строка, знак) ко всем сводкам"""
+    statements = []
+    for row, sign in rows:
+        statements.append(_totals_delta(row, sign))
+        for column, table in SUMMARY_GROUPS:
+            statements.append(_group_delta(table, column, row, sign))
+    # Опустевшие группы удаляются, чтобы не показывать нулевые строки
+    for row, sign in rows:
+        if sign == '-':
+            for column, table in SUMMARY_GROUPS:
+                statements.append(
+                    f'DELETE FROM {table} WHERE key = {row}.{column} AND count = 0;')
+    return '\n'.join(statements)
+
+
+def create_inventory_summary(cursor: sqlite3.Cursor):
+    """Создать сводные таблицы, триггеры и заполнить сводки по parts"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS inventory_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        count INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        buy_value INTEGER NOT NULL,
+        sell_value INTEGER NOT NULL,
+        low_stock INTEGER NOT NULL
+    )
+    ''')
+    for _, table in SUMMARY_GROUPS:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            buy_value INTEGER NOT NULL,
+            sell_value INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''')
+        # Топ групп по стоимости остатков
+        cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{table}_value ON {table} (sell_value)
+        ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS inventory_summary_ai AFTER INSERT ON parts BEGIN
+        {_trigger_body([('new', '+')])}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS inventory_summary_ad AFTER DELETE ON parts BEGIN
+        {_trigger_body([('old', '-')])}
+    END
+    ''')
+    # Правка названия или описания сводки не трогает
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS inventory_summary_au
+    AFTER UPDATE OF {_TRIGGER_COLUMNS} ON parts BEGIN
+        {_trigger_body([('old', '-'), ('new', '+')])}
+    END
+    ''')
+
+    rebuild_inventory_summary(cursor)
+
+
+def drop_inventory_summary_triggers(cursor: sqlite3.Cursor):
+    """Удалить триггеры сводок (перед созданием заново с другим набором групп)"""
+    for trigger in SUMMARY_TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def drop_inventory_summary(cursor: sqlite3.Cursor):
+    """Удалить триггеры и сводные таблицы (перед созданием с другой схемой)"""
+    drop_inventory_summary_triggers(cursor)
+    cursor.execute('DROP TABLE IF EXISTS inventory_totals')
+    for _, table in SUMMARY_GROUPS:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def rebuild_inventory_summary(cursor: sqlite3.Cursor):
+    """Пересчитать все сводки по parts (выполнять в транзакции записи)"""
+    cursor.execute('DELETE FROM inventory_totals')
+    cursor.execute(f'''
+    INSERT INTO inventory_totals (id, count, quantity, buy_value, sell_value, low_stock)
+    SELECT 1, {_AGGREGATES}, COALESCE(SUM(quantity <= {LOW_STOCK_THRESHOLD}), 0)
+    FROM parts
+    ''')
+    for column, table in SUMMARY_GROUPS:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'''
+        INSERT INTO {table} (key, count, quantity, buy_value, sell_value)
+        SELECT {column}, {_AGGREGATES}
+        FROM parts
+        GROUP BY {column}
+        ''')
+
+
+def check_inventory_summary(conn: sqlite3.Connection) -> List[str]:
+    """
+    Сверить сводки с пересчётом по parts.
+    Возвращает описания расхождений (пустой список - сводки верны).
+    """
+    problems = []
+
+    stored = conn.execute('''
+    SELECT count, quantity, buy_value, sell_value, low_stock
+    FROM inventory_totals WHERE id = 1
+    ''').fetchone()
+    actual = conn.execute(f'''
+    SELECT {_AGGREGATES}, COALESCE(SUM(quantity <= {LOW_STOCK_THRESHOLD}), 0)
+    FROM parts
+    ''').fetchone()
+    if stored != actual:
+        problems.append(f"inventory_totals: {stored} вместо {actual}")
+
+    for column, table in SUMMARY_GROUPS:
+        stored = {row[0]: row[1:] for row in conn.execute(
+            f'SELECT key, count, quantity, buy_value, sell_value FROM {table}')}
+        actual = {row[0]: row[1:] for row in conn.execute(
+            f'SELECT {column}, {_AGGREGATES} FROM parts GROUP BY {column}')}
+        for key in sorted(stored.keys() | actual.keys()):
+            if stored.get(key) != actual.get(key):
+                problems.append(f"{table}[{key}]: {stored.get(key)} вместо {actual.get(key)}")
+
+    return problems
@@ -1,5 +1,14 @@
 import os
-from peewee import SqliteDatabase
+from typing import Optional
+from peewee import DatabaseProxy, SqliteDatabase
+
+from search_index import (ARTICLE_KEY_FUNCTION, CASEFOLD_FUNCTION, casefold_text,
+                          create_article_key_column, create_casefold_columns,
+                          create_parts_fts, drop_casefold_indexes, has_parts_fts,
+                          normalize_article)
+from money import convert_money_columns
+from part_links import rebuild_item_table, table_columns
+from sqlite_pragmas import get_pragmas
 
 # Получаем путь к директории данных приложения
 def get_data_dir():
@@ -17,20 +26,64 @@ def get_data_dir():
 # Путь к файлу базы данных
 DB_PATH = os.path.join(get_data_dir(), 'autoparts.db')
 
-# Инициализация базы данных
-database = SqliteDatabase(DB_PATH)
+# Модели привязаны к прокси, чтобы реальную базу можно было
+# переинициализировать (другой профиль PRAGMA, тестовая БД)
+database = DatabaseProxy()
+
+def configure_database(pragma_profile: Optional[str] = None):
+    """Подключить базу по DB_PATH с профилем PRAGMA ('safe' или 'fast')"""
+    pragmas = get_pragmas(pragma_profile)
+    
+    if database.obj is not None and not database.is_closed():
+        database.close()
+    
+    sqlite_db = SqliteDatabase(DB_PATH, pragmas=pragmas)
+    # Функции, которые вызывают триггеры колонок parts.*_cf и article_key
+    sqlite_db.register_function(casefold_text, CASEFOLD_FUNCTION, 1, deterministic=True)
+    sqlite_db.register_function(normalize_article, ARTICLE_KEY_FUNCTION, 1, deterministic=True)
+    database.initialize(sqlite_db)
+
+configure_database()
 
-def init_database():
+def init_database(pragma_profile: Optional[str] = None):
     """Инициализация базы данных и создание таблиц"""
     from .part import Part
     from .sale import Sale, SaleItem
     
-    database.connect()
+    if pragma_profile is not None:
+        configure_database(pragma_profile)
+    
+    database.connect(reuse_if_open=True)
     database.create_tables([Part, Sale, SaleItem], safe=True)
+    
+    conn = database.connection()
+    
+    # Цены старой модели (DECIMAL, рубли) -> копейки; перестройка parts
+    # требует выключенной проверки ссылок (вне транзакции)
+    database.execute_sql('PRAGMA foreign_keys = OFF')
+    try:
+        with database.atomic():
+            convert_money_columns(conn.cursor())
+    finally:
+        database.execute_sql('PRAGMA foreign_keys = ON')
+    
+    with database.atomic():
+        # Колонка part старой модели -> внешний ключ part_id
+        if 'part' in table_columns(conn.cursor(), 'sale_items'):
+            rebuild_item_table(conn.cursor(), 'sale_items', ('sale_id', 'sales'),
+                               ('id', 'sale_id', 'quantity', 'price'),
+                               lambda cursor: SaleItem.create_table())
+        # Поисковые индексы для Part.search
+        create_casefold_columns(conn.cursor())
+        drop_casefold_indexes(conn.cursor())
+        create_article_key_column(conn.cursor())
+        if not has_parts_fts(conn):
+            create_parts_fts(conn.cursor())
+    
     database.close()
     
     print(f"База данных инициализирована: {DB_PATH}")
 
 def get_database():
     """Возвращает объект базы данных"""
-    return database 
\ No newline at end of file
+    return database
@@ -0,0 +1,12 @@
+from peewee import IntegerField
+
+from money import from_kopecks, to_kopecks
+
+class MoneyField(IntegerField):
+    """Денежная сумма: в базе целые копейки, в модели Money (рубли)"""
+    
+    def db_value(self, value):
+        return to_kopecks(value)
+    
+    def python_value(self, value):
+        return None if value is None else from_kopecks(value)
@@ -1,10 +1,13 @@
 from peewee import (
-    Model, CharField, IntegerField, DecimalField, TextField, 
-    DateTimeField
+    Model, CharField, IntegerField, TextField, DateTimeField
 )
 from .database import database
+from .fields import MoneyField
 from datetime import datetime
 
+from search_index import (CASEFOLD_COLUMNS, FTS_RANK, build_fts_query, casefold_text,
+                          normalize_article)
+
 class Part(Model):
     """Модель для хранения информации о запчастях"""
     
@@ -14,12 +17,22 @@ class Part(Model):
     car_model = CharField(max_length=100, verbose_name="Модель")
     category = CharField(max_length=100, verbose_name="Категория")
     quantity = IntegerField(default=0, verbose_name="Количество")
-    buy_price = DecimalField(max_digits=10, decimal_places=2, verbose_name="Закупочная цена")
-    sell_price = DecimalField(max_digits=10, decimal_places=2, verbose_name="Розничная цена")
+    buy_price = MoneyField(verbose_name="Закупочная цена")
+    sell_price = MoneyField(verbose_name="Розничная цена")
     description = TextField(null=True, verbose_name="Описание")
     created_at = DateTimeField(default=datetime.now, verbose_name="Дата создания")
     updated_at = DateTimeField(default=datetime.now, verbose_name="Дата обновления")
     
+    # Артикул без разделителей в верхнем регистре (см. normalize_article)
+    article_key = CharField(max_length=100, null=True, unique=True)
+    
+    # Регистронезависимые копии для поиска подстроки (casefold по Unicode);
+    # без индексов - подстрока ищется сканированием
+    name_cf = CharField(max_length=255, default='')
+    brand_cf = CharField(max_length=100, default='')
+    car_model_cf = CharField(max_length=100, default='')
+    category_cf = CharField(max_length=100, default='')
+    
     class Meta:
         database = database
         table_name = 'parts'
@@ -27,6 +40,9 @@ class Part(Model):
     def save(self, *args, **kwargs):
         """Переопределяем save для обновления времени изменения"""
         self.updated_at = datetime.now()
+        self.article_key = normalize_article(self.article)
+        for column in CASEFOLD_COLUMNS:
+            setattr(self, f'{column}_cf', casefold_text(getattr(self, column)))
         return super().save(*args, **kwargs)
     
     def __str__(self):
@@ -34,19 +50,36 @@ class Part(Model):
     
     @classmethod
     def search(cls, query):
-        """Поиск запчастей по артикулу, названию, марке или модели"""
+        """
+        Поиск запчастей по артикулу, названию, марке, модели, категории
+        и описанию через FTS5 (префиксы слов, ранжирование bm25).
+        Без индекса parts_fts - поиск подстроки по регистронезависимым полям.
+        """
+        match = build_fts_query(query)
+        if match is not None and cls._meta.database.table_exists('parts_fts'):
+            return cls.raw(f'''
+            SELECT parts.* FROM parts_fts
+            JOIN parts ON parts.id = parts_fts.rowid
+            WHERE parts_fts MATCH ?
+            ORDER BY {FTS_RANK}, parts.article
+            ''', match)
+        
+        folded = casefold_text(query)
         return cls.select().where(
             (cls.article.contains(query)) |
-            (cls.name.contains(query)) |
-            (cls.brand.contains(query)) |
-            (cls.car_model.contains(query))
+            (cls.name_cf.contains(folded)) |
+            (cls.brand_cf.contains(folded)) |
+            (cls.car_model_cf.contains(folded))
         )
     
     @classmethod
     def get_by_article(cls, article):
-        """Получить запчасть по артикулу"""
+        """Получить запчасть по артикулу (без учёта разделителей и регистра)"""
+        key = normalize_article(article)
+        if not key:
+            return None
         try:
-            return cls.get(cls.article == article)
+            return cls.get(cls.article_key == key)
         except cls.DoesNotExist:
             return None
     
@@ -1,14 +1,18 @@
 from peewee import (
-    Model, DateTimeField, DecimalField, ForeignKeyField, IntegerField
+    JOIN, Model, DateTimeField, ForeignKeyField, IntegerField, fn
 )
 from .database import database
+from .fields import MoneyField
+from .part import Part
 from datetime import datetime
 
+from money import Money, from_kopecks, to_kopecks
+
 class Sale(Model):
     """Модель для хранения информации о продажах"""
     
     date = DateTimeField(default=datetime.now, verbose_name="Дата продажи")
-    total = DecimalField(max_digits=10, decimal_places=2, verbose_name="Общая сумма")
+    total = MoneyField(verbose_name="Общая сумма")
     
     class Meta:
         database = database
@@ -17,34 +21,99 @@ class Sale(Model):
     def __str__(self):
         return f"Продажа #{self.id} от {self.date.strftime('%d.%m.%Y %H:%M')}"
     
+    @classmethod
+    def select_with_totals(cls):
+        """
+        Продажи с числом позиций (items_count) и суммой позиций
+        (items_total), посчитанными одним запросом с GROUP BY
+        """
+        return (cls
+                .select(cls,
+                        fn.COUNT(SaleItem.id).alias('items_count'),
+                        fn.COALESCE(fn.SUM(SaleItem.quantity * SaleItem.price), 0)
+                        .alias('items_total'))
+                .join(SaleItem, JOIN.LEFT_OUTER)
+                .group_by(cls.id))
+    
+    def _prefetched_items(self):
+        """Позиции, загруженные prefetch (список), или None"""
+        return self.__dict__.get('items')
+    
     @property
     def items_count(self):
         """Количество позиций в продаже"""
+        # Посчитано в select_with_totals или позиции уже загружены
+        if self.__dict__.get('_items_count') is not None:
+            return self._items_count
+        items = self._prefetched_items()
+        if items is not None:
+            return len(items)
         return self.items.count()
     
+    @items_count.setter
+    def items_count(self, value):
+        self._items_count = value
+    
+    @property
+    def items_total(self) -> Money:
+        """Сумма позиций продажи"""
+        if self.__dict__.get('_items_total') is not None:
+            return self._items_total
+        items = self._prefetched_items()
+        if items is not None:
+            return from_kopecks(sum(item.quantity * to_kopecks(item.price) for item in items))
+        return self._sum_items()
+    
+    @items_total.setter
+    def items_total(self, value):
+        # Сумма в SQL - целые копейки
+        self._items_total = from_kopecks(value)
+    
+    def _sum_items(self) -> Money:
+        """Сумма позиций одним запросом SUM (точно: цены в копейках)"""
+        total = (SaleItem
+                 .select(fn.COALESCE(fn.SUM(SaleItem.quantity * SaleItem.price), 0))
+                 .where(SaleItem.sale == self.id)
+                 .scalar())
+        return from_kopecks(total)
+    
     def calculate_total(self):
         """Пересчитать общую сумму на основе позиций"""
-        total = sum(item.total_price for item in self.items)
+        total = self._sum_items()
         self.total = total
-        self.save()
+        self.save(only=[Sale.total])
         return total
 
 class SaleItem(Model):
     """Модель для хранения позиций продажи"""
     
     sale = ForeignKeyField(Sale, backref='items', verbose_name="Продажа")
-    part = IntegerField(verbose_name="ID запчасти")  # Временно упростим
+    # Индексированный внешний ключ (колонка part_id, как в SimpleDatabase);
+    # NULL - только у позиций, чья запчасть была удалена до проверки ссылок
+    part = ForeignKeyField(Part, column_name='part_id', backref='sale_items', null=True,
+                           on_delete='RESTRICT', verbose_name="Запчасть")
     quantity = IntegerField(verbose_name="Количество")
-    price = DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена за единицу")
+    price = MoneyField(verbose_name="Цена за единицу")
     
     class Meta:
         database = database
         table_name = 'sale_items'
     
+    @classmethod
+    def select_with_parts(cls):
+        """
+        Позиции вместе с запчастями одним запросом (LEFT JOIN по индексу
+        part_id): item.part не обращается к базе
+        """
+        return (cls
+                .select(cls, Part)
+                .join(Part, JOIN.LEFT_OUTER)
+                .order_by(cls.id))
+    
     @property
     def total_price(self):
         """Общая стоимость позиции"""
         return self.quantity * self.price
     
     def __str__(self):
-        return f"Товар ID:{self.part} x{self.quantity} = {self.total_price} руб." 
\ No newline at end of file
+        return f"Товар ID:{self.part_id} x{self.quantity} = {self.total_price} руб." 
\ No newline at end of file
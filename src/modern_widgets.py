@@ -421,3 +421,32 @@ class ModernProgressBar(QWidget):
             
             painter.setBrush(QColor("#2196F3"))
             painter.drawRoundedRect(progress_rect, 4, 4)
+
+
+class LazyTab(QWidget):
+    """
+    Вкладка, содержимое которой создаётся при первом показе.
+    factory() вызывается один раз и возвращает виджет содержимого.
+    """
+    
+    # Содержимое создано (виджет содержимого)
+    created = Signal(object)
+    
+    def __init__(self, factory, parent=None):
+        super().__init__(parent)
+        self.factory = factory
+        self.content = None
+        self.layout_ = QVBoxLayout(self)
+        self.layout_.setContentsMargins(0, 0, 0, 0)
+    
+    def ensure_created(self):
+        """Создать содержимое, если оно ещё не создано"""
+        if self.content is None:
+            self.content = self.factory()
+            self.layout_.addWidget(self.content)
+            self.created.emit(self.content)
+        return self.content
+    
+    def showEvent(self, event):
+        self.ensure_created()
+        super().showEvent(event)
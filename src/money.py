@@ -0,0 +1,171 @@
+"""
+Денежные суммы
+
+В базе все суммы (цены, итоги документов, стоимость остатков в сводках)
+хранятся целым числом копеек в колонках INTEGER: SUM в SQL точен и
+не зависит от порядка сложения, сравнение итогов - простое равенство.
+
+Наружу суммы выходят как Money - Decimal в рублях с двумя знаками:
+f"{price:.2f}", float(price) и сравнение с числами работают как раньше.
+На вход методы принимают рубли в любом виде (int, float, str, Decimal);
+to_kopecks округляет их до копейки.
+"""
+
+import re
+import sqlite3
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+
+from part_links import column_type, table_columns
+
+# Колонки (и псевдонимы в запросах) с суммами в копейках
+MONEY_COLUMNS = frozenset(('buy_price', 'sell_price', 'price', 'total',
+                           'buy_value', 'sell_value', 'value', 'total_value'))
+
+# Денежные колонки таблиц SimpleDatabase
+MONEY_TABLES = {
+    'parts': ('buy_price', 'sell_price'),
+    'sales': ('total',),
+    'sale_items': ('price',),
+    'receipts': ('total',),
+    'receipt_items': ('buy_price',),
+}
+
+_ONE = Decimal(1)
+
+
+def _money_operation(operation):
+    """
+    Арифметика Money с числами: float приводится к Decimal через str
+    (как в to_kopecks), результат округляется до копейки
+    """
+    def method(self, other):
+        if isinstance(other, float):
+            other = Decimal(str(other))
+        result = operation(self, other)
+        if result is NotImplemented:
+            return result
+        return from_kopecks(to_kopecks(result))
+    return method
+
+
+class Money(Decimal):
+    """
+    Сумма в рублях, точная до копейки. Сложение, вычитание и умножение
+    принимают и float (price * 1.2) и дают Money, округлённую до копейки
+    """
+
+    __slots__ = ()
+
+    __add__ = _money_operation(Decimal.__add__)
+    __radd__ = _money_operation(Decimal.__radd__)
+    __sub__ = _money_operation(Decimal.__sub__)
+    __rsub__ = _money_operation(Decimal.__rsub__)
+    __mul__ = _money_operation(Decimal.__mul__)
+    __rmul__ = _money_operation(Decimal.__rmul__)
+
+    @classmethod
+    def from_kopecks(cls, kopecks: int) -> 'Money':
+        return from_kopecks(kopecks)
+
+    @property
+    def kopecks(self) -> int:
+        """Сумма в копейках"""
+        return int(self.scaleb(2))
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+@lru_cache(maxsize=65536)
+def from_kopecks(kopecks: int) -> Money:
+    """Копейки из базы -> Money (цены повторяются, значения кэшируются)"""
+    return Money(Decimal(kopecks).scaleb(-2))
+
+
+def to_kopecks(value) -> Optional[int]:
+    """Рубли (int, float, str, Decimal, Money) -> копейки; None остаётся None"""
+    if value is None:
+        return None
+    if isinstance(value, Money):
+        return value.kopecks
+    if type(value) is int:
+        return value * 100
+    # float через str: 0.1 + 0.2 даёт 0.30, а не 0.3000000000000000444
+    amount = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int(amount.scaleb(2).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def money_params(values: Dict) -> Dict:
+    """Копия параметров запроса с денежными значениями в копейках"""
+    return {key: to_kopecks(value) if key in MONEY_COLUMNS else value
+            for key, value in values.items()}
+
+
+def _retype_table(cursor: sqlite3.Cursor, table: str, columns: Sequence[str]):
+    """
+    Перестроить таблицу: колонки columns становятся INTEGER, значения
+    переводятся из рублей в копейки. id, значение AUTOINCREMENT, индексы
+    и триггеры таблицы сохраняются. Проверка внешних ключей на время
+    перестройки должна быть выключена (см. db_migrations.apply_migrations).
+    """
+    sql = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()[0]
+    dependents = [row[0] for row in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+        "AND sql IS NOT NULL", (table,)).fetchall()]
+
+    new = f'{table}_new'
+    sql = re.sub(rf'^(CREATE TABLE\s+(?:IF NOT EXISTS\s+)?)(["`]?){table}\2', rf'\g<1>{new}',
+                 sql, count=1, flags=re.IGNORECASE)
+    for column in columns:
+        # buy_price REAL, "price" DECIMAL(10, 2) и т.п. -> INTEGER
+        sql = re.sub(rf'(?<!\w)(["`]?){column}\1(\s+)[A-Za-z]+(?:\s*\([^)]*\))?',
+                     rf'\g<1>{column}\g<1>\g<2>INTEGER', sql, count=1)
+    cursor.execute(sql)
+
+    names = table_columns(cursor, table)
+    values = [f'CAST(ROUND({name} * 100) AS INTEGER)' if name in columns else name
+              for name in names]
+    cursor.execute(f"INSERT INTO {new} ({', '.join(names)}) "
+                   f"SELECT {', '.join(values)} FROM {table}")
+
+    sequence = cursor.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)
+    ).fetchone() if _has_sequence(cursor) else None
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {new} RENAME TO {table}')
+    if sequence is not None:
+        # Номера удалённых строк не выдаются повторно
+        cursor.execute('DELETE FROM sqlite_sequence WHERE name = ?', (table,))
+        cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                       (table, sequence[0]))
+    for dependent in dependents:
+        cursor.execute(dependent)
+
+
+def _has_sequence(cursor: sqlite3.Cursor) -> bool:
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'"
+    ).fetchone() is not None
+
+
+def convert_money_columns(cursor: sqlite3.Cursor) -> int:
+    """
+    Перевести денежные колонки MONEY_TABLES из рублей (REAL, DECIMAL)
+    в копейки (INTEGER). Колонка, объявленная INTEGER, уже хранит копейки
+    (её создали SimpleDatabase или MoneyField моделей) и не пересчитывается;
+    отсутствующие таблицы пропускаются. Перестройки таблиц до этого перевода
+    сохраняют объявленный тип денежных колонок. Возвращает число
+    перестроенных таблиц.
+    """
+    converted = 0
+    for table, columns in MONEY_TABLES.items():
+        pending = [column for column in columns
+                   if column_type(cursor, table, column) not in (None, 'INTEGER')]
+        if pending:
+            _retype_table(cursor, table, pending)
+            converted += 1
+    return converted
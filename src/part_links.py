@@ -0,0 +1,94 @@
+"""
+Ссылки позиций документов на запчасти
+
+sale_items.part_id и receipt_items.part_id - внешние ключи на parts (id)
+с индексом. Ссылки проверяет SQLite (PRAGMA foreign_keys = ON во всех
+профилях sqlite_pragmas): позицию с несуществующей запчастью не вставить,
+а запчасть, по которой есть продажи или поступления, не удалить
+(ON DELETE RESTRICT).
+
+В старых базах ограничение было объявлено, но не проверялось, а модель
+SaleItem хранила id запчасти в колонке part без ссылки. Такие таблицы
+перестраиваются (rebuild_item_table): ссылки на несуществующие запчасти
+очищаются (NULL), позиции без документа удаляются.
+"""
+
+import sqlite3
+from typing import Callable, Optional, Sequence, Tuple
+
+
+def table_columns(cursor: sqlite3.Cursor, table: str) -> Sequence[str]:
+    """Имена колонок таблицы"""
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+
+
+def column_type(cursor: sqlite3.Cursor, table: str, column: str) -> Optional[str]:
+    """Объявленный тип колонки (в верхнем регистре) или None, если колонки нет"""
+    for row in cursor.execute(f'PRAGMA table_info({table})'):
+        if row[1] == column:
+            return row[2].upper()
+    return None
+
+
+def rename_legacy_part_column(cursor: sqlite3.Cursor) -> bool:
+    """
+    Колонка part старой модели SaleItem -> part_id, чтобы индексы и
+    запросы по part_id работали до перестройки таблицы. Ссылки при этом
+    не проверяются - их очищает rebuild_item_table.
+    Возвращает True, если колонка была переименована.
+    """
+    columns = table_columns(cursor, 'sale_items')
+    if 'part' not in columns or 'part_id' in columns:
+        return False
+    cursor.execute('ALTER TABLE sale_items RENAME COLUMN part TO part_id')
+    return True
+
+
+def rebuild_item_table(cursor: sqlite3.Cursor, table: str, document: Tuple[str, str],
+                       columns: Sequence[str],
+                       create: Callable[[sqlite3.Cursor], None]) -> Tuple[int, int]:
+    """
+    Перестроить таблицу позиций с внешним ключом part_id (в транзакции записи).
+
+    document - (колонка, таблица) документа, например ('sale_id', 'sales');
+    columns - остальные переносимые колонки; create(cursor) создаёт новую
+    таблицу table с индексами. id запчасти берётся из part_id или из
+    колонки part старой модели SaleItem.
+    Возвращает (очищенных ссылок, удалённых позиций).
+    """
+    old_columns = table_columns(cursor, table)
+    source = 'part_id' if 'part_id' in old_columns else 'part'
+    document_column, document_table = document
+    old = f'{table}_old'
+
+    # Индексы уходят вместе со старой таблицей, новые создаёт create()
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {old}')
+    for (index,) in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+            "AND sql IS NOT NULL", (old,)).fetchall():
+        cursor.execute(f'DROP INDEX {index}')
+    create(cursor)
+
+    orphans, dropped = cursor.execute(f'''
+    SELECT COALESCE(SUM(o.{source} IS NOT NULL AND p.id IS NULL), 0),
+           COALESCE(SUM(d.id IS NULL), 0)
+    FROM {old} o
+    LEFT JOIN parts p ON p.id = CAST(o.{source} AS INTEGER)
+    LEFT JOIN {document_table} d ON d.id = o.{document_column}
+    ''').fetchone()
+
+    names = ', '.join(columns)
+    selected = ', '.join(f'o.{column}' for column in columns)
+    cursor.execute(f'''
+    INSERT INTO {table} ({names}, part_id)
+    SELECT {selected}, p.id
+    FROM {old} o
+    LEFT JOIN parts p ON p.id = CAST(o.{source} AS INTEGER)
+    WHERE o.{document_column} IN (SELECT id FROM {document_table})
+    ''')
+    cursor.execute(f'DROP TABLE {old}')
+
+    if orphans or dropped:
+        print(f"⚠️ {table}: очищено ссылок на несуществующие запчасти - {orphans}, "
+              f"удалено позиций без документа - {dropped}")
+    return orphans, dropped
@@ -2,14 +2,96 @@ from __future__ import annotations
 
 from PySide6.QtWidgets import (
     QDialog, QFormLayout, QLineEdit, QComboBox, QSpinBox,
-    QDoubleSpinBox, QTextEdit, QPushButton, QHBoxLayout, QMessageBox
+    QDoubleSpinBox, QTextEdit, QPushButton, QHBoxLayout, QMessageBox,
+    QFileDialog, QProgressDialog, QCompleter
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QThread, QEventLoop, Signal, QStringListModel
 
+from catalog_import import count_catalog_rows, read_catalog
 from database_simple import db
+from db_worker import get_db_worker
+
+# Сколько ошибок импорта показывать в итоговом сообщении
+IMPORT_ERRORS_SHOWN = 10
+
+# Категории для выбора, пока в базе нет ни одной
+DEFAULT_CATEGORIES = [
+    "Двигатель", "Трансмиссия", "Тормозная система",
+    "Подвеска", "Электрика", "Кузов", "Салон",
+    "Универсальные", "Аксессуары", "Прочее"
+]
+
+
+def attach_completer(line_edit: QLineEdit, column: str) -> QCompleter:
+    """
+    Подсказки по началу ввода из значений колонки в базе (category,
+    brand, car_model). Значения загружаются в фоне - поле доступно сразу.
+    """
+    completer = QCompleter(line_edit)
+    completer.setCaseSensitivity(Qt.CaseInsensitive)
+    # Значения приходят отсортированными - подсказки ищутся двоичным поиском
+    completer.setModelSorting(QCompleter.CaseInsensitivelySortedModel)
+    completer.setModel(QStringListModel(completer))
+    line_edit.setCompleter(completer)
+
+    task = get_db_worker().submit(db.get_distinct_values, column)
+    task.finished.connect(completer.model().setStringList)
+    return completer
+
+
+def load_categories(combo: QComboBox):
+    """Заполнить список категорий значениями из базы (в фоне)"""
+    combo.addItems(DEFAULT_CATEGORIES)
+    task = get_db_worker().submit(db.get_distinct_values, 'category')
+    task.finished.connect(lambda categories: _set_categories(combo, categories))
+
+
+def _set_categories(combo: QComboBox, categories):
+    if not categories:
+        return
+    # Введённый или выбранный до загрузки текст сохраняется
+    text = combo.currentText()
+    combo.clear()
+    combo.addItems(categories)
+    combo.setEditText(text)
+
+
+class _BackgroundSaveMixin:
+    """
+    Сохранение диалога в фоне (DbWorker.submit_write). Пока запись не
+    завершена, кнопки заблокированы, а диалог не закрывается: результат
+    не придёт в закрытое окно, и сохранение всегда будет подтверждено.
+    """
+
+    _save_task = None
+
+    def _start_save(self, func, **kwargs):
+        self._set_saving(True)
+        task = get_db_worker().submit_write(func, **kwargs)
+        task.finished.connect(self._finish_save)
+        task.failed.connect(lambda message: self._finish_save(None))
+        self._save_task = task
+
+    def _finish_save(self, part):
+        self._save_task = None
+        self._set_saving(False)
+        self._on_saved(part)
+
+    def _set_saving(self, saving: bool):
+        self.save_btn.setEnabled(not saving)
+        self.cancel_btn.setEnabled(not saving)
+
+    def is_saving(self) -> bool:
+        return self._save_task is not None
+
+    def reject(self):
+        # «Отмена», Esc и закрытие окна ждут окончания записи
+        if self.is_saving():
+            return
+        super().reject()
 
 
-class AddPartDialog(QDialog):
+class AddPartDialog(_BackgroundSaveMixin, QDialog):
     """Диалог добавления запчасти"""
 
     def __init__(self, parent=None):
@@ -18,6 +100,8 @@ class AddPartDialog(QDialog):
         self.setModal(True)
         self.setMinimumSize(450, 600)
         self._is_updating = False
+        # Запись добавленной запчасти (после accept)
+        self.saved_part = None
 
         self.setup_ui()
         self._connect_signals()
@@ -35,19 +119,17 @@ class AddPartDialog(QDialog):
 
         self.brand_input = QLineEdit()
         self.brand_input.setPlaceholderText("Например: Toyota (или 'Универсальная')")
+        attach_completer(self.brand_input, 'brand')
         layout.addRow("Марка:", self.brand_input)
 
         self.model_input = QLineEdit()
         self.model_input.setPlaceholderText("Например: Camry (или 'Универсальная')")
+        attach_completer(self.model_input, 'car_model')
         layout.addRow("Модель:", self.model_input)
 
         self.category_input = QComboBox()
         self.category_input.setEditable(True)
-        self.category_input.addItems([
-            "Двигатель", "Трансмиссия", "Тормозная система",
-            "Подвеска", "Электрика", "Кузов", "Салон",
-            "Универсальные", "Аксессуары", "Прочее"
-        ])
+        load_categories(self.category_input)
         layout.addRow("Категория*:", self.category_input)
 
         self.quantity_input = QSpinBox()
@@ -80,16 +162,16 @@ class AddPartDialog(QDialog):
 
         buttons_layout = QHBoxLayout()
 
-        save_btn = QPushButton("💾 Сохранить")
-        save_btn.setProperty("class", "success")
-        save_btn.setProperty("class", "large")
-        save_btn.clicked.connect(self.save_part)
-        buttons_layout.addWidget(save_btn)
+        self.save_btn = QPushButton("💾 Сохранить")
+        self.save_btn.setProperty("class", "success")
+        self.save_btn.setProperty("class", "large")
+        self.save_btn.clicked.connect(self.save_part)
+        buttons_layout.addWidget(self.save_btn)
 
-        cancel_btn = QPushButton("❌ Отмена")
-        cancel_btn.setProperty("class", "warning")
-        cancel_btn.clicked.connect(self.reject)
-        buttons_layout.addWidget(cancel_btn)
+        self.cancel_btn = QPushButton("❌ Отмена")
+        self.cancel_btn.setProperty("class", "warning")
+        self.cancel_btn.clicked.connect(self.reject)
+        buttons_layout.addWidget(self.cancel_btn)
 
         layout.addRow(buttons_layout)
 
@@ -131,7 +213,9 @@ class AddPartDialog(QDialog):
         brand = self.brand_input.text().strip() or "Универсальная"
         model = self.model_input.text().strip() or "Универсальная"
 
-        success = db.add_part(
+        # Запись в фоне; повторное нажатие до ответа не создаст дубликат
+        self._start_save(
+            db.add_part_record,
             article=self.article_input.text().strip(),
             name=self.name_input.text().strip(),
             brand=brand,
@@ -143,14 +227,16 @@ class AddPartDialog(QDialog):
             description=self.description_input.toPlainText().strip(),
         )
 
-        if success:
+    def _on_saved(self, part):
+        if part is not None:
+            self.saved_part = part
             QMessageBox.information(self, "Успех", "Запчасть успешно добавлена!")
             self.accept()
         else:
             QMessageBox.warning(self, "Ошибка", "Не удалось добавить запчасть.\nВозможно, артикул уже существует.")
 
 
-class EditPartDialog(QDialog):
+class EditPartDialog(_BackgroundSaveMixin, QDialog):
     """Диалог редактирования запчасти"""
 
     def __init__(self, part_data: dict, parent=None):
@@ -160,6 +246,8 @@ class EditPartDialog(QDialog):
         self.setModal(True)
         self.setMinimumSize(450, 600)
         self._is_updating = False
+        # Запись изменённой запчасти (после accept)
+        self.saved_part = None
 
         self.setup_ui()
         self._connect_signals()
@@ -178,19 +266,17 @@ class EditPartDialog(QDialog):
 
         self.brand_input = QLineEdit()
         self.brand_input.setPlaceholderText("Например: Toyota (или 'Универсальная')")
+        attach_completer(self.brand_input, 'brand')
         layout.addRow("Марка:", self.brand_input)
 
         self.model_input = QLineEdit()
         self.model_input.setPlaceholderText("Например: Camry (или 'Универсальная')")
+        attach_completer(self.model_input, 'car_model')
         layout.addRow("Модель:", self.model_input)
 
         self.category_input = QComboBox()
         self.category_input.setEditable(True)
-        self.category_input.addItems([
-            "Двигатель", "Трансмиссия", "Тормозная система",
-            "Подвеска", "Электрика", "Кузов", "Салон",
-            "Универсальные", "Аксессуары", "Прочее"
-        ])
+        load_categories(self.category_input)
         layout.addRow("Категория*:", self.category_input)
 
         self.quantity_input = QSpinBox()
@@ -222,16 +308,16 @@ class EditPartDialog(QDialog):
 
         buttons_layout = QHBoxLayout()
 
-        save_btn = QPushButton("💾 Сохранить изменения")
-        save_btn.setProperty("class", "warning")
-        save_btn.setProperty("class", "large")
-        save_btn.clicked.connect(self.save_changes)
-        buttons_layout.addWidget(save_btn)
+        self.save_btn = QPushButton("💾 Сохранить изменения")
+        self.save_btn.setProperty("class", "warning")
+        self.save_btn.setProperty("class", "large")
+        self.save_btn.clicked.connect(self.save_changes)
+        buttons_layout.addWidget(self.save_btn)
 
-        cancel_btn = QPushButton("❌ Отмена")
-        cancel_btn.setProperty("class", "danger")
-        cancel_btn.clicked.connect(self.reject)
-        buttons_layout.addWidget(cancel_btn)
+        self.cancel_btn = QPushButton("❌ Отмена")
+        self.cancel_btn.setProperty("class", "danger")
+        self.cancel_btn.clicked.connect(self.reject)
+        buttons_layout.addWidget(self.cancel_btn)
 
         layout.addRow(buttons_layout)
 
@@ -293,7 +379,8 @@ class EditPartDialog(QDialog):
         brand = self.brand_input.text().strip() or "Универсальная"
         model = self.model_input.text().strip() or "Универсальная"
 
-        success = db.update_part(
+        self._start_save(
+            db.update_part_record,
             part_id=self.part_data['id'],
             article=self.article_input.text().strip(),
             name=self.name_input.text().strip(),
@@ -306,8 +393,108 @@ class EditPartDialog(QDialog):
             description=self.description_input.toPlainText().strip(),
         )
 
-        if success:
+    def _on_saved(self, part):
+        if part is not None:
+            self.saved_part = part
             QMessageBox.information(self, "Успех", "Запчасть успешно обновлена!")
             self.accept()
         else:
             QMessageBox.warning(self, "Ошибка", "Не удалось обновить запчасть.\nВозможно, артикул уже используется.")
+
+
+class CatalogImportThread(QThread):
+    """Импорт каталога поставщика в фоновом потоке"""
+
+    progress = Signal(int)
+    import_finished = Signal(dict)
+
+    def __init__(self, path: str, on_conflict: str, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.on_conflict = on_conflict
+
+    def run(self):
+        result = db.import_parts(read_catalog(self.path), on_conflict=self.on_conflict,
+                                 progress=self._report_progress)
+        self.import_finished.emit(result)
+
+    def _report_progress(self, processed: int) -> bool:
+        self.progress.emit(processed)
+        # False прерывает импорт после текущей пачки
+        return not self.isInterruptionRequested()
+
+
+def import_catalog(parent=None) -> bool:
+    """
+    Выбрать файл каталога (CSV/XLSX) и импортировать его с индикатором
+    прогресса. Возвращает True, если в базе что-то изменилось.
+    """
+    path, _ = QFileDialog.getOpenFileName(
+        parent, "Импорт каталога", "",
+        "Каталоги (*.csv *.xlsx);;CSV (*.csv);;Excel (*.xlsx)")
+    if not path:
+        return False
+
+    reply = QMessageBox.question(
+        parent, "Импорт каталога",
+        "Обновлять запчасти, артикулы которых уже есть в базе?\n"
+        "«Нет» - такие строки будут пропущены.",
+        QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+        QMessageBox.Yes
+    )
+    if reply == QMessageBox.Cancel:
+        return False
+    on_conflict = 'update' if reply == QMessageBox.Yes else 'skip'
+
+    try:
+        total = count_catalog_rows(path) or 0
+    except OSError as e:
+        QMessageBox.warning(parent, "Ошибка", f"Не удалось прочитать файл:\n{e}")
+        return False
+
+    # При total == 0 индикатор показывает неопределённый прогресс
+    dialog = QProgressDialog("📥 Импорт каталога...", "Отмена", 0, total, parent)
+    dialog.setWindowTitle("Импорт каталога")
+    dialog.setWindowModality(Qt.WindowModal)
+    dialog.setMinimumDuration(0)
+    dialog.setAutoClose(False)
+    dialog.setAutoReset(False)
+
+    thread = CatalogImportThread(path, on_conflict, parent)
+    results = []
+    loop = QEventLoop()
+    thread.progress.connect(lambda processed: dialog.setValue(min(processed, total)))
+    thread.import_finished.connect(results.append)
+    thread.finished.connect(loop.quit)
+    dialog.canceled.connect(thread.requestInterruption)
+
+    # UI остаётся отзывчивым: ждём поток во вложенном цикле событий
+    thread.start()
+    loop.exec()
+    thread.wait()
+    dialog.close()
+
+    if not results:
+        QMessageBox.warning(parent, "Ошибка", "Импорт завершился с ошибкой")
+        return False
+
+    result = results[0]
+    lines = [
+        f"Добавлено: {result['inserted']}",
+        f"Обновлено: {result['updated']}",
+        f"Пропущено: {result['skipped']}",
+        f"Ошибок: {len(result['errors'])}",
+    ]
+    if result['cancelled']:
+        lines.insert(0, "Импорт прерван пользователем.")
+    for number, message in result['errors'][:IMPORT_ERRORS_SHOWN]:
+        lines.append(f"  строка {number}: {message}")
+    if len(result['errors']) > IMPORT_ERRORS_SHOWN:
+        lines.append(f"  ... и ещё {len(result['errors']) - IMPORT_ERRORS_SHOWN}")
+
+    if result['errors']:
+        QMessageBox.warning(parent, "Импорт каталога", "\n".join(lines))
+    else:
+        QMessageBox.information(parent, "Импорт каталога", "\n".join(lines))
+
+    return bool(result['inserted'] or result['updated'])
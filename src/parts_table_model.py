@@ -0,0 +1,248 @@
+"""
+Модель таблицы запчастей для QTableView
+
+Строки хранятся компактными записями (db_records.Record) и подгружаются
+страницами из базы через canFetchMore/fetchMore - представление само
+запрашивает следующую страницу при прокрутке к концу. Qt-объекты на
+каждую ячейку не создаются: текст (цены с ₽) и подсветка низкого
+остатка вычисляются в data() только для видимых ячеек.
+
+Если передан DbWorker, страницы загружаются в фоне: reload() и fetchMore()
+сразу возвращаются, строки появляются по готовности, а более новая
+загрузка отменяет незавершённую.
+
+После добавления, изменения или удаления одной запчасти модель правится
+точечно (put_part/remove_part) - без перезагрузки, поэтому прокрутка,
+сортировка и выделение сохраняются.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, Signal
+from PySide6.QtGui import QColor
+
+from database_simple import LOW_STOCK_THRESHOLD
+from db_records import Record
+
+# Подсветка строк с низким остатком
+LOW_STOCK_COLOR = "#fff3cd"
+
+# Роли как обычные int: сравнение с перечислением Qt в PySide6 медленное,
+# а data() вызывается для каждой видимой ячейки при каждой перерисовке
+_DISPLAY_ROLE = int(Qt.DisplayRole)
+_BACKGROUND_ROLE = int(Qt.BackgroundRole)
+_USER_ROLE = int(Qt.UserRole)
+
+
+def _format_price(value) -> str:
+    # Money (Decimal) форматируется точно, без перевода во float
+    return f"{value:.2f} ₽"
+
+
+class PartsTableModel(QAbstractTableModel):
+    """Каталог запчастей с постраничной подгрузкой из SimpleDatabase"""
+
+    HEADERS = ["ID", "Артикул", "Наименование", "Марка", "Модель",
+               "Категория", "Кол-во", "Закуп. цена", "Розн. цена", "Описание"]
+    # Поля записи по колонкам
+    FIELDS = ('id', 'article', 'name', 'brand', 'car_model',
+              'category', 'quantity', 'buy_price', 'sell_price', 'description')
+    PRICE_COLUMNS = (7, 8)
+
+    # Первая страница загружена (после reload)
+    page_loaded = Signal()
+
+    def __init__(self, database, page_size: int = 50, parent=None, worker=None):
+        super().__init__(parent)
+        self.database = database
+        self.page_size = page_size
+        self.worker = worker
+        # Незавершённая фоновая загрузка
+        self._pending = None
+        self.order_by = 'article'
+        self.filters: Optional[Dict] = None
+        self._rows: List[Record] = []
+        self._next_key = None
+        self._low_stock_brush = QColor(LOW_STOCK_COLOR)
+
+    def reload(self, order_by: Optional[str] = None, filters: Optional[Dict] = None):
+        """Заново загрузить первую страницу (новая сортировка или фильтр)"""
+        if order_by is not None:
+            self.order_by = order_by
+        self.filters = filters
+        # Страницы прежнего запроса больше не нужны
+        self.cancel_loading()
+
+        self._load(self._reset_rows, limit=self.page_size,
+                   order_by=self.order_by, filters=self.filters)
+
+    def cancel_loading(self):
+        """Отменить незавершённую фоновую загрузку"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    def is_loading(self) -> bool:
+        return self._pending is not None
+
+    def _load(self, apply, **kwargs):
+        """Запросить страницу и передать (строки, ключ) в apply"""
+        if self.worker is None:
+            apply(self.database.get_parts_page(**kwargs))
+            return
+
+        task = self.worker.submit(self.database.get_parts_page, **kwargs)
+        task.finished.connect(lambda page: self._page_arrived(task, apply, page))
+        task.failed.connect(lambda message: self._page_arrived(task, apply, ([], None)))
+        self._pending = task
+
+    def _page_arrived(self, task, apply, page):
+        if task is self._pending:
+            self._pending = None
+            apply(page)
+
+    def _reset_rows(self, page):
+        rows, next_key = page
+        self.beginResetModel()
+        self._rows = rows
+        self._next_key = next_key
+        self.endResetModel()
+        self.page_loaded.emit()
+
+    def _append_rows(self, page):
+        rows, self._next_key = page
+        if not rows:
+            return
+
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def row_of(self, part_id: int) -> int:
+        """Номер строки запчасти среди загруженных (-1, если её нет)"""
+        for row, part in enumerate(self._rows):
+            if part['id'] == part_id:
+                return row
+        return -1
+
+    def _sort_key(self, part: Record) -> Tuple:
+        return (part[self.order_by.lstrip('-')], part['id'])
+
+    def is_beyond_loaded(self, part: Record) -> bool:
+        """
+        Место запчасти в текущей сортировке - за последней загруженной
+        страницей. Подходящие под фильтры запчасти до этой границы все
+        загружены, поэтому незагруженная запчасть до неё под них не подходит
+        """
+        next_key = self._next_key
+        if next_key is None:
+            return False
+        key = self._sort_key(part)
+        return (key < next_key) if self.order_by.startswith('-') else (key > next_key)
+
+    def remove_part(self, part_id: int) -> bool:
+        """Убрать запчасть из таблицы"""
+        row = self.row_of(part_id)
+        if row < 0:
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row]
+        self.endRemoveRows()
+        return True
+
+    def put_part(self, part: Record) -> int:
+        """
+        Показать новую или изменённую запчасть на её месте в текущей
+        сортировке. Возвращает номер строки или -1, если место запчасти за
+        последней загруженной страницей (строка придёт со следующими).
+        """
+        old_row = self.row_of(part['id'])
+        descending = self.order_by.startswith('-')
+        key = self._sort_key(part)
+
+        # Позиция среди загруженных строк без учёта прежней версии запчасти
+        row = 0
+        for index, other in enumerate(self._rows):
+            if index == old_row:
+                continue
+            other_key = self._sort_key(other)
+            if (other_key > key) if descending else (other_key < key):
+                row += 1
+            else:
+                break
+
+        if old_row >= 0 and row == old_row:
+            # Место не изменилось - обновляем строку без перестановок
+            self._rows[row] = part
+            self.dataChanged.emit(self.index(row, 0),
+                                  self.index(row, self.columnCount() - 1))
+            return row
+
+        if old_row >= 0:
+            self.remove_part(part['id'])
+        # Ключ следующей страницы - граница загруженной части каталога
+        if self.is_beyond_loaded(part):
+            return -1
+
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.insert(row, part)
+        self.endInsertRows()
+        return row
+
+    def part_at(self, row: int) -> Optional[Record]:
+        """Запись запчасти в строке таблицы"""
+        if 0 <= row < len(self._rows):
+            return self._rows[row]
+        return None
+
+    # --- Интерфейс QAbstractTableModel ---
+
+    def rowCount(self, parent=QModelIndex()) -> int:  # noqa: B008
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:  # noqa: B008
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == _DISPLAY_ROLE and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        part = self._rows[index.row()]
+        column = index.column()
+
+        if role == _DISPLAY_ROLE:
+            value = part[self.FIELDS[column]]
+            if column in self.PRICE_COLUMNS:
+                return _format_price(value)
+            if value is None:
+                return ""
+            return str(value)
+
+        if role == _BACKGROUND_ROLE:
+            if part['quantity'] <= LOW_STOCK_THRESHOLD:
+                return self._low_stock_brush
+            return None
+
+        if role == _USER_ROLE:
+            # Исходное значение поля (без форматирования)
+            return part[self.FIELDS[column]]
+
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:  # noqa: B008
+        # Пока страница загружается, следующую не запрашиваем
+        return (not parent.isValid() and self._next_key is not None
+                and self._pending is None)
+
+    def fetchMore(self, parent=QModelIndex()):  # noqa: B008
+        """Подгрузить следующую страницу"""
+        if not self.canFetchMore(parent):
+            return
+
+        self._load(self._append_rows, after_key=self._next_key, limit=self.page_size,
+                   order_by=self.order_by, filters=self.filters)
@@ -0,0 +1,144 @@
+"""
+Кэш результатов чтения SimpleDatabase
+
+Результаты запросов хранятся по ключу (метод, аргументы) с вытеснением
+давно не использованных (LRU). Размер кэша ограничен и числом записей,
+и суммарным числом строк в них: результат больше лимита строк (весь
+каталог у get_all_parts или широкого поиска) не кэшируется. Кэш целиком сбрасывается, как только
+меняется версия данных - её сообщает функция version(): в SimpleDatabase
+это пара (счётчик записей этого процесса, PRAGMA data_version), поэтому
+замечаются и записи других процессов.
+"""
+
+import threading
+from array import array
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from db_records import Record
+
+# Записей в кэше по умолчанию
+DEFAULT_CACHE_SIZE = 256
+# Строк (элементов списков и массивов) во всех записях кэша по умолчанию
+DEFAULT_CACHE_ROWS = 20000
+
+
+def _freeze(value: Any) -> Hashable:
+    """Аргумент метода в виде, пригодном для ключа словаря"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _is_flat(items) -> bool:
+    """Элементы последовательности неизменяемы (записи, числа, строки)"""
+    # Списки однородны: достаточно посмотреть на первый элемент
+    return not items or isinstance(items[0], Record) or \
+        not isinstance(items[0], (list, tuple, dict, array))
+
+
+def _copy(result: Any) -> Any:
+    """
+    Копия изменяемых частей результата (списки, словари, массивы на любой
+    глубине), чтобы вызывающий не испортил кэш. Записи неизменяемы и общие
+    """
+    if isinstance(result, list):
+        return list(result) if _is_flat(result) else [_copy(item) for item in result]
+    # Именно tuple: записи (подклассы tuple) неизменяемы и не копируются
+    if type(result) is tuple:
+        return result if _is_flat(result) else tuple(_copy(item) for item in result)
+    if isinstance(result, dict):
+        return {key: _copy(value) for key, value in result.items()}
+    if isinstance(result, array):
+        return array(result.typecode, result)
+    return result
+
+
+def _rows(result: Any) -> int:
+    """Размер результата в строках: элементы списков и массивов, иначе 1"""
+    if isinstance(result, dict):
+        return sum(_rows(value) for value in result.values()) or 1
+    if isinstance(result, (list, array)) or type(result) is tuple:
+        if _is_flat(result):
+            return len(result) or 1
+        return sum(_rows(item) for item in result)
+    return 1
+
+
+class QueryCache:
+    """LRU-кэш результатов с проверкой версии данных"""
+
+    def __init__(self, version: Callable[[], Hashable], max_entries: int = DEFAULT_CACHE_SIZE,
+                 max_rows: int = DEFAULT_CACHE_ROWS):
+        self._version = version
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        # ключ -> (результат, строк в нём)
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._rows = 0
+        self._entries_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        """Результат из кэша или load(), если его нет или данные изменились"""
+        # Версию берём до чтения: если запись успеет пройти во время load(),
+        # результат сохранится под старой версией и сбросится при следующем вызове
+        version = self._version()
+        with self._lock:
+            if version != self._entries_version:
+                if self._entries:
+                    self.invalidations += 1
+                self._clear_entries()
+                self._entries_version = version
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(self._entries[key][0])
+            self.misses += 1
+
+        result = load()
+        rows = _rows(result)
+
+        with self._lock:
+            if self._entries_version == version and self.max_entries > 0 and \
+                    rows <= self.max_rows:
+                if key in self._entries:
+                    self._rows -= self._entries[key][1]
+                self._entries[key] = (result, rows)
+                self._entries.move_to_end(key)
+                self._rows += rows
+                while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                    self._rows -= self._entries.popitem(last=False)[1][1]
+        return _copy(result)
+
+    def _clear_entries(self):
+        self._entries.clear()
+        self._rows = 0
+
+    def clear(self):
+        """Сбросить все записи"""
+        with self._lock:
+            self._clear_entries()
+            self._entries_version = None
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий и промахов"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations, 'size': len(self._entries),
+                    'rows': self._rows}
+
+
+def cached_read(method):
+    """Декоратор метода чтения: результат берётся из self._cache"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, _freeze(args), _freeze(kwargs))
+        return self._cache.get_or_load(key, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,230 @@
+"""
+Поисковые индексы каталога запчастей
+
+- parts_fts: полнотекстовый индекс FTS5 (внешний контент над parts,
+  синхронизируется триггерами). Если сборка SQLite без FTS5, индекс не
+  создаётся и поиск идёт сканированием таблицы.
+- *_cf: теневые колонки parts с текстом, приведённым к единому регистру
+  по правилам Unicode (встроенный LOWER() SQLite понимает только ASCII).
+  Без индексов: по ним ищется подстрока, а она индексом не ускоряется.
+- article_key: нормализованный артикул (без разделителей, в верхнем
+  регистре) с уникальным индексом для точного и префиксного поиска.
+
+Используется и SimpleDatabase, и peewee-моделью Part.
+"""
+
+import re
+import sqlite3
+import unicodedata
+from typing import Any, Optional
+
+# Индексируемые колонки parts (порядок важен для весов bm25)
+FTS_COLUMNS = ('article', 'name', 'brand', 'car_model', 'category', 'description')
+
+# Веса колонок для ранжирования: артикул важнее описания
+FTS_RANK = 'bm25(parts_fts, 10.0, 5.0, 2.0, 2.0, 1.0, 0.5)'
+
+# Токен как у токенизатора unicode61: буквы и цифры, всё прочее - разделители
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+# Колонки parts, для которых хранится регистронезависимая копия <col>_cf
+CASEFOLD_COLUMNS = ('name', 'brand', 'car_model', 'category')
+
+# Имена SQL-функций, регистрируемых на каждом соединении
+CASEFOLD_FUNCTION = 'ap_casefold'
+ARTICLE_KEY_FUNCTION = 'ap_article_key'
+
+# Всё, кроме букв и цифр, в артикуле считается разделителем
+_ARTICLE_SEPARATORS_RE = re.compile(r'[\W_]+')
+
+
+def casefold_text(value: Any) -> str:
+    """
+    Привести текст к форме для регистронезависимого сравнения:
+    NFKC-нормализация, Unicode casefold, «ё» приравнивается к «е».
+    """
+    if value is None:
+        return ''
+    return unicodedata.normalize('NFKC', str(value)).casefold().replace('ё', 'е')
+
+
+def normalize_article(value: Any) -> str:
+    """Ключ артикула без разделителей: 04465-33450, 04465 33450 -> 0446533450"""
+    if value is None:
+        return ''
+    return _ARTICLE_SEPARATORS_RE.sub('', str(value)).upper()
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Верхняя граница диапазона [prefix, bound) для поиска по префиксу через индекс"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def register_search_functions(conn: sqlite3.Connection):
+    """Зарегистрировать на соединении SQL-функции, нужные триггерам и поиску"""
+    conn.create_function(CASEFOLD_FUNCTION, 1, casefold_text, deterministic=True)
+    conn.create_function(ARTICLE_KEY_FUNCTION, 1, normalize_article, deterministic=True)
+
+
+def create_casefold_columns(cursor: sqlite3.Cursor):
+    """
+    Добавить недостающие колонки <col>_cf, заполнить их и создать
+    триггеры, поддерживающие их при INSERT/UPDATE.
+    """
+    register_search_functions(cursor.connection)
+
+    cursor.execute('PRAGMA table_info(parts)')
+    existing = {row[1] for row in cursor.fetchall()}
+    added = []
+    for col in CASEFOLD_COLUMNS:
+        if f'{col}_cf' not in existing:
+            cursor.execute(f"ALTER TABLE parts ADD COLUMN {col}_cf TEXT NOT NULL DEFAULT ''")
+            added.append(col)
+
+    if added:
+        assignments = ', '.join(f'{col}_cf = {CASEFOLD_FUNCTION}({col})' for col in added)
+        cursor.execute(f'UPDATE parts SET {assignments}')
+
+    columns = ', '.join(CASEFOLD_COLUMNS)
+    assignments = ', '.join(f'{col}_cf = {CASEFOLD_FUNCTION}(new.{col})' for col in CASEFOLD_COLUMNS)
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_casefold_ai AFTER INSERT ON parts BEGIN
+        UPDATE parts SET {assignments} WHERE id = new.id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_casefold_au AFTER UPDATE OF {columns} ON parts BEGIN
+        UPDATE parts SET {assignments} WHERE id = new.id;
+    END
+    ''')
+
+
+def drop_casefold_indexes(cursor: sqlite3.Cursor):
+    """
+    Удалить индексы колонок *_cf (их создавали прежние версии и peewee
+    для Part): поиск подстроки их не использует, а каждая запись
+    запчасти обновляла бы четыре лишних индекса
+    """
+    for col in CASEFOLD_COLUMNS:
+        cursor.execute(f'DROP INDEX IF EXISTS parts_{col}_cf')
+
+
+def create_article_key_column(cursor: sqlite3.Cursor):
+    """
+    Добавить и заполнить колонку article_key, создать индекс и триггеры.
+    Индекс уникальный, если в базе нет артикулов, совпадающих после
+    нормализации; иначе создаётся обычный индекс и выводится предупреждение.
+    """
+    register_search_functions(cursor.connection)
+
+    cursor.execute('PRAGMA table_info(parts)')
+    existing = {row[1] for row in cursor.fetchall()}
+    if 'article_key' not in existing:
+        # NULL по умолчанию: строка получает ключ из триггера уже после вставки
+        cursor.execute('ALTER TABLE parts ADD COLUMN article_key TEXT')
+        cursor.execute(f'UPDATE parts SET article_key = {ARTICLE_KEY_FUNCTION}(article)')
+
+    cursor.execute('''
+    SELECT COUNT(*) FROM (
+        SELECT article_key FROM parts GROUP BY article_key HAVING COUNT(*) > 1
+    )
+    ''')
+    duplicates = cursor.fetchone()[0]
+
+    # Имя индекса совпадает с тем, что создаёт peewee для Part
+    if duplicates:
+        print(f"⚠️ Артикулов, совпадающих после нормализации: {duplicates}. "
+              f"Индекс article_key создан без ограничения уникальности")
+        cursor.execute('CREATE INDEX IF NOT EXISTS parts_article_key ON parts (article_key)')
+    else:
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS parts_article_key ON parts (article_key)')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_article_key_ai AFTER INSERT ON parts BEGIN
+        UPDATE parts SET article_key = {ARTICLE_KEY_FUNCTION}(new.article) WHERE id = new.id;
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_article_key_au AFTER UPDATE OF article ON parts BEGIN
+        UPDATE parts SET article_key = {ARTICLE_KEY_FUNCTION}(new.article) WHERE id = new.id;
+    END
+    ''')
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """Поддерживает ли сборка SQLite модуль FTS5"""
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        conn.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def has_parts_fts(conn: sqlite3.Connection) -> bool:
+    """Создан ли в базе индекс parts_fts"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'parts_fts'"
+    ).fetchone()
+    return row is not None
+
+
+def create_parts_fts(cursor: sqlite3.Cursor) -> bool:
+    """
+    Создать parts_fts, триггеры синхронизации и заполнить индекс.
+    Возвращает False, если FTS5 недоступен.
+    """
+    if not fts5_available(cursor.connection):
+        print("⚠️ SQLite собран без FTS5, поиск будет работать сканированием")
+        return False
+
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{col}' for col in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{col}' for col in FTS_COLUMNS)
+
+    # prefix='2 3' ускоряет короткие префиксные запросы при вводе с клавиатуры
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS parts_fts USING fts5(
+        {columns},
+        content='parts',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_fts_ai AFTER INSERT ON parts BEGIN
+        INSERT INTO parts_fts (rowid, {columns}) VALUES (new.id, {new_values});
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_fts_ad AFTER DELETE ON parts BEGIN
+        INSERT INTO parts_fts (parts_fts, rowid, {columns})
+        VALUES ('delete', old.id, {old_values});
+    END
+    ''')
+    # Срабатывает только при изменении индексируемых колонок,
+    # поэтому списание остатков не трогает индекс
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS parts_fts_au AFTER UPDATE OF {columns} ON parts BEGIN
+        INSERT INTO parts_fts (parts_fts, rowid, {columns})
+        VALUES ('delete', old.id, {old_values});
+        INSERT INTO parts_fts (rowid, {columns}) VALUES (new.id, {new_values});
+    END
+    ''')
+
+    cursor.execute("INSERT INTO parts_fts (parts_fts) VALUES ('rebuild')")
+    return True
+
+
+def build_fts_query(text: str) -> Optional[str]:
+    """
+    Преобразовать пользовательский ввод в запрос FTS5:
+    каждое слово ищется как префикс, все слова обязательны.
+    Возвращает None, если в запросе нет ни одного слова.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return ' AND '.join(f'"{token}"*' for token in tokens)
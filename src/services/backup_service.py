@@ -4,7 +4,7 @@ from datetime import datetime
 from typing import List, Tuple
 
 try:
-from ..models.database import DB_PATH, get_data_dir
+    from ..models.database import DB_PATH, get_data_dir
 except ImportError:
     # Для работы в тестах
     from models.database import DB_PATH, get_data_dir
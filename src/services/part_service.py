@@ -2,16 +2,18 @@ from typing import List, Optional
 from decimal import Decimal
 
 try:
-from ..models import Part
+    from ..models import Part
 except ImportError:
     # Для работы в тестах
     from models.part import Part
 
+from search_index import normalize_article
+
 class PartService:
     """Сервис для работы с запчастями"""
     
     @staticmethod
-    def create_part(article: str, name: str, brand: str, model: str, 
+    def create_part(article: str, name: str, brand: str, car_model: str, 
                    category: str, quantity: int, buy_price: Decimal, 
                    sell_price: Decimal, description: str = None) -> Part:
         """Создать новую запчасть"""
@@ -19,7 +21,7 @@ class PartService:
             article=article,
             name=name,
             brand=brand,
-            model=model,
+            car_model=car_model,
             category=category,
             quantity=quantity,
             buy_price=buy_price,
@@ -55,7 +57,7 @@ class PartService:
     
     @staticmethod
     def get_part_by_article(article: str) -> Optional[Part]:
-        """Получить запчасть по артикулу"""
+        """Получить запчасть по артикулу (разделители и регистр не важны)"""
         return Part.get_by_article(article)
     
     @staticmethod
@@ -89,14 +91,34 @@ class PartService:
     @staticmethod
     def get_categories() -> List[str]:
         """Получить список всех категорий"""
-        categories = Part.select(Part.category).distinct()
-        return sorted([cat.category for cat in categories if cat.category])
+        return PartService._distinct_values(Part.category)
     
     @staticmethod
     def get_brands() -> List[str]:
         """Получить список всех марок"""
-        brands = Part.select(Part.brand).distinct()
-        return sorted([brand.brand for brand in brands if brand.brand])
+        return PartService._distinct_values(Part.brand)
+    
+    @staticmethod
+    def get_car_models() -> List[str]:
+        """Получить список всех моделей автомобилей"""
+        return PartService._distinct_values(Part.car_model)
+    
+    @staticmethod
+    def _distinct_values(field) -> List[str]:
+        """
+        Различные непустые значения поля по алфавиту. DISTINCT и сортировку
+        выполняет SQLite, в Python строки не выбираются. category и brand
+        читаются по покрывающим индексам idx_parts_category/idx_parts_brand
+        (если базу обновил SimpleDatabase); для car_model индекса нет -
+        таблица сканируется с временным B-деревом. Результат не кэшируется:
+        подсказкам в интерфейсе списки даёт SimpleDatabase.get_distinct_values.
+        """
+        query = (Part.select(field)
+                 .where(field != '')
+                 .distinct()
+                 .order_by(field)
+                 .tuples())
+        return [value for (value,) in query]
     
     @staticmethod
     def get_low_stock_parts(threshold: int = 5) -> List[Part]:
@@ -107,8 +129,8 @@ class PartService:
     
     @staticmethod
     def validate_article(article: str, exclude_id: int = None) -> bool:
-        """Проверить уникальность артикула"""
-        query = Part.select().where(Part.article == article)
+        """Проверить уникальность артикула (с точностью до разделителей и регистра)"""
+        query = Part.select().where(Part.article_key == normalize_article(article))
         if exclude_id:
             query = query.where(Part.id != exclude_id)
         return not query.exists() 
\ No newline at end of file
@@ -1,52 +1,84 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from decimal import Decimal
 from datetime import datetime, date
 
+from peewee import prefetch
+
+from money import from_kopecks, to_kopecks
+from stock_ledger import movement_source, take_stock_snapshots
+
 try:
-from ..models import Sale, SaleItem, Part
+    from ..models import Sale, SaleItem, Part
 except ImportError:
     # Для работы в тестах
     from models.sale import Sale, SaleItem
     from models.part import Part
 
+# Различных запчастей в одном запросе WHERE id IN (...): параметров
+# меньше лимита старых сборок SQLite (999)
+IN_CHUNK_SIZE = 500
+
+def _line_error(line: int, part_id, requested, available, reason: str) -> Dict:
+    """Ошибка позиции продажи (line - номер позиции с 1, 0 - вся продажа)"""
+    return {'line': line, 'part_id': part_id, 'requested': requested,
+            'available': available, 'reason': reason}
+
 class SaleService:
     """Сервис для работы с продажами"""
     
     @staticmethod
-    def create_sale(items: List[Dict]) -> Tuple[Sale, bool]:
+    def create_sale(items: List[Dict],
+                    parts: Optional[Dict[int, Part]] = None) -> Tuple[Sale, bool]:
         """
         Создать новую продажу
         items: [{'part_id': int, 'quantity': int, 'price': Decimal}]
+        parts: запчасти из load_sale_parts, по которым уже проверены позиции
         Возвращает (Sale, success)
+        
+        Всё выполняется в одной транзакции: остаток списывается условным
+        UPDATE (quantity >= списываемого), позиции вставляются одним запросом.
+        При нехватке товара транзакция откатывается целиком.
+        
+        Снимок parts не перечитывается: по нему позиции проверяются до
+        начала транзакции, а условный UPDATE страхует от продажи того же
+        товара в промежутке.
+        
+        Если в базе ведётся журнал остатков (stock_ledger), списания пишутся
+        в него движениями вида 'sale' со ссылкой на продажу, как в
+        SimpleDatabase.checkout, и снимаются наступившие снимки на начало месяца.
         """
+        requested, _, errors = SaleService._merge_lines(items)
+        if parts is not None and not errors:
+            _, errors = SaleService.validate_sale_items(items, parts)
+        if errors:
+            for error in errors:
+                print(f"Ошибка создания продажи: {error['reason']} (ID: {error['part_id']})")
+            return None, False
+        
         try:
-            sale = Sale.create(total=0)
-            total = Decimal('0')
-            
-            for item_data in items:
-                part = Part.get_by_id(item_data['part_id'])
-                quantity = item_data['quantity']
-                price = item_data['price']
+            database = Sale._meta.database
+            with database.atomic():
+                now = datetime.now()
                 
-                # Проверяем доступность
-                if not part.reduce_quantity(quantity):
-                    # Откатываем транзакцию
-                    sale.delete_instance()
-                    return None, False
+                # Сумма в копейках - точно при любых ценах
+                total = sum(item_data['quantity'] * to_kopecks(item_data['price'])
+                            for item_data in items)
+                sale = Sale.create(date=now, total=from_kopecks(total))
                 
-                # Создаем позицию продажи
-                SaleItem.create(
-                    sale=sale,
-                    part=part,
-                    quantity=quantity,
-                    price=price
-                )
+                if database.table_exists('stock_movement_source'):
+                    cursor = database.cursor()
+                    # Движения остатков в журнале ссылаются на продажу
+                    with movement_source(cursor, 'sale', sale.id, now.isoformat()):
+                        SaleService._decrement_stock(requested, now)
+                    take_stock_snapshots(cursor)
+                else:
+                    SaleService._decrement_stock(requested, now)
                 
-                total += quantity * price
-            
-            # Обновляем общую сумму
-            sale.total = total
-            sale.save()
+                SaleItem.insert_many([
+                    {'sale': sale.id, 'part': item_data['part_id'],
+                     'quantity': item_data['quantity'], 'price': item_data['price']}
+                    for item_data in items
+                ]).execute()
             
             return sale, True
             
@@ -54,17 +86,48 @@ class SaleService:
             print(f"Ошибка создания продажи: {e}")
             return None, False
     
+    @staticmethod
+    def _decrement_stock(requested: Dict[int, int], now: datetime):
+        """Списать остатки условным UPDATE; при нехватке - ValueError (откат продажи)"""
+        for part_id, quantity in requested.items():
+            updated = (Part
+                       .update(quantity=Part.quantity - quantity, updated_at=now)
+                       .where((Part.id == part_id) & (Part.quantity >= quantity))
+                       .execute())
+            if not updated:
+                raise ValueError(f"Недостаточно товара на складе (ID: {part_id})")
+    
     @staticmethod
     def get_all_sales() -> List[Sale]:
-        """Получить все продажи"""
-        return list(Sale.select().order_by(Sale.date.desc()))
+        """Получить все продажи (с items_count и items_total без запроса на продажу)"""
+        return list(Sale.select_with_totals().order_by(Sale.date.desc(), Sale.id.desc()))
     
     @staticmethod
     def get_sales_by_date(start_date: date, end_date: date) -> List[Sale]:
-        """Получить продажи за период"""
-        return list(Sale.select().where(
+        """Получить продажи за период (с items_count и items_total)"""
+        return list(Sale.select_with_totals().where(
             Sale.date.between(start_date, end_date)
-        ).order_by(Sale.date.desc()))
+        ).order_by(Sale.date.desc(), Sale.id.desc()))
+    
+    @staticmethod
+    def get_sales_page(limit: int = 50, offset: int = 0,
+                       start_date: Optional[date] = None,
+                       end_date: Optional[date] = None) -> List[Sale]:
+        """
+        Страница продаж вместе с позициями: два запроса на всю страницу
+        (продажи и их позиции через prefetch) вместо запроса на каждую продажу.
+        sale.items - список позиций, items_count/items_total считаются по нему.
+        """
+        sales = Sale.select().order_by(Sale.date.desc(), Sale.id.desc())
+        if start_date is not None and end_date is not None:
+            sales = sales.where(Sale.date.between(start_date, end_date))
+        sales = sales.limit(limit).offset(offset)
+        return prefetch(sales, SaleItem)
+    
+    @staticmethod
+    def get_sale_items(sale_id: int) -> List[SaleItem]:
+        """Позиции продажи вместе с запчастями (один запрос с JOIN)"""
+        return list(SaleItem.select_with_parts().where(SaleItem.sale == sale_id))
     
     @staticmethod
     def get_sale_by_id(sale_id: int) -> Sale:
@@ -75,31 +138,77 @@ class SaleService:
             return None
     
     @staticmethod
-    def validate_sale_items(items: List[Dict]) -> Tuple[bool, List[str]]:
-        """Валидация позиций продажи"""
+    def load_sale_parts(items: List[Dict]) -> Dict[int, Part]:
+        """
+        Запчасти позиций продажи по id: один запрос WHERE id IN (...)
+        на каждые IN_CHUNK_SIZE различных запчастей
+        """
+        requested, _, _ = SaleService._merge_lines(items)
+        part_ids = list(requested)
+        parts = {}
+        for start in range(0, len(part_ids), IN_CHUNK_SIZE):
+            chunk = part_ids[start:start + IN_CHUNK_SIZE]
+            parts.update((part.id, part) for part in Part.select().where(Part.id.in_(chunk)))
+        return parts
+    
+    @staticmethod
+    def _merge_lines(items: List[Dict]) -> Tuple[Dict[int, int], List[Tuple[int, int]],
+                                                  List[Dict]]:
+        """
+        Разобрать позиции: (суммарное количество по запчастям,
+        [(номер позиции, id запчасти)], ошибки формата позиций)
+        """
+        requested = {}
+        lines = []
         errors = []
+        for line, item in enumerate(items, 1):
+            try:
+                part_id, quantity = item['part_id'], item['quantity']
+            except (KeyError, TypeError):
+                errors.append(_line_error(line, None, None, None, "некорректные данные"))
+                continue
+            if not isinstance(part_id, int) or not isinstance(quantity, int):
+                errors.append(_line_error(line, part_id, quantity, None, "некорректные данные"))
+                continue
+            if quantity <= 0:
+                errors.append(_line_error(line, part_id, quantity, None,
+                                          "количество должно быть больше 0"))
+                continue
+            # Одна запчасть может встречаться в нескольких позициях
+            requested[part_id] = requested.get(part_id, 0) + quantity
+            lines.append((line, part_id))
+        return requested, lines, errors
+    
+    @staticmethod
+    def validate_sale_items(items: List[Dict],
+                            parts: Optional[Dict[int, Part]] = None) -> Tuple[bool, List[Dict]]:
+        """
+        Валидация позиций продажи
+        parts: снимок из load_sale_parts (если не передан, загружается)
         
+        Возвращает (valid, errors), где каждая ошибка -
+        {'line', 'part_id', 'requested', 'available', 'reason'}: line - номер
+        позиции с 1 (0 - ошибка всей продажи), requested - количество
+        запчасти по всем её позициям, available - остаток (None, если
+        товар не найден).
+        """
         if not items:
-            errors.append("Не выбраны товары для продажи")
-            return False, errors
+            return False, [_line_error(0, None, 0, None, "Не выбраны товары для продажи")]
         
-        for i, item in enumerate(items):
-            try:
-                part = Part.get_by_id(item['part_id'])
-                quantity = item['quantity']
-                
-                if quantity <= 0:
-                    errors.append(f"Позиция {i+1}: количество должно быть больше 0")
-                
-                if part.quantity < quantity:
-                    errors.append(f"Позиция {i+1}: недостаточно товара на складе "
-                                f"(доступно: {part.quantity}, требуется: {quantity})")
-                
-            except Part.DoesNotExist:
-                errors.append(f"Позиция {i+1}: товар не найден")
-            except (KeyError, TypeError, ValueError):
-                errors.append(f"Позиция {i+1}: некорректные данные")
+        requested, lines, errors = SaleService._merge_lines(items)
+        if parts is None:
+            parts = SaleService.load_sale_parts(items)
+        
+        for line, part_id in lines:
+            part = parts.get(part_id)
+            if part is None:
+                errors.append(_line_error(line, part_id, requested[part_id], None,
+                                          "товар не найден"))
+            elif part.quantity < requested[part_id]:
+                errors.append(_line_error(line, part_id, requested[part_id], part.quantity,
+                                          "недостаточно товара на складе"))
         
+        errors.sort(key=lambda error: error['line'])
         return len(errors) == 0, errors
     
     @staticmethod
@@ -7,6 +7,8 @@ from typing import Any, Optional
 from PySide6.QtCore import QSettings, QStandardPaths
 from PySide6.QtWidgets import QApplication
 
+from sqlite_pragmas import DEFAULT_PRAGMA_PROFILE, PRAGMA_PROFILES
+
 
 class SettingsManager:
     """Менеджер настроек приложения"""
@@ -142,6 +144,18 @@ class SettingsManager:
     def max_backup_files(self, value: int):
         self.set_database_setting("max_backup_files", value)
     
+    @property
+    def database_pragma_profile(self) -> str:
+        """Профиль PRAGMA SQLite: 'safe' (надёжный) или 'fast' (быстрый)"""
+        profile = self.get_database_setting("pragma_profile", DEFAULT_PRAGMA_PROFILE)
+        return profile if profile in PRAGMA_PROFILES else DEFAULT_PRAGMA_PROFILE
+    
+    @database_pragma_profile.setter
+    def database_pragma_profile(self, value: str):
+        if value not in PRAGMA_PROFILES:
+            raise ValueError(f"Неизвестный профиль PRAGMA: {value}")
+        self.set_database_setting("pragma_profile", value)
+    
     # === Настройки экспорта ===
     
     def get_export_setting(self, key: str, default_value: Any = None) -> Any:
@@ -275,6 +289,7 @@ class SettingsManager:
             "export_directory": self.export_directory,
             "auto_backup_enabled": self.auto_backup_enabled,
             "backup_interval_days": self.backup_interval_days,
+            "database_pragma_profile": self.database_pragma_profile,
             "items_per_page": self.items_per_page,
             "auto_refresh_interval": self.auto_refresh_interval
         }
@@ -0,0 +1,53 @@
+"""
+Профили PRAGMA для соединений SQLite
+
+Профиль применяется к каждому новому соединению - и в SimpleDatabase,
+и в peewee-базе моделей.
+"""
+
+import sqlite3
+from typing import Any, Dict, List, Optional, Tuple
+
+# Ключи идут в порядке применения: busy_timeout ставится первым,
+# чтобы переключение journal_mode подождало чужие блокировки.
+# Проверка внешних ключей включена в обоих профилях: это не режим
+# скорости, а целостность данных.
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Надёжный: fsync на каждый commit, умеренный кэш
+    'safe': {
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'full',
+        'cache_size': -16000,       # ~16 МБ
+        'mmap_size': 0,
+        'temp_store': 'memory',
+        'foreign_keys': 'on',       # ссылки позиций документов (part_links)
+    },
+    # Быстрый: WAL + NORMAL (при сбое питания теряется лишь последний
+    # commit, но не целостность), большой кэш и отображение файла в память
+    'fast': {
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -64000,       # ~64 МБ
+        'mmap_size': 268435456,     # 256 МБ
+        'temp_store': 'memory',
+        'foreign_keys': 'on',       # ссылки позиций документов (part_links)
+    },
+}
+
+DEFAULT_PRAGMA_PROFILE = 'safe'
+
+
+def get_pragmas(profile: Optional[str] = None) -> List[Tuple[str, Any]]:
+    """Получить список (имя, значение) для профиля; неизвестный профиль - ошибка"""
+    name = profile or DEFAULT_PRAGMA_PROFILE
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Неизвестный профиль PRAGMA: {name}")
+    return list(PRAGMA_PROFILES[name].items())
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: List[Tuple[str, Any]]):
+    """Применить PRAGMA к соединению"""
+    for key, value in pragmas:
+        conn.execute(f"PRAGMA {key} = {value}")
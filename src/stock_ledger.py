@@ -0,0 +1,266 @@
+"""
+Журнал движения остатков и остатки на дату
+
+parts.quantity - текущий остаток, а его история хранится в stock_movements:
+строка на каждое изменение остатка запчасти (delta со знаком, время, вид
+движения и документ). Журнал ведут триггеры на parts, поэтому движение
+пишется в той же транзакции, что и продажа, поступление, импорт или
+ручная правка, и сумма delta по запчасти всегда равна её остатку.
+Журнал только дополняется: UPDATE и DELETE строк запрещены триггерами.
+
+Вид движения и документ триггер берёт из stock_movement_source - строки,
+которую пишущий метод заполняет на время транзакции (movement_source).
+Без неё вид определяется событием: 'create', 'adjust' или 'delete'.
+
+Остаток на дату не требует прохода по всему журналу: на начало каждого
+месяца хранится снимок ненулевых остатков (stock_snapshots), и остаток
+на момент - это ближайший снимок до него плюс движения после снимка,
+то есть не больше месяца движений (stock_as_of).
+
+rebuild_stock_ledger восстанавливает журнал существующей базы по
+документам: поступления и продажи - со своими датами, остальное (остаток
+до ведения журнала и ручные правки) - начальным остатком ('opening').
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+# Время движения в формате datetime.now().isoformat() документов
+# (до миллисекунд): границы периодов сравниваются как строки
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+
+# Триггеры, запрещающие правку журнала (снимаются на время rebuild_stock_ledger)
+LEDGER_GUARDS = ('stock_movements_no_update', 'stock_movements_no_delete')
+
+
+def _movement_sql(row: str, delta: str, default_kind: str) -> str:
+    """Запись движения строки row с видом и документом из stock_movement_source"""
+    return f'''
+        INSERT INTO stock_movements (part_id, at, delta, kind, document_id)
+        SELECT {row}.id, COALESCE(s.at, {_NOW_SQL}), {delta},
+               COALESCE(s.kind, '{default_kind}'), s.document_id
+        FROM (SELECT 1) LEFT JOIN stock_movement_source s ON s.id = 1;
+    '''
+
+
+def _create_guards(cursor: sqlite3.Cursor):
+    for name, event in zip(LEDGER_GUARDS, ('UPDATE', 'DELETE'), strict=True):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name} BEFORE {event} ON stock_movements BEGIN
+            SELECT RAISE(ABORT, 'stock_movements: журнал только дополняется');
+        END
+        ''')
+
+
+def create_stock_ledger(cursor: sqlite3.Cursor):
+    """Создать журнал движений, снимки остатков и триггеры на parts"""
+    # Без внешнего ключа: история удалённых запчастей остаётся в журнале
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        part_id INTEGER NOT NULL,
+        at TEXT NOT NULL,
+        delta INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        document_id INTEGER
+    )
+    ''')
+    # Остаток запчасти на дату и движения склада за период - покрывающие
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_stock_movements_part
+    ON stock_movements (part_id, at, delta)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_stock_movements_at
+    ON stock_movements (at, part_id, delta)
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_movement_source (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        kind TEXT NOT NULL,
+        document_id INTEGER,
+        at TEXT
+    )
+    ''')
+
+    # Снимок на день day (начало месяца) - остатки до движений этого дня.
+    # Дни снимков хранятся отдельно: снимок без ненулевых остатков тоже снимок
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_snapshot_days (
+        day TEXT PRIMARY KEY
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stock_snapshots (
+        day TEXT NOT NULL,
+        part_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        PRIMARY KEY (day, part_id)
+    ) WITHOUT ROWID
+    ''')
+
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS stock_movements_ai AFTER INSERT ON parts
+    WHEN new.quantity != 0 BEGIN
+        {_movement_sql('new', 'new.quantity', 'create')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS stock_movements_au AFTER UPDATE OF quantity ON parts
+    WHEN new.quantity != old.quantity BEGIN
+        {_movement_sql('new', 'new.quantity - old.quantity', 'adjust')}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS stock_movements_ad AFTER DELETE ON parts
+    WHEN old.quantity != 0 BEGIN
+        {_movement_sql('old', '-old.quantity', 'delete')}
+    END
+    ''')
+    _create_guards(cursor)
+
+
+@contextmanager
+def movement_source(cursor: sqlite3.Cursor, kind: str, document_id: Optional[int] = None,
+                    at: Optional[str] = None):
+    """
+    Вид, документ и время движений, которые запишут триггеры внутри блока
+    (в транзакции записи). При исключении строку убирает откат транзакции.
+    """
+    cursor.execute('''
+    INSERT OR REPLACE INTO stock_movement_source (id, kind, document_id, at)
+    VALUES (1, ?, ?, ?)
+    ''', (kind, document_id, at))
+    yield
+    cursor.execute('DELETE FROM stock_movement_source')
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def take_stock_snapshots(cursor: sqlite3.Cursor, today: Optional[date] = None) -> int:
+    """
+    Снять недостающие снимки на начало месяцев до сегодняшнего дня
+    (в транзакции записи). Каждый снимок - предыдущий плюс движения
+    между ними. Возвращает число новых снимков.
+    """
+    today = today or date.today()
+    previous = cursor.execute('SELECT MAX(day) FROM stock_snapshot_days').fetchone()[0]
+    if previous is None:
+        first = cursor.execute('SELECT MIN(at) FROM stock_movements').fetchone()[0]
+        if first is None:
+            return 0
+        day = _next_month(date.fromisoformat(first[:10]))
+        previous = ''
+    else:
+        day = _next_month(date.fromisoformat(previous))
+
+    taken = 0
+    while day <= today:
+        cursor.execute('''
+        INSERT INTO stock_snapshots (day, part_id, quantity)
+        SELECT :day, part_id, SUM(quantity)
+        FROM (SELECT part_id, quantity FROM stock_snapshots WHERE day = :previous
+              UNION ALL
+              SELECT part_id, delta FROM stock_movements WHERE at >= :previous AND at < :day)
+        GROUP BY part_id
+        HAVING SUM(quantity) != 0
+        ''', {'day': day.isoformat(), 'previous': previous})
+        cursor.execute('INSERT INTO stock_snapshot_days (day) VALUES (?)', (day.isoformat(),))
+        previous = day.isoformat()
+        day = _next_month(day)
+        taken += 1
+    return taken
+
+
+def as_of_bound(moment) -> str:
+    """
+    Исключающая верхняя граница времени движений для остатка на moment:
+    дата (date или 'YYYY-MM-DD') - на конец дня, datetime или ISO-строка
+    со временем - на этот момент включительно.
+    """
+    if isinstance(moment, str):
+        moment = date.fromisoformat(moment) if len(moment) == 10 else \
+            datetime.fromisoformat(moment)
+    if isinstance(moment, datetime):
+        return (moment + timedelta(microseconds=1)).isoformat(timespec='microseconds')
+    return (moment + timedelta(days=1)).isoformat()
+
+
+def stock_as_of(cursor: sqlite3.Cursor, moment, part_id: Optional[int] = None,
+                category: Optional[str] = None) -> int:
+    """
+    Остаток на момент moment (см. as_of_bound) по запчасти, категории
+    (по текущей категории запчастей) или по всему складу: ближайший снимок
+    не позже момента плюс движения от снимка до момента.
+    """
+    bound = as_of_bound(moment)
+    day = cursor.execute(
+        'SELECT MAX(day) FROM stock_snapshot_days WHERE day <= ?', (bound,)
+    ).fetchone()[0] or ''
+
+    if part_id is not None:
+        condition = 'part_id = :part_id'
+    elif category is not None:
+        condition = 'part_id IN (SELECT id FROM parts WHERE category = :category)'
+    else:
+        condition = '1'
+    cursor.execute(f'''
+    SELECT (SELECT COALESCE(SUM(quantity), 0) FROM stock_snapshots
+            WHERE day = :day AND {condition})
+         + (SELECT COALESCE(SUM(delta), 0) FROM stock_movements
+            WHERE at >= :day AND at < :bound AND {condition})
+    ''', {'day': day, 'bound': bound, 'part_id': part_id, 'category': category})
+    return cursor.fetchone()[0]
+
+
+def rebuild_stock_ledger(cursor: sqlite3.Cursor, today: Optional[date] = None) -> int:
+    """
+    Заново заполнить журнал и снимки по документам (в транзакции записи).
+    Возвращает число записанных движений.
+    """
+    for guard in LEDGER_GUARDS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {guard}')
+    cursor.execute('DELETE FROM stock_movements')
+    cursor.execute('DELETE FROM stock_snapshots')
+    cursor.execute('DELETE FROM stock_snapshot_days')
+
+    # Даты документов модели peewee записаны через пробел - приводим к 'T'.
+    # Начальный остаток ставится не позже первого документа запчасти
+    cursor.execute('''
+    WITH documents (part_id, at, delta, kind, document_id) AS (
+        SELECT ri.part_id, replace(r.date, ' ', 'T'), SUM(ri.quantity), 'receipt', r.id
+        FROM receipt_items ri
+        JOIN receipts r ON r.id = ri.receipt_id
+        WHERE ri.part_id IS NOT NULL
+        GROUP BY r.id, ri.part_id
+        UNION ALL
+        SELECT si.part_id, replace(s.date, ' ', 'T'), -SUM(si.quantity), 'sale', s.id
+        FROM sale_items si
+        JOIN sales s ON s.id = si.sale_id
+        WHERE si.part_id IS NOT NULL
+        GROUP BY s.id, si.part_id
+    ),
+    opening (part_id, at, delta, kind, document_id) AS (
+        SELECT p.id, MIN(replace(p.created_at, ' ', 'T'), COALESCE(d.first_at, 'Z')),
+               p.quantity - COALESCE(d.delta, 0), 'opening', NULL
+        FROM parts p
+        LEFT JOIN (SELECT part_id, MIN(at) AS first_at, SUM(delta) AS delta
+                   FROM documents GROUP BY part_id) d ON d.part_id = p.id
+    )
+    INSERT INTO stock_movements (part_id, at, delta, kind, document_id)
+    SELECT part_id, at, delta, kind, document_id
+    FROM (SELECT * FROM opening UNION ALL SELECT * FROM documents)
+    WHERE delta != 0
+    ORDER BY at, document_id
+    ''')
+    # rowcount для запроса, начинающегося с WITH, не заполняется
+    movements = cursor.execute('SELECT changes()').fetchone()[0]
+
+    _create_guards(cursor)
+    take_stock_snapshots(cursor, today)
+    return movements
@@ -6,6 +6,8 @@ import pytest
 import tempfile
 import os
 import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
 from unittest.mock import patch
 
 # Импортируем модуль для тестирования
@@ -13,6 +15,11 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from database_simple import SimpleDatabase
+from catalog_import import read_catalog
+from db_records import Record, fetch_columns
+from money import Money, from_kopecks, to_kopecks
+from search_index import register_search_functions
+from stock_ledger import take_stock_snapshots
 
 @pytest.fixture
 def temp_simple_db():
@@ -25,10 +32,14 @@ def temp_simple_db():
         db = SimpleDatabase()
         yield db
     
+    # Закрываем соединения (WAL удаляет -wal/-shm при закрытии)
+    db.close()
+    
     # Очистка
     db_path = os.path.join(temp_dir, 'autoparts.db')
-    if os.path.exists(db_path):
-        os.unlink(db_path)
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
     os.rmdir(temp_dir)
 
 class TestSimpleDatabase:
@@ -351,4 +362,1240 @@ class TestSimpleDatabase:
         assert len(receipt_items) == 1
         assert receipt_items[0]['quantity'] == 7
         assert receipt_items[0]['buy_price'] == 95.0
-        assert receipt_items[0]['article'] == "RECITEMS001"  # через JOIN 
\ No newline at end of file
+        assert receipt_items[0]['article'] == "RECITEMS001"  # через JOIN 
+
+class TestConnectionManager:
+    """Тесты менеджера соединений SimpleDatabase"""
+    
+    def test_reader_connection_reused(self, temp_simple_db):
+        """Соединение для чтения переиспользуется в рамках потока"""
+        first = temp_simple_db._connections.reader()
+        temp_simple_db.get_all_parts()
+        temp_simple_db.get_part_by_id(1)
+        assert temp_simple_db._connections.reader() is first
+    
+    def test_reader_connection_per_thread(self, temp_simple_db):
+        """Каждый поток получает своё соединение для чтения"""
+        import threading
+        
+        temp_simple_db.add_part("THR001", "Запчасть", "Brand", "Model", "Категория", 1, 50, 75)
+        main_conn = temp_simple_db._connections.reader()
+        results = {}
+        
+        def worker():
+            results['conn'] = temp_simple_db._connections.reader()
+            results['parts'] = temp_simple_db.get_all_parts()
+        
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        
+        assert results['conn'] is not main_conn
+        assert len(results['parts']) == 1
+    
+    def test_writes_visible_to_reader(self, temp_simple_db):
+        """Запись через выделенное соединение сразу видна читающему"""
+        assert temp_simple_db.get_all_parts() == []
+        temp_simple_db.add_part("VIS001", "Запчасть", "Brand", "Model", "Категория", 1, 50, 75)
+        assert len(temp_simple_db.get_all_parts()) == 1
+    
+    def test_close_and_reopen(self, temp_simple_db):
+        """После close() база снова доступна через новые соединения"""
+        temp_simple_db.add_part("CLS001", "Запчасть", "Brand", "Model", "Категория", 1, 50, 75)
+        old_conn = temp_simple_db._connections.reader()
+        
+        temp_simple_db.close()
+        
+        with pytest.raises(sqlite3.ProgrammingError):
+            old_conn.execute('SELECT 1')
+        assert len(temp_simple_db.get_all_parts()) == 1
+    
+    def test_change_db_path_switches_connections(self, temp_simple_db, tmp_path):
+        """Смена db_path закрывает старые соединения и открывает новую БД"""
+        temp_simple_db.add_part("OLD001", "Запчасть", "Brand", "Model", "Категория", 1, 50, 75)
+        
+        original_path = temp_simple_db.db_path
+        temp_simple_db.db_path = str(tmp_path / 'other.db')
+        temp_simple_db.init_database()
+        assert temp_simple_db.get_all_parts() == []
+        
+        temp_simple_db.db_path = original_path
+        assert len(temp_simple_db.get_all_parts()) == 1
+
+
+class TestPragmaProfile:
+    """Тесты профилей PRAGMA"""
+    
+    def test_default_profile_applied(self, temp_simple_db):
+        """Профиль по умолчанию включает WAL и busy_timeout"""
+        conn = temp_simple_db._connections.reader()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+        assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2  # MEMORY
+    
+    def test_set_fast_profile(self, temp_simple_db):
+        """Смена профиля применяется к новым соединениям"""
+        temp_simple_db.set_pragma_profile('fast')
+        conn = temp_simple_db._connections.reader()
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == -64000
+        
+        temp_simple_db.set_pragma_profile('safe')
+        conn = temp_simple_db._connections.reader()
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 2  # FULL
+    
+    def test_unknown_profile(self, temp_simple_db):
+        """Неизвестный профиль отклоняется"""
+        with pytest.raises(ValueError):
+            temp_simple_db.set_pragma_profile('turbo')
+
+
+class TestFullTextSearch:
+    """Тесты полнотекстового поиска (FTS5)"""
+    
+    def test_prefix_search(self, temp_simple_db):
+        """Каждое слово запроса ищется как префикс"""
+        temp_simple_db.add_part("FILT001", "Масляный фильтр", "Toyota", "Camry", "Двигатель", 5, 100, 150)
+        temp_simple_db.add_part("FILT002", "Воздушный фильтр", "Honda", "Civic", "Двигатель", 3, 80, 120)
+        
+        assert len(temp_simple_db.search_parts("фил")) == 2
+        assert len(temp_simple_db.search_parts("масл фил")) == 1
+        assert temp_simple_db.search_parts("FILT00")[0]['article'] in ("FILT001", "FILT002")
+        assert temp_simple_db.search_parts("масл civic") == []
+    
+    def test_description_indexed_and_ranked_lower(self, temp_simple_db):
+        """Совпадение в артикуле ранжируется выше совпадения в описании"""
+        temp_simple_db.add_part("A1", "Прокладка", "Brand", "Model", "Двигатель", 1, 10, 20,
+                                description="Подходит к KIT500")
+        temp_simple_db.add_part("KIT500", "Ремкомплект", "Brand", "Model", "Двигатель", 1, 10, 20)
+        
+        results = temp_simple_db.search_parts("kit500")
+        assert [part['article'] for part in results] == ["KIT500", "A1"]
+    
+    def test_index_follows_update_and_delete(self, temp_simple_db):
+        """Триггеры поддерживают индекс в актуальном состоянии"""
+        temp_simple_db.add_part("SYNC001", "Свеча зажигания", "NGK", "Универсальная", "Электрика", 4, 50, 90)
+        part_id = temp_simple_db.get_all_parts()[0]['id']
+        
+        temp_simple_db.update_part(part_id, name="Катушка зажигания")
+        assert temp_simple_db.search_parts("свеча") == []
+        assert len(temp_simple_db.search_parts("катушка")) == 1
+        
+        temp_simple_db.delete_part(part_id)
+        assert temp_simple_db.search_parts("катушка") == []
+    
+    def test_empty_query_returns_all(self, temp_simple_db):
+        """Запрос без слов возвращает весь каталог"""
+        temp_simple_db.add_part("ALL001", "Запчасть", "Brand", "Model", "Категория", 1, 50, 75)
+        assert len(temp_simple_db.search_parts("  -  ")) == 1
+    
+    def test_scan_fallback(self, temp_simple_db):
+        """Без FTS5 поиск работает сканированием"""
+        temp_simple_db.add_part("SCAN001", "Масляный фильтр", "Toyota", "Camry", "Двигатель", 5, 100, 150)
+        temp_simple_db._fts_enabled = False
+        
+        results = temp_simple_db.search_parts("toyota")
+        assert len(results) == 1
+        assert results[0]['article'] == "SCAN001"
+
+
+class TestCasefoldColumns:
+    """Тесты регистронезависимых колонок *_cf"""
+    
+    @pytest.fixture
+    def mixed_parts(self, temp_simple_db):
+        """Каталог со смешанными кириллицей и латиницей"""
+        temp_simple_db.add_part("MX001", "ФИЛЬТР масляный", "Лада", "Веста", "Двигатель", 5, 100, 150)
+        temp_simple_db.add_part("MX002", "Ёмкость омывателя", "BMW", "X5", "КУЗОВ", 3, 80, 120)
+        temp_simple_db.add_part("MX003", "Brake Pad Straße", "ATE", "Golf", "Тормоза", 2, 200, 300)
+        return temp_simple_db
+    
+    def test_columns_filled_by_trigger(self, mixed_parts):
+        """Триггеры заполняют *_cf при вставке и обновлении"""
+        conn = mixed_parts._connections.reader()
+        row = conn.execute(
+            "SELECT name_cf, brand_cf, category_cf FROM parts WHERE article = 'MX001'"
+        ).fetchone()
+        assert row == ("фильтр масляный", "лада", "двигатель")
+        
+        part_id = mixed_parts.search_parts("MX001")[0]['id']
+        mixed_parts.update_part(part_id, brand="ВАЗ")
+        row = conn.execute("SELECT brand_cf FROM parts WHERE id = ?", (part_id,)).fetchone()
+        assert row == ("ваз",)
+    
+    @pytest.mark.parametrize("fts_enabled", [True, False])
+    def test_cyrillic_case_insensitive(self, mixed_parts, fts_enabled):
+        """Поиск по кириллице не зависит от регистра (FTS и сканирование)"""
+        mixed_parts._fts_enabled = fts_enabled
+        
+        assert [p['article'] for p in mixed_parts.search_parts("фильтр")] == ["MX001"]
+        assert [p['article'] for p in mixed_parts.search_parts("ЛАДА")] == ["MX001"]
+        assert [p['article'] for p in mixed_parts.search_parts("кузов")] == ["MX002"]
+        assert [p['article'] for p in mixed_parts.search_parts("bmw")] == ["MX002"]
+    
+    def test_scan_unicode_folding(self, mixed_parts):
+        """Сканирование учитывает «ё»/«е» и полное свёртывание регистра"""
+        mixed_parts._fts_enabled = False
+        
+        assert [p['article'] for p in mixed_parts.search_parts("емкость")] == ["MX002"]
+        assert [p['article'] for p in mixed_parts.search_parts("STRASSE")] == ["MX003"]
+        assert [p['article'] for p in mixed_parts.search_parts("масл")] == ["MX001"]
+    
+    def test_scan_article_by_key(self, mixed_parts):
+        """Сканирование сравнивает артикул по article_key, без функций Python"""
+        mixed_parts._fts_enabled = False
+        conn = mixed_parts._connections.reader()
+        conn.create_function('ap_casefold', 1, lambda value: pytest.fail("вызов ap_casefold"))
+        try:
+            assert [p['article'] for p in mixed_parts.search_parts("x-00")] == \
+                ["MX001", "MX002", "MX003"]
+            assert [p['article'] for p in mixed_parts.search_parts("mx002")] == ["MX002"]
+            # Запрос из одних разделителей не совпадает с каждым артикулом
+            assert mixed_parts.search_parts("-") == []
+        finally:
+            register_search_functions(conn)
+    
+    def test_columns_not_indexed(self, mixed_parts):
+        """Индексы *_cf не создаются: поиск подстроки их не использует"""
+        indexes = {row[1] for row in mixed_parts._connections.reader().execute(
+            "PRAGMA index_list('parts')")}
+        assert not [name for name in indexes if name.endswith('_cf')]
+
+
+class TestArticleKey:
+    """Тесты нормализованного артикула article_key"""
+    
+    @pytest.fixture
+    def toyota_parts(self, temp_simple_db):
+        """Артикулы с разными разделителями"""
+        temp_simple_db.add_part("04465-33450", "Колодки передние", "Toyota", "Camry", "Тормоза", 4, 900, 1500)
+        temp_simple_db.add_part("04465 33471", "Колодки задние", "Toyota", "Camry", "Тормоза", 2, 800, 1300)
+        temp_simple_db.add_part("90915-YZZE1", "Масляный фильтр", "Toyota", "Corolla", "Двигатель", 9, 300, 500)
+        return temp_simple_db
+    
+    def test_find_by_article_ignores_separators(self, toyota_parts):
+        """Точный поиск не зависит от дефисов, пробелов и регистра"""
+        for article in ("04465-33450", "0446533450", "04465 33450", "04465.33450"):
+            assert toyota_parts.find_by_article(article)['article'] == "04465-33450"
+        assert toyota_parts.find_by_article("90915yzze1")['article'] == "90915-YZZE1"
+        assert toyota_parts.find_by_article("04465-99999") is None
+        assert toyota_parts.find_by_article("--") is None
+    
+    def test_prefix_lookup(self, toyota_parts):
+        """Поиск по префиксу нормализованного артикула"""
+        found = toyota_parts.find_parts_by_article_prefix("04465-")
+        assert [p['article'] for p in found] == ["04465-33450", "04465 33471"]
+        assert toyota_parts.find_parts_by_article_prefix("04465", limit=1)[0]['article'] == "04465-33450"
+    
+    def test_search_parts_matches_article_without_separators(self, toyota_parts):
+        """Общий поиск находит артикул, набранный без разделителей"""
+        assert [p['article'] for p in toyota_parts.search_parts("0446533450")] == ["04465-33450"]
+        assert [p['article'] for p in toyota_parts.search_parts("9091")] == ["90915-YZZE1"]
+    
+    def test_key_follows_update(self, toyota_parts):
+        """Триггер пересчитывает ключ при смене артикула"""
+        part = toyota_parts.find_by_article("0446533450")
+        toyota_parts.update_part(part['id'], article="04465-33451")
+        assert toyota_parts.find_by_article("0446533450") is None
+        assert toyota_parts.find_by_article("0446533451")['id'] == part['id']
+    
+    def test_duplicate_normalized_article_rejected(self, toyota_parts):
+        """Артикул, совпадающий с существующим после нормализации, не добавляется"""
+        assert not toyota_parts.add_part("0446533450", "Дубль", "Toyota", "Camry", "Тормоза", 1, 1, 2)
+        assert len(toyota_parts.get_all_parts()) == 3
+    
+    def test_lookup_uses_index(self, toyota_parts):
+        """Точный и префиксный поиск идут по индексу parts_article_key"""
+        conn = toyota_parts._connections.reader()
+        for sql, params in (("SELECT * FROM parts WHERE article_key = ?", ("0446533450",)),
+                            ("SELECT * FROM parts WHERE article_key >= ? AND article_key < ?",
+                             ("04465", "04466"))):
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            assert 'parts_article_key' in ' '.join(row[-1] for row in plan)
+
+
+class TestPartsPage:
+    """Тесты постраничной выборки запчастей"""
+    
+    @pytest.fixture
+    def catalog(self, temp_simple_db):
+        """25 запчастей двух марок с повторяющимися названиями"""
+        for i in range(25):
+            temp_simple_db.add_part(f"PG{i:03d}", f"Фильтр {i % 5}", "Toyota" if i % 2 else "Kia",
+                                    "Camry", "Двигатель", i, 100, 100 + i)
+        return temp_simple_db
+    
+    def collect(self, db, **kwargs):
+        """Пройти все страницы и вернуть артикулы и число страниц"""
+        articles, pages, key = [], 0, None
+        while True:
+            parts, key = db.get_parts_page(after_key=key, **kwargs)
+            articles.extend(p['article'] for p in parts)
+            pages += 1
+            if key is None:
+                return articles, pages
+    
+    def test_pages_cover_catalog_once(self, catalog):
+        """Страницы идут без пропусков и повторов"""
+        articles, pages = self.collect(catalog, limit=10)
+        assert articles == [f"PG{i:03d}" for i in range(25)]
+        assert pages == 3
+    
+    def test_order_by_with_ties(self, catalog):
+        """Сортировка по неуникальной колонке, в т.ч. в обратном порядке"""
+        articles, _ = self.collect(catalog, limit=4, order_by='name')
+        assert len(articles) == len(set(articles)) == 25
+        
+        parts, _ = catalog.get_parts_page(limit=3, order_by='-sell_price')
+        assert [p['article'] for p in parts] == ["PG024", "PG023", "PG022"]
+    
+    def test_unknown_order_column(self, catalog):
+        """Сортировка по произвольному выражению запрещена"""
+        with pytest.raises(ValueError):
+            catalog.get_parts_page(order_by='name; DROP TABLE parts')
+    
+    @pytest.mark.parametrize("fts_enabled", [True, False])
+    def test_filters(self, catalog, fts_enabled):
+        """Фильтры по марке, остатку и тексту поиска"""
+        catalog._fts_enabled = fts_enabled
+        filters = {'brand': 'Toyota', 'max_quantity': 10, 'query': 'фильтр 3'}
+        articles, _ = self.collect(catalog, limit=2, filters=filters)
+        assert articles == ["PG003"]
+        assert catalog.count_parts(filters) == 1
+        
+        assert catalog.count_parts({'query': 'pg01'}) == 10
+    
+    def test_summary(self, catalog):
+        """Итоги считаются по всему каталогу"""
+        summary = catalog.get_parts_summary()
+        assert summary['count'] == 25
+        assert summary['low_stock'] == 6
+        assert summary['total_value'] == sum((100 + i) * i for i in range(25))
+        assert catalog.get_parts_summary({'brand': 'Nissan'})['count'] == 0
+
+    @pytest.mark.parametrize("order_by", ['article', '-name', 'quantity', '-sell_price'])
+    def test_broad_search_same_pages(self, catalog, order_by):
+        """Обход индекса при широком поиске даёт те же страницы"""
+        filters = {'query': 'toyota'}
+        expected, _ = self.collect(catalog, limit=4, order_by=order_by, filters=filters)
+
+        with patch('database_simple.BROAD_SEARCH_ROWS', 2):
+            assert catalog._is_broad_search(filters)
+            catalog._cache.clear()
+            articles, _ = self.collect(catalog, limit=4, order_by=order_by, filters=filters)
+
+        assert len(expected) == 12
+        assert articles == expected
+
+
+class TestImportParts:
+    """Тесты массового импорта каталога"""
+    
+    CSV = ("Артикул;Наименование;Марка;Кол-во;Закуп. цена;Цена\n"
+           "IM-001;Фильтр;Kia;5;100,5;1 200,00\n"
+           "IM-002;Колодки;;2;50;\n"
+           ";Без артикула;;;;\n"
+           "IM-003;;;1;1;1\n"
+           "IM002;Дубль ключа;;1;1;1\n"
+           "IM-004;Ремень;;x;1;1\n")
+    
+    @pytest.fixture
+    def catalog_file(self, tmp_path):
+        """CSV в формате Excel с русскими заголовками"""
+        path = tmp_path / 'catalog.csv'
+        path.write_text(self.CSV, encoding='utf-8-sig')
+        return str(path)
+    
+    def test_import_csv(self, temp_simple_db, catalog_file):
+        """Корректные строки записаны, ошибочные перечислены с номерами"""
+        progress = []
+        result = temp_simple_db.import_parts(read_catalog(catalog_file), chunk_size=2,
+                                             progress=progress.append)
+        
+        assert result['inserted'] == 2
+        assert [number for number, _ in result['errors']] == [3, 4, 5, 6]
+        assert progress == [2, 5, 6]
+        
+        part = temp_simple_db.find_by_article("IM-001")
+        assert (part['brand'], part['quantity'], part['buy_price'], part['sell_price']) == \
+            ("Kia", 5, 100.5, 1200.0)
+        part = temp_simple_db.find_by_article("IM-002")
+        assert (part['brand'], part['sell_price']) == ("Универсальная", 50.0)
+        assert temp_simple_db.search_parts("колодки")[0]['article'] == "IM-002"
+    
+    def test_update_keeps_missing_fields(self, temp_simple_db):
+        """Обновление меняет только поля, указанные в строке"""
+        temp_simple_db.add_part("UP001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        
+        result = temp_simple_db.import_parts([{'article': 'UP001', 'sell_price': '199'},
+                                              {'article': 'UP002', 'name': 'Новая'}])
+        assert (result['inserted'], result['updated'], result['errors']) == (1, 1, [])
+        
+        part = temp_simple_db.find_by_article("UP001")
+        assert (part['name'], part['quantity'], part['sell_price']) == ("Фильтр", 5, 199.0)
+    
+    def test_skip_existing(self, temp_simple_db):
+        """Режим skip не трогает существующие артикулы"""
+        temp_simple_db.add_part("SK001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        
+        result = temp_simple_db.import_parts([{'article': 'SK001', 'name': 'Другое'},
+                                              {'article': 'SK002', 'name': 'Новая'}],
+                                             on_conflict='skip')
+        assert (result['inserted'], result['updated'], result['skipped']) == (1, 0, 1)
+        assert temp_simple_db.find_by_article("SK001")['name'] == "Фильтр"
+    
+    def test_cancel_keeps_written_chunks(self, temp_simple_db):
+        """Прерывание из progress сохраняет уже записанные пачки"""
+        rows = ({'article': f'CN{i:03d}', 'name': 'Деталь'} for i in range(10))
+        result = temp_simple_db.import_parts(rows, chunk_size=3, progress=lambda n: n < 6)
+        
+        assert result['cancelled']
+        assert temp_simple_db.count_parts() == 6
+    
+    def test_unknown_conflict_mode(self, temp_simple_db):
+        """Неизвестный режим конфликта - ошибка"""
+        with pytest.raises(ValueError):
+            temp_simple_db.import_parts([], on_conflict='replace')
+
+
+class TestCheckout:
+    """Тесты оформления продажи одной транзакцией"""
+    
+    @pytest.fixture
+    def stock(self, temp_simple_db):
+        """Две запчасти с остатками 10 и 2"""
+        temp_simple_db.add_part("CO001", "Фильтр", "Kia", "Rio", "Двигатель", 10, 100, 150)
+        temp_simple_db.add_part("CO002", "Свеча", "Kia", "Rio", "Двигатель", 2, 50, 80)
+        parts = temp_simple_db.get_all_parts()
+        return temp_simple_db, parts[0]['id'], parts[1]['id']
+    
+    def test_returns_sale_id(self, stock):
+        """Успешная продажа возвращает id и списывает остатки"""
+        db, first, second = stock
+        result = db.checkout([{'part_id': first, 'quantity': 3, 'price': 150.0},
+                              {'part_id': second, 'quantity': 2, 'price': 80.0}])
+        
+        assert result['failures'] == []
+        assert result['sale_id'] == db.get_all_sales()[0]['id']
+        assert len(db.get_sale_items(result['sale_id'])) == 2
+        assert db.get_part_by_id(first)['quantity'] == 7
+        assert db.get_part_by_id(second)['quantity'] == 0
+    
+    def test_duplicate_lines_checked_together(self, stock):
+        """Позиции одной запчасти суммируются при проверке остатка"""
+        db, _, second = stock
+        result = db.checkout([{'part_id': second, 'quantity': 1, 'price': 80.0},
+                              {'part_id': second, 'quantity': 2, 'price': 80.0}])
+        
+        assert result['sale_id'] is None
+        assert [(f['line'], f['requested'], f['available']) for f in result['failures']] == \
+            [(1, 3, 2), (2, 3, 2)]
+    
+    def test_failure_rolls_back_everything(self, stock):
+        """При ошибке одной позиции остатки других не меняются"""
+        db, first, second = stock
+        result = db.checkout([{'part_id': first, 'quantity': 9, 'price': 150.0},
+                              {'part_id': second, 'quantity': 5, 'price': 80.0},
+                              {'part_id': 99999, 'quantity': 1, 'price': 1.0}])
+        
+        assert result['sale_id'] is None
+        assert [(f['line'], f['reason']) for f in result['failures']] == [
+            (2, "недостаточно товара на складе"), (3, "товар не найден")]
+        assert result['failures'][0]['available'] == 2
+        assert db.get_part_by_id(first)['quantity'] == 10
+        assert db.get_all_sales() == []
+    
+    def test_invalid_quantity(self, stock):
+        """Нулевое количество отклоняется до обращения к складу"""
+        db, first, _ = stock
+        result = db.checkout([{'part_id': first, 'quantity': 0, 'price': 150.0}])
+        assert result['sale_id'] is None
+        assert result['failures'][0]['line'] == 1
+        assert db.checkout([])['sale_id'] is None
+
+
+class TestRecords:
+    """Тесты компактных записей и колоночного представления"""
+    
+    def test_record_dict_compatible(self, temp_simple_db):
+        """Запись читается как словарь и как объект"""
+        temp_simple_db.add_part("RC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        part = temp_simple_db.get_all_parts()[0]
+        
+        assert isinstance(part, Record)
+        assert part['article'] == part.article == "RC001"
+        assert part.get('missing', 'нет') == 'нет'
+        assert 'sell_price' in part and 'missing' not in part
+        assert dict(part)['quantity'] == 5
+        assert part.to_dict() == dict(part.items())
+        with pytest.raises(KeyError):
+            part['missing']
+    
+    def test_record_types_shared(self, temp_simple_db):
+        """Один тип записи на набор колонок, без словаря на строку"""
+        temp_simple_db.add_part("RC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        temp_simple_db.add_part("RC002", "Свеча", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        first, second = temp_simple_db.get_all_parts()
+        
+        assert type(first) is type(second)
+        assert not hasattr(first, '__dict__')
+        assert type(temp_simple_db.get_part_by_id(first.id)) is type(first)
+    
+    def test_sales_records(self, temp_simple_db):
+        """Продажи и позиции тоже возвращаются записями"""
+        temp_simple_db.add_part("RC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        part_id = temp_simple_db.get_all_parts()[0].id
+        sale_id = temp_simple_db.checkout([{'part_id': part_id, 'quantity': 2, 'price': 150.0}])['sale_id']
+        
+        sale = temp_simple_db.get_all_sales()[0]
+        assert (sale['id'], sale.items_count) == (sale_id, 1)
+        item = temp_simple_db.get_sale_items(sale_id)[0]
+        assert (item['article'], item.quantity) == ("RC001", 2)
+    
+    def test_parts_columns(self, temp_simple_db):
+        """Колонки каталога массивами"""
+        temp_simple_db.add_part("RC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150.5)
+        temp_simple_db.add_part("RC002", "Свеча", "BMW", "X5", "Электрика", 3, 10, 20)
+        
+        columns = temp_simple_db.get_parts_columns(('brand', 'quantity', 'sell_price'))
+        assert list(columns['quantity']) == [5, 3]
+        # Цены - в копейках
+        assert list(columns['sell_price']) == [15050, 2000]
+        assert columns['quantity'].typecode == columns['sell_price'].typecode == 'q'
+        assert columns['brand'] == ("Kia", "BMW")
+        
+        with pytest.raises(ValueError):
+            temp_simple_db.get_parts_columns(('quantity', 'name_cf; DROP TABLE parts'))
+    
+    def test_columns_of_empty_result(self, temp_simple_db):
+        """Пустая выборка даёт пустые колонки"""
+        cursor = temp_simple_db._connections.reader().execute("SELECT id, name FROM parts")
+        assert fetch_columns(cursor) == {'id': (), 'name': ()}
+
+
+class TestPartRecordWrites:
+    """Тесты методов записи, возвращающих запись запчасти"""
+    
+    def test_add_update_delete_records(self, temp_simple_db):
+        """Запись возвращается после добавления, изменения и удаления"""
+        added = temp_simple_db.add_part_record("RW001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        assert added['article'] == "RW001" and added['quantity'] == 5
+        assert temp_simple_db.get_part_by_id(added['id']) == added
+        
+        updated = temp_simple_db.update_part_record(added['id'], quantity=2)
+        assert updated['id'] == added['id'] and updated['quantity'] == 2
+        
+        deleted = temp_simple_db.delete_part_record(added['id'])
+        assert deleted == updated
+        assert temp_simple_db.get_part_by_id(added['id']) is None
+    
+    def test_missing_part(self, temp_simple_db):
+        """Для несуществующей запчасти и дубликата возвращается None"""
+        temp_simple_db.add_part("RW001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        assert temp_simple_db.add_part_record("RW001", "Дубль", "Kia", "Rio", "Двигатель", 1, 1, 1) is None
+        assert temp_simple_db.update_part_record(99999, quantity=1) is None
+        assert temp_simple_db.delete_part_record(99999) is None
+    
+    def test_part_matches(self, temp_simple_db):
+        """Проверка запчасти на соответствие фильтрам списка"""
+        part = temp_simple_db.add_part_record("RW001", "Масляный фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        assert temp_simple_db.part_matches(part['id'])
+        assert temp_simple_db.part_matches(part['id'], {'query': 'масл'})
+        assert not temp_simple_db.part_matches(part['id'], {'query': 'колодки'})
+        assert not temp_simple_db.part_matches(part['id'], {'brand': 'BMW'})
+
+
+class TestStatistics:
+    """Тесты агрегатов для вкладки статистики"""
+    
+    @pytest.fixture
+    def stock_db(self, temp_simple_db):
+        db = temp_simple_db
+        db.add_part("S001", "Фильтр", "Лада", "Веста", "Двигатель", 2, 100, 150)
+        db.add_part("S002", "Колодки", "Лада", "Гранта", "Тормоза", 10, 200, 300)
+        db.add_part("S003", "Свеча", "BMW", "X5", "Двигатель", 0, 50, 90)
+        db.add_part("S004", "Диск", "Audi", "A4", "Тормоза", 4, 1000, 1500)
+        return db
+    
+    def test_matches_python_aggregation(self, stock_db):
+        """Агрегаты БД совпадают с подсчётом по всем запчастям"""
+        parts = stock_db.get_all_parts()
+        stats = stock_db.get_statistics(top_brands=2, low_stock_limit=2)
+        
+        assert stats['totals'] == {
+            'count': 4,
+            'quantity': sum(p['quantity'] for p in parts),
+            'buy_value': sum(p['buy_price'] * p['quantity'] for p in parts),
+            'sell_value': sum(p['sell_price'] * p['quantity'] for p in parts),
+            'low_stock': 3,
+        }
+        assert [tuple(g) for g in stats['categories']] == [
+            ("Двигатель", 2, 2, 300, 200), ("Тормоза", 2, 14, 9000, 6000)]
+        # Топ марок по стоимости остатков
+        assert [(g['key'], g['value']) for g in stats['brands']] == [
+            ("Audi", 6000), ("Лада", 3300)]
+        # Всего три позиции с низким остатком, показаны две самые малые
+        assert stats['low_stock_count'] == 3
+        assert [p['article'] for p in stats['low_stock']] == ["S003", "S001"]
+    
+    def test_empty_database(self, temp_simple_db):
+        stats = temp_simple_db.get_statistics()
+        assert stats['totals']['count'] == 0
+        assert stats['totals']['sell_value'] == 0
+        assert stats['categories'] == [] and stats['brands'] == []
+        assert stats['low_stock'] == [] and stats['low_stock_count'] == 0
+    
+    def test_group_column_checked(self, temp_simple_db):
+        with pytest.raises(ValueError):
+            temp_simple_db.get_group_stats('name; DROP TABLE parts')
+    
+    def test_summaries_follow_writes(self, stock_db):
+        """Триггеры поддерживают сводки при любых изменениях parts"""
+        part_id = stock_db.find_by_article("S001")['id']
+        stock_db.update_part(part_id, category="Кузов", quantity=7, sell_price=175.5)
+        stock_db.update_part(part_id, name="Фильтр воздушный")
+        stock_db.delete_part(stock_db.find_by_article("S003")['id'])
+        stock_db.checkout([{'part_id': stock_db.find_by_article("S002")['id'],
+                            'quantity': 9, 'price': 300}])
+        stock_db.import_parts([{'article': 'S010', 'name': 'Ремень', 'brand': 'BMW',
+                                'car_model': 'X3', 'category': 'Двигатель',
+                                'quantity': 3, 'buy_price': 10, 'sell_price': 20}])
+        
+        assert stock_db.check_summaries() == []
+        # Опустевшая группа удалена, новая появилась
+        assert [g['key'] for g in stock_db.get_group_stats('category')] == [
+            "Двигатель", "Кузов", "Тормоза"]
+        assert stock_db.get_parts_summary() == {
+            'count': 4, 'total_value': 7 * 175.5 + 300 + 6000 + 60, 'low_stock': 3}
+    
+    def test_rebuild_summaries(self, stock_db):
+        """Рассинхронизированные сводки находятся проверкой и пересчитываются"""
+        with stock_db._connections.writer() as conn:
+            conn.execute("UPDATE inventory_totals SET count = count + 1")
+            conn.execute("DELETE FROM brand_summary WHERE key = 'BMW'")
+        
+        problems = stock_db.check_summaries()
+        assert len(problems) == 2
+        assert any('brand_summary[BMW]' in problem for problem in problems)
+        
+        assert stock_db.rebuild_summaries()
+        assert stock_db.check_summaries() == []
+        assert stock_db.get_inventory_totals()['count'] == 4
+    
+    def test_filtered_summary_scans(self, stock_db):
+        """С фильтрами итоги по-прежнему считаются по parts"""
+        assert stock_db.get_parts_summary({'query': 'Лада'}) == {
+            'count': 2, 'total_value': 3300, 'low_stock': 1}
+    
+    def test_cache_invalidated_by_write(self, stock_db):
+        """Повторный запрос берётся из кэша до первой записи"""
+        assert stock_db.get_statistics() is not None
+        stock_db.add_part("S005", "Ремень", "Лада", "Веста", "Двигатель", 1, 10, 20)
+        assert stock_db.get_statistics()['low_stock_count'] == 4
+
+
+class TestDistinctValues:
+    """Тесты списков значений для подсказок ввода"""
+    
+    def test_sorted_case_insensitive(self, temp_simple_db):
+        db = temp_simple_db
+        db.add_part("DV001", "Фильтр", "kia", "Rio", "Двигатель", 5, 100, 150)
+        db.add_part("DV002", "Колодки", "BMW", "X5", "Тормоза", 5, 100, 150)
+        db.add_part("DV003", "Свеча", "Audi", "", "Двигатель", 5, 100, 150)
+        
+        assert db.get_distinct_values('brand') == ["Audi", "BMW", "kia"]
+        # Пустые значения не подсказываются
+        assert db.get_distinct_values('car_model') == ["Rio", "X5"]
+        assert db.get_distinct_values('category') == ["Двигатель", "Тормоза"]
+        with pytest.raises(ValueError):
+            db.get_distinct_values('name')
+    
+    def test_follows_writes(self, temp_simple_db):
+        """Кэшированный список обновляется после записи"""
+        db = temp_simple_db
+        db.add_part("DV001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        assert db.get_distinct_values('car_model') == ["Rio"]
+        
+        part_id = db.find_by_article("DV001")['id']
+        db.update_part(part_id, car_model="Ceed")
+        assert db.get_distinct_values('car_model') == ["Ceed"]
+        db.delete_part(part_id)
+        assert db.get_distinct_values('car_model') == []
+
+
+class TestQueryCache:
+    """Тесты кэша чтений"""
+    
+    def test_repeated_read_hits_cache(self, temp_simple_db):
+        """Повторное чтение без изменений берётся из кэша"""
+        temp_simple_db.add_part("QC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        before = temp_simple_db.cache_stats()
+        
+        first = temp_simple_db.get_all_parts()
+        second = temp_simple_db.get_all_parts()
+        
+        stats = temp_simple_db.cache_stats()
+        assert stats['misses'] - before['misses'] == 1
+        assert stats['hits'] - before['hits'] == 1
+        assert first == second and first is not second
+    
+    def test_own_write_invalidates(self, temp_simple_db):
+        """Запись через SimpleDatabase сбрасывает кэш"""
+        temp_simple_db.add_part("QC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        part = temp_simple_db.get_all_parts()[0]
+        
+        temp_simple_db.update_part(part.id, quantity=7)
+        assert temp_simple_db.get_part_by_id(part.id).quantity == 7
+        assert temp_simple_db.get_all_parts()[0].quantity == 7
+    
+    def test_other_process_write_invalidates(self, temp_simple_db):
+        """Запись другим соединением замечается через PRAGMA data_version"""
+        temp_simple_db.add_part("QC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        assert temp_simple_db.count_parts() == 1
+        
+        conn = sqlite3.connect(temp_simple_db.db_path)
+        try:
+            conn.execute("UPDATE parts SET quantity = 0")
+            conn.commit()
+        finally:
+            conn.close()
+        
+        assert temp_simple_db.get_parts_summary()['low_stock'] == 1
+    
+    def test_result_copy_protects_cache(self, temp_simple_db):
+        """Изменение возвращённого списка не портит кэш"""
+        temp_simple_db.add_part("QC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        temp_simple_db.get_all_parts().clear()
+        assert len(temp_simple_db.get_all_parts()) == 1
+    
+    def test_nested_results_copied(self, temp_simple_db):
+        """Вложенные списки и массивы результата тоже копируются"""
+        temp_simple_db.add_part("QC001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        temp_simple_db.get_statistics()['categories'].clear()
+        temp_simple_db.get_parts_columns()['quantity'].append(99)
+        
+        assert len(temp_simple_db.get_statistics()['categories']) == 1
+        assert list(temp_simple_db.get_parts_columns()['quantity']) == [5]
+        assert temp_simple_db.cache_stats()['hits'] == 2
+    
+    def test_row_limit(self):
+        """Суммарное число строк ограничено, слишком большой результат не кэшируется"""
+        from query_cache import QueryCache
+        cache = QueryCache(lambda: 0, max_rows=5)
+        cache.get_or_load('a', lambda: [1, 2, 3])
+        # Список из 2 строк и ключ: 3 строки, 'a' вытесняется
+        cache.get_or_load('b', lambda: ([4, 5], None))
+        assert cache.stats() == {'hits': 0, 'misses': 2, 'invalidations': 0,
+                                 'size': 1, 'rows': 3}
+        cache.get_or_load('c', lambda: [6, 7])
+        cache.get_or_load('all', lambda: list(range(10)))
+        stats = cache.stats()
+        assert (stats['size'], stats['rows'], stats['misses']) == (2, 5, 4)
+        assert cache.get_or_load('b', lambda: None) == ([4, 5], None)
+        assert cache.get_or_load('a', lambda: ['заново']) == ['заново']
+    
+    def test_lru_limit(self, tmp_path):
+        """Число записей ограничено, вытесняются давно не использованные"""
+        db = SimpleDatabase(str(tmp_path / 'lru.db'), cache_size=2)
+        try:
+            for part_id in (1, 2, 3, 1):
+                db.get_part_by_id(part_id)
+            stats = db.cache_stats()
+            assert stats['size'] == 2
+            assert stats['hits'] == 0
+        finally:
+            db.close()
+
+
+class TestPartsTableModel:
+    """Тесты модели таблицы запчастей"""
+    
+    @pytest.fixture
+    def model_class(self):
+        pytest.importorskip("PySide6")
+        from parts_table_model import PartsTableModel
+        return PartsTableModel
+    
+    def test_fetch_more_pages(self, temp_simple_db, model_class):
+        """Модель загружает первую страницу и догружает остальные по запросу"""
+        for i in range(7):
+            temp_simple_db.add_part(f"TM{i:03d}", f"Деталь {i}", "Kia", "Rio", "Кузов", 10, 100, 150)
+        
+        model = model_class(temp_simple_db, page_size=3)
+        model.reload()
+        assert model.rowCount() == 3
+        
+        while model.canFetchMore():
+            model.fetchMore()
+        assert model.rowCount() == 7
+        assert [model.part_at(row)['article'] for row in range(7)] == [f"TM{i:03d}" for i in range(7)]
+        assert model.part_at(7) is None
+    
+    def test_lazy_formatting(self, temp_simple_db, model_class):
+        """Цены форматируются в data(), низкий остаток подсвечивается"""
+        from PySide6.QtCore import Qt
+        temp_simple_db.add_part("TM001", "Мало", "Kia", "Rio", "Кузов", 2, 100, 150.5)
+        temp_simple_db.add_part("TM002", "Много", "Kia", "Rio", "Кузов", 20, 100, 150)
+        
+        model = model_class(temp_simple_db)
+        model.reload(order_by='article')
+        
+        assert model.data(model.index(0, 8)) == "150.50 ₽"
+        assert model.data(model.index(0, 8), Qt.UserRole) == 150.5
+        assert model.data(model.index(0, 1)) == "TM001"
+        assert model.data(model.index(0, 1), Qt.BackgroundRole) is not None
+        assert model.data(model.index(1, 1), Qt.BackgroundRole) is None
+    
+    def test_reload_with_filter(self, temp_simple_db, model_class):
+        """Повторная загрузка с фильтром заменяет строки"""
+        temp_simple_db.add_part("TM001", "Фильтр масляный", "Kia", "Rio", "Двигатель", 10, 100, 150)
+        temp_simple_db.add_part("TM002", "Колодки", "Kia", "Rio", "Тормоза", 10, 100, 150)
+        
+        model = model_class(temp_simple_db)
+        model.reload()
+        assert model.rowCount() == 2
+        
+        model.reload(filters={'query': 'колодки'})
+        assert model.rowCount() == 1
+        assert model.part_at(0)['article'] == "TM002"
+
+
+    def test_put_and_remove_part(self, temp_simple_db, model_class):
+        """Точечные изменения ставят запчасть на её место в сортировке"""
+        for i in range(0, 10, 2):
+            temp_simple_db.add_part(f"TM{i:03d}", f"Деталь {i}", "Kia", "Rio", "Кузов", 10, 100, 150)
+        
+        model = model_class(temp_simple_db, page_size=3)
+        model.reload()
+        articles = lambda: [model.part_at(row)['article'] for row in range(model.rowCount())]
+        assert articles() == ["TM000", "TM002", "TM004"]
+        
+        added = temp_simple_db.add_part_record("TM001", "Новая", "Kia", "Rio", "Кузов", 1, 1, 1)
+        assert model.put_part(added) == 1
+        # За границей загруженных страниц - придёт со следующей страницей
+        late = temp_simple_db.add_part_record("TM005", "Поздняя", "Kia", "Rio", "Кузов", 1, 1, 1)
+        assert model.put_part(late) == -1
+        
+        moved = temp_simple_db.update_part_record(added['id'], article="TM003")
+        assert model.put_part(moved) == 2
+        assert articles() == ["TM000", "TM002", "TM003", "TM004"]
+        
+        assert model.remove_part(moved['id'])
+        assert not model.remove_part(moved['id'])
+        while model.canFetchMore():
+            model.fetchMore()
+        assert articles() == ["TM000", "TM002", "TM004", "TM005", "TM006", "TM008"]
+    
+    def test_is_beyond_loaded(self, temp_simple_db, model_class):
+        """Граница загруженных страниц с учётом направления сортировки"""
+        parts = [temp_simple_db.add_part_record(f"TM{i:03d}", f"Деталь {i}", "Kia", "Rio",
+                                                "Кузов", 10, 100, 150) for i in range(5)]
+        model = model_class(temp_simple_db, page_size=2)
+        
+        model.reload(order_by='article')
+        assert [model.is_beyond_loaded(part) for part in parts] == \
+            [False, False, True, True, True]
+        model.reload(order_by='-article')
+        assert [model.is_beyond_loaded(part) for part in parts] == \
+            [True, True, True, False, False]
+        while model.canFetchMore():
+            model.fetchMore()
+        assert not any(model.is_beyond_loaded(part) for part in parts)
+
+
+class TestDbWorker:
+    """Тесты фонового выполнения запросов"""
+    
+    @pytest.fixture
+    def app(self):
+        pytest.importorskip("PySide6")
+        # QApplication (без экрана) - чтобы в тестах можно было создавать диалоги
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PySide6.QtWidgets import QApplication
+        return QApplication.instance() or QApplication([])
+    
+    def wait(self, app, worker, tasks):
+        """Дождаться задач и доставки их сигналов"""
+        worker.wait_for_done()
+        while not all(task.done for task in tasks):
+            app.processEvents()
+    
+    def test_results_and_errors(self, app, temp_simple_db):
+        """Результат и ошибка приходят сигналами, cancel отменяет доставку"""
+        from db_worker import DbWorker
+        worker = DbWorker()
+        temp_simple_db.add_part("BG001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        part_id = temp_simple_db.find_by_article("BG001")['id']
+        
+        received = []
+        read = worker.submit(temp_simple_db.find_by_article, "BG001")
+        read.finished.connect(lambda part: received.append(('read', part['name'])))
+        write = worker.submit_write(temp_simple_db.update_part, part_id, quantity=9)
+        write.finished.connect(lambda ok: received.append(('write', ok)))
+        failing = worker.submit(temp_simple_db.get_parts_page, order_by='nope')
+        failing.failed.connect(lambda message: received.append(('failed', 'nope' in message)))
+        cancelled = worker.submit(temp_simple_db.get_all_parts)
+        cancelled.finished.connect(lambda parts: received.append(('cancelled', parts)))
+        cancelled.cancel()
+        
+        self.wait(app, worker, [read, write, failing, cancelled])
+        
+        assert sorted(received) == [('failed', True), ('read', 'Фильтр'), ('write', True)]
+        assert temp_simple_db.find_by_article("BG001")['quantity'] == 9
+        assert not worker.is_busy()
+    
+    def test_model_loads_in_background(self, app, temp_simple_db):
+        """Модель таблицы с DbWorker загружает страницы асинхронно"""
+        from db_worker import DbWorker
+        from parts_table_model import PartsTableModel
+        worker = DbWorker()
+        for i in range(5):
+            temp_simple_db.add_part(f"BG{i:03d}", f"Деталь {i}", "Kia", "Rio", "Кузов", 10, 100, 150)
+        
+        model = PartsTableModel(temp_simple_db, page_size=2, worker=worker)
+        model.reload()
+        # Новая загрузка отменяет прежнюю - приходит только последняя
+        model.reload(filters={'query': 'BG004'})
+        while model.is_loading():
+            app.processEvents()
+        assert [model.part_at(row)['article'] for row in range(model.rowCount())] == ["BG004"]
+        
+        model.reload()
+        while model.is_loading():
+            app.processEvents()
+        model.fetchMore()
+        assert model.rowCount() == 2
+        while model.is_loading():
+            app.processEvents()
+        assert model.rowCount() == 4
+    
+    def test_reader_connections_bounded(self, app, temp_simple_db):
+        """Потоки пулов не истекают, поэтому соединений-читателей не больше потоков"""
+        from db_worker import DbWorker
+        worker = DbWorker(read_threads=2)
+        assert worker._read_pool.expiryTimeout() == worker._write_pool.expiryTimeout() == -1
+        
+        connections = temp_simple_db._connections._connections
+        # Соединение проверки data_version (кэш чтений) открывается заранее
+        temp_simple_db._connections.data_version()
+        before = len(connections)
+        for _ in range(5):
+            tasks = [worker.submit(temp_simple_db.count_parts) for _ in range(10)]
+            self.wait(app, worker, tasks)
+        # Не больше одного нового соединения на поток чтения
+        assert len(connections) - before <= 2
+    
+    def test_dialog_not_closed_while_saving(self, app, temp_simple_db):
+        """Диалог запчасти не закрывается, пока запись не завершена"""
+        import threading
+        from PySide6.QtWidgets import QMessageBox
+        import parts_dialogs
+        from db_worker import DbWorker
+        
+        worker = DbWorker()
+        release = threading.Event()
+        
+        def slow_add(**kwargs):
+            release.wait(5)
+            return temp_simple_db.add_part_record(**kwargs)
+        
+        with patch.object(parts_dialogs, 'get_db_worker', return_value=worker), \
+                patch.object(parts_dialogs.db, 'add_part_record', slow_add), \
+                patch.object(QMessageBox, 'information') as confirmed:
+            dialog = parts_dialogs.AddPartDialog()
+            dialog.article_input.setText("DL001")
+            dialog.name_input.setText("Фильтр")
+            dialog.category_input.setEditText("Двигатель")
+            dialog.show()
+            dialog.save_part()
+            
+            assert dialog.is_saving() and not dialog.cancel_btn.isEnabled()
+            dialog.reject()
+            assert dialog.isVisible()
+            
+            release.set()
+            worker.wait_for_done()
+            while dialog.is_saving():
+                app.processEvents()
+        
+        assert confirmed.called
+        assert dialog.result() == dialog.DialogCode.Accepted
+        assert temp_simple_db.find_by_article("DL001")['name'] == "Фильтр"
+
+
+class TestPartChanges:
+    """Тесты журнала изменений для автообновления"""
+    
+    def test_changes_since_mark(self, temp_simple_db):
+        db = temp_simple_db
+        db.add_part("CH001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        db.add_part("CH002", "Колодки", "Kia", "Rio", "Тормоза", 5, 100, 150)
+        first, second = (db.find_by_article(a)['id'] for a in ("CH001", "CH002"))
+        mark = db.get_change_mark()
+        assert db.get_part_changes(mark) == {'mark': mark, 'part_ids': []}
+        
+        db.update_part(second, quantity=1)
+        db.delete_part(first)
+        changes = db.get_part_changes(mark)
+        assert changes['part_ids'] == [second, first]
+        assert changes['mark'] == db.get_change_mark() > mark
+        # Слишком много изменений - перезагрузка целиком
+        assert db.get_part_changes(0, limit=1) == {'mark': changes['mark'], 'part_ids': None}
+    
+    def test_parts_by_ids_filtered(self, temp_simple_db):
+        db = temp_simple_db
+        db.add_part("CH001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        db.add_part("CH002", "Колодки", "Kia", "Rio", "Тормоза", 5, 100, 150)
+        ids = [db.find_by_article(a)['id'] for a in ("CH001", "CH002")]
+        
+        assert [p['article'] for p in db.get_parts_by_ids(ids + [999])] == ["CH001", "CH002"]
+        assert [p['article'] for p in db.get_parts_by_ids(ids, {'query': 'колодки'})] == ["CH002"]
+        assert db.get_parts_by_ids([]) == []
+    
+    def test_refresher_reports_changed_ids(self, temp_simple_db):
+        """Автообновление сообщает только об изменённых запчастях"""
+        pytest.importorskip("PySide6")
+        from PySide6.QtCore import QCoreApplication
+        from auto_refresh import AutoRefresher
+        from db_worker import DbWorker
+        app = QCoreApplication.instance() or QCoreApplication([])
+        db = temp_simple_db
+        db.add_part("CH001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        part_id = db.find_by_article("CH001")['id']
+        
+        worker = DbWorker()
+        refresher = AutoRefresher(db, 30, worker=worker)
+        received = []
+        refresher.parts_changed.connect(received.append)
+        
+        # База не менялась - в фон ничего не отправляется
+        refresher.check()
+        assert refresher.task is None
+        
+        db.update_part(part_id, quantity=2)
+        refresher.check()
+        while refresher.task is not None:
+            worker.wait_for_done()
+            app.processEvents()
+        assert received == [[part_id]]
+        
+        refresher.set_interval(0)
+        assert not refresher.timer.isActive()
+
+
+class TestForeignKeys:
+    """Тесты внешних ключей позиций документов на запчасти"""
+    
+    def test_foreign_keys_enabled(self, temp_simple_db):
+        conn = temp_simple_db._connections.reader()
+        assert conn.execute('PRAGMA foreign_keys').fetchone() == (1,)
+        assert {row[2] for row in conn.execute("PRAGMA foreign_key_list('sale_items')")} == \
+            {'parts', 'sales'}
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list('sale_items')")}
+        assert {'idx_sale_items_sale', 'idx_sale_items_part'} <= indexes
+    
+    def test_sold_part_cannot_be_deleted(self, temp_simple_db):
+        db = temp_simple_db
+        db.add_part("FK001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        db.add_part("FK002", "Свеча", "Kia", "Rio", "Двигатель", 5, 50, 80)
+        sold, unsold = (db.find_by_article(a)['id'] for a in ("FK001", "FK002"))
+        db.checkout([{'part_id': sold, 'quantity': 1, 'price': 150.0}])
+        
+        assert db.delete_part_record(sold) is None
+        assert db.get_part_by_id(sold)['quantity'] == 4
+        assert db.delete_part(unsold)
+    
+    def test_unknown_part_rejected(self, temp_simple_db):
+        """Поступление несуществующей запчасти не записывается"""
+        assert not temp_simple_db.create_receipt("Поставщик", [
+            {'part_id': 99999, 'quantity': 1, 'buy_price': 10.0}])
+        assert temp_simple_db.get_all_receipts() == []
+    
+    def test_sale_items_single_join(self, temp_simple_db):
+        """Позиции продажи с артикулами читаются одним запросом"""
+        db = temp_simple_db
+        db.add_part("FK001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        db.add_part("FK002", "Свеча", "Kia", "Rio", "Двигатель", 5, 50, 80)
+        first, second = (db.find_by_article(a)['id'] for a in ("FK001", "FK002"))
+        sale_id = db.checkout([{'part_id': second, 'quantity': 1, 'price': 80.0},
+                               {'part_id': first, 'quantity': 2, 'price': 150.0}])['sale_id']
+        
+        statements = []
+        db._connections.reader().set_trace_callback(statements.append)
+        try:
+            items = db.get_sale_items(sale_id)
+        finally:
+            db._connections.reader().set_trace_callback(None)
+        
+        assert [(item['article'], item['quantity']) for item in items] == \
+            [("FK002", 1), ("FK001", 2)]
+        assert len(statements) == 1
+
+
+class TestMoney:
+    """Тесты хранения сумм в копейках"""
+    
+    def test_to_kopecks(self):
+        assert to_kopecks(150) == 15000
+        assert to_kopecks(0.1 + 0.2) == 30
+        assert to_kopecks("100.005") == 10001
+        assert to_kopecks(Decimal("2.675")) == 268
+        assert to_kopecks(from_kopecks(12345)) == 12345
+        assert to_kopecks(None) is None
+    
+    def test_mixed_float_arithmetic(self):
+        """Money с float: без TypeError, результат - Money до копейки"""
+        price = from_kopecks(10000)
+        assert price * 1.2 == 1.2 * price == Decimal("120.00")
+        assert price + 0.1 == 0.1 + price == Decimal("100.10")
+        assert price - 0.005 == Decimal("100.00")
+        assert 150.5 - price == Decimal("50.50")
+        assert from_kopecks(333) * 0.5 == Decimal("1.67")
+        assert isinstance(price * 1.2, Money)
+        assert isinstance(sum([price, price, 0.1]), Money)
+        assert price * 3 == Decimal("300.00")
+    
+    def test_records_return_money(self, temp_simple_db):
+        """Цены хранятся копейками, а читаются как Money"""
+        db = temp_simple_db
+        db.add_part("MN001", "Фильтр", "Kia", "Rio", "Двигатель", 3, 0.1, 0.2)
+        part = db.find_by_article("MN001")
+        
+        assert isinstance(part['sell_price'], Money)
+        assert part['sell_price'] == Decimal("0.20")
+        assert f"{part['buy_price']:.2f}" == "0.10"
+        stored = db._connections.reader().execute(
+            'SELECT buy_price, sell_price FROM parts WHERE id = ?', (part['id'],)).fetchone()
+        assert stored == (10, 20)
+    
+    def test_totals_exact(self, temp_simple_db):
+        """Итоги считаются в SQL без ошибок округления"""
+        db = temp_simple_db
+        db.add_part("MN001", "Фильтр", "Kia", "Rio", "Двигатель", 10, 0.1, 0.1)
+        db.add_part("MN002", "Свеча", "Kia", "Rio", "Двигатель", 10, 0.2, 0.2)
+        part_id = db.find_by_article("MN001")['id']
+        
+        assert db.get_inventory_totals()['sell_value'] == Decimal("3.00")
+        sale_id = db.checkout([{'part_id': part_id, 'quantity': 3, 'price': 0.1}])['sale_id']
+        assert db.get_all_sales()[0]['total'] == Decimal("0.30")
+        assert db.get_sale_items(sale_id)[0]['price'] == Decimal("0.10")
+        assert db.check_summaries() == []
+
+
+class TestStockLedger:
+    """Тесты журнала движения остатков и остатков на дату"""
+    
+    @staticmethod
+    def add_movements(db, movements):
+        with db._connections.writer() as conn:
+            conn.executemany('''
+            INSERT INTO stock_movements (part_id, at, delta, kind) VALUES (?, ?, ?, 'adjust')
+            ''', movements)
+    
+    def test_movements_follow_documents(self, temp_simple_db):
+        """Продажа, поступление и правка пишут движения со ссылкой на документ"""
+        db = temp_simple_db
+        part_id = db.add_part_record("SL001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150).id
+        db.create_receipt("Поставщик", [{'part_id': part_id, 'quantity': 3, 'buy_price': 100}])
+        receipt_id = db.get_all_receipts()[0]['id']
+        sale_id = db.checkout([{'part_id': part_id, 'quantity': 2, 'price': 150}])['sale_id']
+        assert db.checkout([{'part_id': part_id, 'quantity': 99, 'price': 150}])['sale_id'] is None
+        db.update_part(part_id, quantity=10)
+        db.update_part(part_id, name="Фильтр масляный")
+        
+        movements = db.get_stock_movements(part_id)
+        assert [(m.kind, m.delta, m.document_id) for m in movements] == [
+            ('create', 5, None), ('receipt', 3, receipt_id), ('sale', -2, sale_id),
+            ('adjust', 4, None)]
+        assert sum(m.delta for m in movements) == db.get_part_by_id(part_id)['quantity']
+        assert movements[2].at == db.get_all_sales()[0]['date']
+    
+    def test_ledger_append_only(self, temp_simple_db):
+        temp_simple_db.add_part("SL001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150)
+        for sql in ('UPDATE stock_movements SET delta = 1', 'DELETE FROM stock_movements'):
+            with pytest.raises(sqlite3.IntegrityError):
+                with temp_simple_db._connections.writer() as conn:
+                    conn.execute(sql)
+        assert len(temp_simple_db.get_stock_movements(1)) == 1
+    
+    def test_stock_as_of(self, temp_simple_db):
+        """Остаток на дату - снимок на начало месяца плюс движения после него"""
+        db = temp_simple_db
+        first = db.add_part_record("SL001", "Фильтр", "Kia", "Rio", "Двигатель", 0, 100, 150).id
+        second = db.add_part_record("SL002", "Свеча", "Kia", "Rio", "Зажигание", 0, 50, 80).id
+        self.add_movements(db, [
+            (first, '2024-01-10T09:00:00', 10), (second, '2024-01-20T09:00:00', 4),
+            (first, '2024-02-05T12:00:00', -3), (first, '2024-03-01T08:00:00', 5),
+            (second, '2024-03-15T18:30:00', -4)])
+        with db._connections.writer() as conn:
+            assert take_stock_snapshots(conn.cursor(), today=date(2024, 4, 15)) == 3
+        
+        assert db.get_stock_as_of('2024-01-09', part_id=first) == 0
+        assert db.get_stock_as_of('2024-01-31', part_id=first) == 10
+        assert db.get_stock_as_of(date(2024, 2, 5), part_id=first) == 7
+        assert db.get_stock_as_of('2024-03-01', part_id=first) == 12
+        assert db.get_stock_as_of(datetime(2024, 3, 15, 18, 29), category="Зажигание") == 4
+        assert db.get_stock_as_of('2024-03-15T18:30:00', category="Зажигание") == 0
+        assert db.get_stock_as_of('2024-04-30') == 12
+        
+        # Движения до снимка не читаются: ответ берётся из снимка
+        with db._connections.writer() as conn:
+            conn.execute("UPDATE stock_snapshots SET quantity = 100 "
+                         "WHERE day = '2024-03-01' AND part_id = ?", (first,))
+        assert db.get_stock_as_of('2024-03-01', part_id=first) == 105
+    
+    def test_rebuild_from_documents(self, temp_simple_db):
+        """Журнал восстанавливается по документам, остальное - начальный остаток"""
+        db = temp_simple_db
+        part_id = db.add_part_record("SL001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150).id
+        db.create_receipt("Поставщик", [{'part_id': part_id, 'quantity': 3, 'buy_price': 100}])
+        db.checkout([{'part_id': part_id, 'quantity': 2, 'price': 150}])
+        db.update_part(part_id, quantity=10)
+        
+        assert db.rebuild_stock_ledger() == 3
+        movements = db.get_stock_movements(part_id)
+        assert [(m.kind, m.delta) for m in movements] == \
+            [('opening', 9), ('receipt', 3), ('sale', -2)]
+        assert db.get_stock_as_of(date.today(), part_id=part_id) == 10
+    
+    def test_snapshots_on_month_change(self, temp_simple_db):
+        """Снимки снимаются при записи документов, когда начался новый месяц"""
+        db = temp_simple_db
+        part_id = db.add_part_record("SL001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150).id
+        self.add_movements(db, [(part_id, '2024-01-10T09:00:00', 10)])
+        
+        def snapshot_days():
+            return [row[0] for row in db._connections.reader().execute(
+                'SELECT day FROM stock_snapshot_days ORDER BY day')]
+        
+        def on_day(day):
+            class FakeDate(date):
+                @classmethod
+                def today(cls):
+                    return day
+            return patch('database_simple.date', FakeDate)
+        
+        with on_day(date(2024, 2, 15)):
+            db.checkout([{'part_id': part_id, 'quantity': 1, 'price': 150}])
+        assert snapshot_days() == ['2024-02-01']
+        
+        with on_day(date(2024, 3, 2)), \
+                patch('database_simple.take_stock_snapshots',
+                      wraps=take_stock_snapshots) as snapshots:
+            db.create_receipt("Поставщик", [{'part_id': part_id, 'quantity': 1,
+                                             'buy_price': 100}])
+            db.checkout([{'part_id': part_id, 'quantity': 1, 'price': 150}])
+        # В пределах месяца журнал снимков больше не читается
+        assert snapshots.call_count == 1
+        assert snapshot_days() == ['2024-02-01', '2024-03-01']
+        assert db.get_stock_as_of('2024-02-29', part_id=part_id) == 10
+    
+    def test_check_stock_ledger(self, temp_simple_db):
+        """Сверка остатков с журналом находит расхождения"""
+        db = temp_simple_db
+        part_id = db.add_part_record("SL001", "Фильтр", "Kia", "Rio", "Двигатель", 5, 100, 150).id
+        db.checkout([{'part_id': part_id, 'quantity': 2, 'price': 150}])
+        assert db.check_stock_ledger() == []
+        
+        self.add_movements(db, [(part_id, '2024-01-10T09:00:00', 4)])
+        assert db.check_stock_ledger() == [f"запчасть {part_id}: остаток 3, по журналу 7"]
@@ -31,9 +31,13 @@ def temp_db():
     
     yield db
     
+    # Закрываем соединения (WAL удаляет -wal/-shm при закрытии)
+    db.close()
+    
     # Очистка
-    if os.path.exists(db.db_path):
-        os.unlink(db.db_path)
+    for path in (db.db_path, db.db_path + '-wal', db.db_path + '-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
     if os.path.exists(temp_dir):
         os.rmdir(temp_dir)
 
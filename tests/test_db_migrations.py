@@ -0,0 +1,369 @@
+"""
+Тесты для миграций схемы (db_migrations.py)
+"""
+
+import pytest
+import os
+import sqlite3
+import sys
+from decimal import Decimal
+from unittest.mock import patch
+
+# Добавляем путь к src для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database_simple import SimpleDatabase
+import db_migrations
+from db_migrations import SCHEMA_VERSION, MigrationError, apply_migrations, get_schema_version
+from part_links import rebuild_item_table
+
+# Схема до введения миграций (user_version = 0)
+LEGACY_SCHEMA = '''
+CREATE TABLE parts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    article TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    brand TEXT NOT NULL,
+    car_model TEXT NOT NULL,
+    category TEXT NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    buy_price REAL NOT NULL,
+    sell_price REAL NOT NULL,
+    description TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    total REAL NOT NULL
+);
+CREATE TABLE sale_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sale_id INTEGER NOT NULL,
+    part_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL,
+    FOREIGN KEY (sale_id) REFERENCES sales (id),
+    FOREIGN KEY (part_id) REFERENCES parts (id)
+);
+CREATE TABLE receipts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    supplier TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    notes TEXT
+);
+CREATE TABLE receipt_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    receipt_id INTEGER NOT NULL,
+    part_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    buy_price REAL NOT NULL,
+    FOREIGN KEY (receipt_id) REFERENCES receipts (id),
+    FOREIGN KEY (part_id) REFERENCES parts (id)
+);
+'''
+
+# Схема, которую создавали модели peewee до миграций: id запчасти
+# позиции продажи в колонке part, цены DECIMAL в рублях
+PEEWEE_LEGACY_SCHEMA = '''
+CREATE TABLE "parts" ("id" INTEGER NOT NULL PRIMARY KEY, "article" VARCHAR(100) NOT NULL,
+    "name" VARCHAR(255) NOT NULL, "brand" VARCHAR(100) NOT NULL,
+    "car_model" VARCHAR(100) NOT NULL, "category" VARCHAR(100) NOT NULL,
+    "quantity" INTEGER NOT NULL, "buy_price" DECIMAL(10, 2) NOT NULL,
+    "sell_price" DECIMAL(10, 2) NOT NULL, "description" TEXT,
+    "created_at" DATETIME NOT NULL, "updated_at" DATETIME NOT NULL);
+CREATE UNIQUE INDEX "part_article" ON "parts" ("article");
+CREATE TABLE "sales" ("id" INTEGER NOT NULL PRIMARY KEY, "date" DATETIME NOT NULL,
+    "total" DECIMAL(10, 2) NOT NULL);
+CREATE TABLE "sale_items" ("id" INTEGER NOT NULL PRIMARY KEY, "sale_id" INTEGER NOT NULL,
+    "part" INTEGER NOT NULL, "quantity" INTEGER NOT NULL, "price" DECIMAL(10, 2) NOT NULL,
+    FOREIGN KEY ("sale_id") REFERENCES "sales" ("id"));
+CREATE INDEX "saleitem_sale_id" ON "sale_items" ("sale_id");
+'''
+
+
+@pytest.fixture
+def legacy_db_path(tmp_path):
+    """Файл БД в формате до миграций, с данными"""
+    db_path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute('''
+    INSERT INTO parts (article, name, brand, car_model, category, quantity,
+                       buy_price, sell_price, description, created_at, updated_at)
+    VALUES ('OLD001', 'Масляный фильтр', 'Toyota', 'Camry', 'Двигатель', 5,
+            100, 150, '', '2024-01-01T00:00:00', '2024-01-01T00:00:00')
+    ''')
+    conn.execute("INSERT INTO sales (date, total) VALUES ('2024-01-02T00:00:00', 150)")
+    conn.execute("INSERT INTO sale_items (sale_id, part_id, quantity, price) VALUES (1, 1, 1, 150)")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def index_names(db_path):
+    """Имена всех пользовательских индексов"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+        ).fetchall()
+        return {row[0] for row in rows}
+    finally:
+        conn.close()
+
+
+class TestMigrations:
+    """Тесты миграций схемы"""
+
+    def test_new_database_is_current(self, tmp_path):
+        """Новая база сразу получает актуальную версию схемы"""
+        db = SimpleDatabase(str(tmp_path / 'new.db'))
+        try:
+            assert get_schema_version(db._connections.reader()) == SCHEMA_VERSION
+            assert 'idx_sale_items_sale' in index_names(db.db_path)
+        finally:
+            db.close()
+
+    def test_legacy_database_upgraded(self, legacy_db_path):
+        """Существующая база обновляется при запуске без потери данных"""
+        assert index_names(legacy_db_path) == set()
+
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            indexes = index_names(legacy_db_path)
+            for name in ('idx_sale_items_sale', 'idx_receipt_items_receipt',
+                         'idx_sales_date', 'idx_receipts_date',
+                         'idx_parts_category', 'idx_parts_brand', 'idx_parts_quantity'):
+                assert name in indexes
+
+            assert get_schema_version(db._connections.reader()) == SCHEMA_VERSION
+            assert db.get_all_parts()[0]['article'] == 'OLD001'
+            assert db.get_all_sales()[0]['items_count'] == 1
+        finally:
+            db.close()
+
+    def test_casefold_columns_backfilled(self, legacy_db_path):
+        """Существующие строки получают заполненные колонки *_cf"""
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            row = db._connections.reader().execute(
+                "SELECT name_cf, brand_cf, car_model_cf, category_cf FROM parts"
+            ).fetchone()
+            assert row == ("масляный фильтр", "toyota", "camry", "двигатель")
+
+            db._fts_enabled = False
+            assert len(db.search_parts("ДВИГАТЕЛЬ")) == 1
+        finally:
+            db.close()
+
+    def test_article_key_backfilled(self, legacy_db_path):
+        """Существующие строки получают article_key и уникальный индекс"""
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            conn = db._connections.reader()
+            assert conn.execute("SELECT article_key FROM parts").fetchone() == ("OLD001",)
+            unique = conn.execute(
+                "SELECT \"unique\" FROM pragma_index_list('parts') WHERE name = 'parts_article_key'"
+            ).fetchone()
+            assert unique == (1,)
+            assert db.find_by_article("old-001")['article'] == 'OLD001'
+        finally:
+            db.close()
+
+    def test_inventory_summary_backfilled(self, legacy_db_path):
+        """Сводки остатков заполняются по существующим строкам"""
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            assert db.get_inventory_totals() == {
+                'count': 1, 'quantity': 5, 'buy_value': 500, 'sell_value': 750, 'low_stock': 1}
+            assert [tuple(g) for g in db.get_group_stats('brand')] == [("Toyota", 1, 5, 750, 500)]
+            assert db.check_summaries() == []
+        finally:
+            db.close()
+
+    def test_part_foreign_keys_fix_rows(self, legacy_db_path):
+        """Позиции со ссылками на несуществующие запчасти и документы исправляются"""
+        conn = sqlite3.connect(legacy_db_path)
+        conn.executescript('''
+        INSERT INTO sale_items (sale_id, part_id, quantity, price) VALUES (1, 42, 1, 10);
+        INSERT INTO sale_items (sale_id, part_id, quantity, price) VALUES (7, 1, 1, 10);
+        ''')
+        conn.close()
+
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            conn = db._connections.reader()
+            assert conn.execute(
+                'SELECT id, sale_id, part_id FROM sale_items ORDER BY id').fetchall() == \
+                [(1, 1, 1), (2, 1, None)]
+            assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+            assert [item['article'] for item in db.get_sale_items(1)] == ['OLD001', None]
+            assert 'idx_sale_items_part' in index_names(legacy_db_path)
+            assert not db.delete_part(1)
+        finally:
+            db.close()
+
+    def test_money_columns_to_kopecks(self, legacy_db_path):
+        """Суммы в рублях (REAL) переводятся в целые копейки"""
+        conn = sqlite3.connect(legacy_db_path)
+        conn.executescript('''
+        UPDATE parts SET buy_price = 100.5, sell_price = 150.25;
+        INSERT INTO sales (date, total) VALUES ('2024-01-03T00:00:00', 0.3);
+        DELETE FROM sales WHERE id = 2;
+        ''')
+        conn.close()
+
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            conn = db._connections.reader()
+            assert conn.execute('SELECT buy_price, sell_price FROM parts').fetchone() == \
+                (10050, 15025)
+            types = {row[1]: row[2] for row in conn.execute("PRAGMA table_info('parts')")}
+            assert types['buy_price'] == types['sell_price'] == 'INTEGER'
+            assert conn.execute('SELECT price FROM sale_items').fetchone() == (15000,)
+            # Номер удалённой продажи не выдаётся повторно
+            assert conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'sales'").fetchone() == (2,)
+            part = db.get_part_by_id(1)
+            assert (part['buy_price'], part['sell_price']) == (Decimal('100.50'), Decimal('150.25'))
+            assert db.get_inventory_totals()['sell_value'] == Decimal('751.25')
+            assert 'idx_parts_sell_price' in index_names(legacy_db_path)
+            assert db.check_summaries() == []
+        finally:
+            db.close()
+
+    def test_peewee_models_database(self, temp_db):
+        """База, созданная моделями peewee, уже в копейках: цены не пересчитываются"""
+        from models.part import Part
+        from models.sale import Sale, SaleItem
+
+        part = Part.create(article="PW001", name="Фильтр", brand="Kia", car_model="Rio",
+                           category="Двигатель", quantity=5, buy_price=100, sell_price=150.55)
+        sale = Sale.create(total=301.10)
+        SaleItem.create(sale=sale, part=part, quantity=2, price=150.55)
+        temp_db.close()
+
+        db = SimpleDatabase(temp_db.database)
+        try:
+            assert get_schema_version(db._connections.reader()) == SCHEMA_VERSION
+            assert db.get_part_by_id(part.id)['sell_price'] == Decimal('150.55')
+            assert [item['price'] for item in db.get_sale_items(sale.id)] == [Decimal('150.55')]
+            assert db.get_all_sales()[0]['total'] == Decimal('301.10')
+        finally:
+            db.close()
+
+        temp_db.connect()
+        sale = Sale.select_with_totals().get()
+        assert SaleItem.get_by_id(1).price == Decimal('150.55')
+        assert sale.items_total == sale.total == Decimal('301.10')
+
+    def test_peewee_legacy_database(self, tmp_path):
+        """База старых моделей peewee (колонка part, цены в рублях) обновляется"""
+        db_path = str(tmp_path / 'models.db')
+        conn = sqlite3.connect(db_path)
+        conn.executescript(PEEWEE_LEGACY_SCHEMA)
+        conn.executescript('''
+        INSERT INTO parts VALUES (1, 'PW001', 'Фильтр', 'Kia', 'Rio', 'Двигатель', 5,
+                                  7.25, 10.5, '', '2024-01-01 00:00:00', '2024-01-01 00:00:00');
+        INSERT INTO sales VALUES (1, '2024-01-02 00:00:00', 21);
+        INSERT INTO sale_items VALUES (1, 1, 1, 2, 10.5);
+        ''')
+        conn.close()
+
+        db = SimpleDatabase(db_path)
+        try:
+            assert get_schema_version(db._connections.reader()) == SCHEMA_VERSION
+            assert db.get_part_by_id(1)['sell_price'] == Decimal('10.50')
+            assert [(item['article'], item['price']) for item in db.get_sale_items(1)] == \
+                [('PW001', Decimal('10.50'))]
+            assert db.get_all_sales()[0]['total'] == Decimal('21.00')
+        finally:
+            db.close()
+
+    def test_failed_migration_stops_startup(self, legacy_db_path):
+        """Ошибка миграции откатывает её и не даёт открыть базу"""
+        def broken(cursor):
+            cursor.execute('CREATE TABLE half_done (id INTEGER)')
+            raise sqlite3.OperationalError("сбой")
+
+        with patch.object(db_migrations, 'MIGRATIONS',
+                          db_migrations.MIGRATIONS[:1] + [(2, "Сбой", broken)]):
+            with pytest.raises(MigrationError, match="версии 2"):
+                SimpleDatabase(legacy_db_path)
+
+        conn = sqlite3.connect(legacy_db_path)
+        try:
+            assert get_schema_version(conn) == 1
+            assert conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name = 'half_done'").fetchone() == (0,)
+        finally:
+            conn.close()
+
+    def test_stock_ledger_backfilled(self, legacy_db_path):
+        """Журнал остатков восстанавливается по продажам, снимки - по месяцам"""
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            assert [(m.kind, m.at, m.delta) for m in db.get_stock_movements(1)] == [
+                ('opening', '2024-01-01T00:00:00', 6), ('sale', '2024-01-02T00:00:00', -1)]
+            assert db.get_stock_as_of('2024-01-01', part_id=1) == 6
+            assert db.get_stock_as_of('2024-01-02', category="Двигатель") == 5
+            assert db.get_stock_as_of('2024-06-30') == 5
+            conn = db._connections.reader()
+            assert conn.execute('SELECT MIN(day) FROM stock_snapshot_days').fetchone() == \
+                ('2024-02-01',)
+        finally:
+            db.close()
+
+    def test_legacy_model_part_column(self, tmp_path):
+        """Колонка part старой модели SaleItem переносится в part_id"""
+        conn = sqlite3.connect(str(tmp_path / 'models.db'))
+        conn.executescript('''
+        CREATE TABLE parts (id INTEGER PRIMARY KEY);
+        CREATE TABLE sales (id INTEGER PRIMARY KEY);
+        CREATE TABLE sale_items (id INTEGER PRIMARY KEY, sale_id INTEGER NOT NULL,
+                                 part INTEGER NOT NULL, quantity INTEGER, price DECIMAL);
+        INSERT INTO parts VALUES (5);
+        INSERT INTO sales VALUES (1);
+        INSERT INTO sale_items VALUES (1, 1, '5', 2, 10), (2, 1, 6, 1, 10);
+        ''')
+
+        def create(cursor):
+            cursor.execute('''
+            CREATE TABLE sale_items (id INTEGER PRIMARY KEY, sale_id INTEGER NOT NULL,
+                                     part_id INTEGER REFERENCES parts (id),
+                                     quantity INTEGER, price DECIMAL)
+            ''')
+
+        with conn:
+            assert rebuild_item_table(conn.cursor(), 'sale_items', ('sale_id', 'sales'),
+                                      ('id', 'sale_id', 'quantity', 'price'), create) == (1, 0)
+        assert conn.execute('SELECT id, part_id FROM sale_items').fetchall() == \
+            [(1, 5), (2, None)]
+        conn.close()
+
+    def test_migrations_idempotent(self, legacy_db_path):
+        """Повторный запуск не применяет миграции заново"""
+        conn = sqlite3.connect(legacy_db_path)
+        try:
+            assert apply_migrations(conn) == SCHEMA_VERSION
+            assert apply_migrations(conn) == 0
+        finally:
+            conn.close()
+
+    def test_sale_items_lookup_uses_index(self, legacy_db_path):
+        """Выборка позиций продажи идёт по индексу, а не полным сканированием"""
+        db = SimpleDatabase(legacy_db_path)
+        try:
+            plan = db._connections.reader().execute('''
+            EXPLAIN QUERY PLAN
+            SELECT si.*, p.article, p.name
+            FROM sale_items si JOIN parts p ON si.part_id = p.id
+            WHERE si.sale_id = ?
+            ''', (1,)).fetchall()
+            details = ' '.join(row[-1] for row in plan)
+            assert 'idx_sale_items_sale' in details
+        finally:
+            db.close()
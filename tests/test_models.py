@@ -7,6 +7,7 @@ import sys
 import os
 from decimal import Decimal
 from datetime import datetime
+from unittest.mock import patch
 
 # Добавляем путь к src для импортов
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -114,6 +115,39 @@ class TestPartModel:
         assert len(results) == 1
         assert results[0].car_model == "Camry"
     
+    def test_part_search_cyrillic_case(self, sample_parts):
+        """Тест регистронезависимого поиска по кириллице без FTS"""
+        assert sample_parts[0].name_cf == "масляный фильтр"
+        
+        results = list(Part.search("ФИЛЬТР"))
+        assert len(results) == 2
+        
+        results = list(Part.search("масляный ФИЛЬТР"))
+        assert len(results) == 1
+        assert results[0].article == "PART001"
+    
+    def test_part_search_full_text(self, temp_db, sample_parts):
+        """Тест поиска через полнотекстовый индекс"""
+        from search_index import create_parts_fts
+        
+        with temp_db.atomic():
+            create_parts_fts(temp_db.connection().cursor())
+        
+        # Префиксы слов, регистр не важен
+        results = list(Part.search("фил"))
+        assert len(results) == 2
+        
+        # Описание тоже индексируется
+        results = list(Part.search("передние"))
+        assert len(results) == 1
+        assert results[0].article == "PART003"
+        
+        # Новые записи попадают в индекс триггером
+        Part.create(article="PART004", name="Топливный фильтр", brand="Kia",
+                    car_model="Rio", category="Двигатель", quantity=1,
+                    buy_price=10.0, sell_price=20.0)
+        assert len(list(Part.search("фильтр"))) == 3
+    
     def test_part_get_by_article_exists(self, sample_part):
         """Тест получения запчасти по артикулу (существует)"""
         part = Part.get_by_article("TEST001")
@@ -122,6 +156,19 @@ class TestPartModel:
         assert part.article == "TEST001"
         assert part.name == "Тестовая запчасть"
     
+    def test_part_get_by_article_normalized(self, temp_db):
+        """Поиск по артикулу не зависит от разделителей и регистра"""
+        Part.create(article="04465-33450", name="Колодки", brand="Toyota",
+                    car_model="Camry", category="Тормоза", quantity=1,
+                    buy_price=10.0, sell_price=20.0)
+        
+        assert Part.get_by_article("0446533450").article == "04465-33450"
+        assert Part.get_by_article("04465 33450").article == "04465-33450"
+        with pytest.raises(Exception):
+            Part.create(article="04465.33450", name="Дубль", brand="Toyota",
+                        car_model="Camry", category="Тормоза", quantity=1,
+                        buy_price=10.0, sell_price=20.0)
+    
     def test_part_get_by_article_not_exists(self, temp_db):
         """Тест получения запчасти по артикулу (не существует)"""
         part = Part.get_by_article("NONEXISTENT")
@@ -188,6 +235,26 @@ class TestSaleModel:
         assert total == 250.0  # 2*100 + 1*50
         assert sale.total == 250.0
 
+    def test_sale_totals_annotated(self, temp_db, sample_part):
+        """select_with_totals считает позиции и сумму одним запросом"""
+        for quantities in ([1, 2], [3], []):
+            sale = Sale.create(total=0)
+            for quantity in quantities:
+                SaleItem.create(sale=sale, part=sample_part.id, quantity=quantity, price=10.5)
+        
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            sales = list(Sale.select_with_totals().order_by(Sale.id))
+            totals = [(sale.items_count, sale.items_total) for sale in sales]
+        
+        assert totals == [(2, Decimal('31.50')), (1, Decimal('31.50')), (0, Decimal('0'))]
+        assert execute.call_count == 1
+    
+    def test_sale_calculate_total_single_query(self, temp_db, sample_sale):
+        """Пересчёт суммы - один SUM и одно обновление"""
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            assert sample_sale.calculate_total() == Decimal('150.00')
+        assert execute.call_count == 2
+
 class TestSaleItemModel:
     """Тесты для модели SaleItem"""
     
@@ -201,7 +268,8 @@ class TestSaleItemModel:
         )
         
         assert item.sale == sample_sale
-        assert item.part == sample_part.id
+        assert item.part_id == sample_part.id
+        assert item.part == sample_part
         assert item.quantity == 3
         assert item.price == 120.0
     
@@ -6,6 +6,7 @@ import pytest
 import sys
 import os
 from decimal import Decimal
+from unittest.mock import patch
 
 # Добавляем путь к src для импортов
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -158,8 +159,7 @@ class TestPartService:
         
         assert result is True
         # Перезагружаем объект из БД
-        sample_part.refresh()
-        assert sample_part.quantity == initial_qty - 3
+        assert Part.get_by_id(sample_part.id).quantity == initial_qty - 3
     
     def test_get_categories(self, sample_parts):
         """Тест получения списка категорий"""
@@ -175,6 +175,10 @@ class TestPartService:
         expected_brands = ["BMW", "Honda", "Toyota"]
         assert sorted(brands) == sorted(expected_brands)
     
+    def test_get_car_models(self, sample_parts):
+        """Тест получения списка моделей (по алфавиту)"""
+        assert PartService.get_car_models() == ["3 Series", "Camry", "Civic"]
+    
     def test_get_low_stock_parts_default_threshold(self, sample_parts):
         """Тест получения запчастей с низким остатком (порог по умолчанию)"""
         low_stock_parts = PartService.get_low_stock_parts()
@@ -225,10 +229,8 @@ class TestSaleService:
         assert sale.total == Decimal("480.00")  # 2*180 + 1*120
         
         # Проверяем, что количество уменьшилось
-        sample_parts[0].refresh()
-        sample_parts[1].refresh()
-        assert sample_parts[0].quantity == 13  # было 15, продали 2
-        assert sample_parts[1].quantity == 1   # было 2, продали 1
+        assert Part.get_by_id(sample_parts[0].id).quantity == 13  # было 15, продали 2
+        assert Part.get_by_id(sample_parts[1].id).quantity == 1   # было 2, продали 1
     
     def test_create_sale_insufficient_stock(self, temp_db, sample_parts):
         """Тест создания продажи с недостаточным остатком"""
@@ -242,8 +244,61 @@ class TestSaleService:
         assert sale is None
         
         # Количество не должно измениться
-        sample_parts[0].refresh()
-        assert sample_parts[0].quantity == 15
+        assert Part.get_by_id(sample_parts[0].id).quantity == 15
+    
+    def test_create_sale_repeated_part_exceeds_stock(self, temp_db, sample_parts):
+        """Позиции одной запчасти суммируются: вместе они больше остатка"""
+        part = sample_parts[1]  # остаток 2
+        items = [
+            {'part_id': part.id, 'quantity': 1, 'price': Decimal("120.00")},
+            {'part_id': part.id, 'quantity': 2, 'price': Decimal("120.00")}
+        ]
+        
+        valid, errors = SaleService.validate_sale_items(items)
+        assert valid is False
+        assert [(e['line'], e['requested'], e['available']) for e in errors] == \
+            [(1, 3, 2), (2, 3, 2)]
+        
+        # Без предварительной проверки продажу не пропускает условный UPDATE
+        sale, success = SaleService.create_sale(items)
+        assert (sale, success) == (None, False)
+        assert Part.get_by_id(part.id).quantity == 2
+        assert Sale.select().count() == 0
+    
+    def test_create_sale_writes_stock_ledger(self, tmp_path):
+        """В базе с журналом остатков продажа пишет движения 'sale' и снимки"""
+        from peewee import SqliteDatabase
+        from database_simple import SimpleDatabase
+        from search_index import (ARTICLE_KEY_FUNCTION, CASEFOLD_FUNCTION, casefold_text,
+                                  normalize_article)
+        
+        db_path = str(tmp_path / 'ledger.db')
+        simple = SimpleDatabase(db_path)
+        part_id = simple.add_part_record("SL001", "Фильтр", "Kia", "Rio", "Двигатель",
+                                         5, 100, 150).id
+        with simple._connections.writer() as conn:
+            conn.execute("INSERT INTO stock_movements (part_id, at, delta, kind) "
+                         "VALUES (?, '2024-01-10T09:00:00', 0, 'adjust')", (part_id,))
+        
+        peewee_db = SqliteDatabase(db_path)
+        peewee_db.register_function(casefold_text, CASEFOLD_FUNCTION, 1, deterministic=True)
+        peewee_db.register_function(normalize_article, ARTICLE_KEY_FUNCTION, 1,
+                                    deterministic=True)
+        try:
+            with peewee_db.bind_ctx([Part, Sale, SaleItem]):
+                sale, success = SaleService.create_sale(
+                    [{'part_id': part_id, 'quantity': 2, 'price': Decimal("150.00")}])
+            assert success
+            
+            movements = simple.get_stock_movements(part_id)
+            assert [(m.kind, m.delta, m.document_id) for m in movements][-1] == \
+                ('sale', -2, sale.id)
+            assert simple.check_stock_ledger() == []
+            assert simple._connections.reader().execute(
+                'SELECT MIN(day) FROM stock_snapshot_days').fetchone() == ('2024-02-01',)
+        finally:
+            peewee_db.close()
+            simple.close()
     
     def test_get_all_sales(self, temp_db, sample_sale):
         """Тест получения всех продаж"""
@@ -253,6 +308,59 @@ class TestSaleService:
         # Проверяем сортировку по дате (новые первыми)
         assert sales[0].id == sample_sale.id
     
+    def test_sales_without_query_per_sale(self, temp_db, sample_part):
+        """История продаж не выполняет запрос на каждую продажу"""
+        for i in range(5):
+            sale = Sale.create(total=0)
+            SaleItem.create(sale=sale, part=sample_part.id, quantity=i + 1, price=100.0)
+            SaleItem.create(sale=sale, part=sample_part.id, quantity=1, price=50.0)
+        
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            sales = SaleService.get_all_sales()
+            assert [sale.items_count for sale in sales] == [2] * 5
+            assert sales[0].items_total == Decimal('550.00')
+        assert execute.call_count == 1
+        
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            page = SaleService.get_sales_page(limit=3, offset=1)
+            assert [len(sale.items) for sale in page] == [2, 2, 2]
+            assert [sale.items_total for sale in page] == [
+                Decimal('450'), Decimal('350'), Decimal('250')]
+        # Продажи и позиции всей страницы - два запроса
+        assert execute.call_count == 2
+    
+    def test_annotated_totals_match_prefetched_items(self, temp_db, sample_parts):
+        """items_total из GROUP BY совпадает с суммой позиций, загруженных prefetch"""
+        first, second = sample_parts[0].id, sample_parts[1].id
+        for items in ([{'part_id': first, 'quantity': 3, 'price': Decimal("0.10")}],
+                      [{'part_id': first, 'quantity': 1, 'price': 33.33},
+                       {'part_id': second, 'quantity': 2, 'price': Decimal("120.05")}],
+                      [{'part_id': first, 'quantity': 2, 'price': 0.2},
+                       {'part_id': first, 'quantity': 1, 'price': 0.1}]):
+            assert SaleService.create_sale(items)[1] is True
+        
+        annotated = {sale.id: sale.items_total for sale in SaleService.get_all_sales()}
+        page = SaleService.get_sales_page(limit=10)
+        prefetched = {sale.id: sum((item.quantity * item.price for item in sale.items),
+                                   Decimal(0))
+                      for sale in page}
+        
+        assert annotated == prefetched == {sale.id: sale.items_total for sale in page}
+        assert annotated == {sale.id: sale.total for sale in page}
+        assert sorted(annotated.values()) == [
+            Decimal("0.30"), Decimal("0.50"), Decimal("273.43")]
+    
+    def test_sale_items_with_parts_one_query(self, temp_db, sample_parts):
+        """Позиции продажи с запчастями читаются одним запросом с JOIN"""
+        sale = Sale.create(total=0)
+        for part in reversed(sample_parts):
+            SaleItem.create(sale=sale, part=part, quantity=1, price=100.0)
+        
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            items = SaleService.get_sale_items(sale.id)
+            assert [item.part.article for item in items] == ["PART003", "PART002", "PART001"]
+        assert execute.call_count == 1
+    
     def test_get_sale_by_id_exists(self, sample_sale):
         """Тест получения продажи по ID (существует)"""
         sale = SaleService.get_sale_by_id(sample_sale.id)
@@ -283,7 +391,7 @@ class TestSaleService:
         is_valid, errors = SaleService.validate_sale_items([])
         
         assert is_valid is False
-        assert "Не выбраны товары для продажи" in errors[0]
+        assert errors[0]['reason'] == "Не выбраны товары для продажи"
     
     def test_validate_sale_items_insufficient_stock(self, sample_parts):
         """Тест валидации позиций с недостаточным остатком"""
@@ -294,7 +402,7 @@ class TestSaleService:
         is_valid, errors = SaleService.validate_sale_items(items)
         
         assert is_valid is False
-        assert "недостаточно товара на складе" in errors[0]
+        assert errors[0]['reason'] == "недостаточно товара на складе"
     
     def test_validate_sale_items_zero_quantity(self, sample_parts):
         """Тест валидации позиций с нулевым количеством"""
@@ -305,7 +413,7 @@ class TestSaleService:
         is_valid, errors = SaleService.validate_sale_items(items)
         
         assert is_valid is False
-        assert "количество должно быть больше 0" in errors[0]
+        assert errors[0]['reason'] == "количество должно быть больше 0"
     
     def test_validate_sale_items_nonexistent_part(self, temp_db):
         """Тест валидации позиций с несуществующим товаром"""
@@ -316,7 +424,51 @@ class TestSaleService:
         is_valid, errors = SaleService.validate_sale_items(items)
         
         assert is_valid is False
-        assert "товар не найден" in errors[0]
+        assert errors[0]['reason'] == "товар не найден"
+    
+    def test_validate_sale_items_one_query(self, temp_db, sample_parts):
+        """Все запчасти заказа читаются одним запросом, повторы суммируются"""
+        items = [{'part_id': part.id, 'quantity': 1, 'price': Decimal("1.00")}
+                 for part in sample_parts[:2]] * 50
+        items.append({'part_id': 99999, 'quantity': 1, 'price': Decimal("1.00")})
+        items.append({'part_id': sample_parts[0].id, 'price': Decimal("1.00")})
+        
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            is_valid, errors = SaleService.validate_sale_items(items)
+        assert execute.call_count == 1
+        
+        assert is_valid is False
+        # Воздушного фильтра 2 шт., а в заказе 50 позиций по одной
+        second = [e for e in errors if e['part_id'] == sample_parts[1].id]
+        assert len(second) == 50
+        assert (second[0]['line'], second[0]['requested'], second[0]['available']) == (2, 50, 2)
+        assert [(e['line'], e['reason']) for e in errors[-2:]] == [
+            (101, "товар не найден"), (102, "некорректные данные")]
+    
+    def test_load_sale_parts_chunked(self, temp_db, sample_part):
+        """Идентификаторы запрашиваются порциями ниже лимита параметров SQLite"""
+        items = [{'part_id': sample_part.id + i, 'quantity': 1, 'price': Decimal("1.00")}
+                 for i in range(1200)]
+        with patch.object(temp_db, 'execute_sql', wraps=temp_db.execute_sql) as execute:
+            parts = SaleService.load_sale_parts(items)
+        assert execute.call_count == 3
+        assert list(parts) == [sample_part.id]
+    
+    def test_create_sale_uses_snapshot(self, temp_db, sample_parts):
+        """create_sale не перечитывает запчасти, проверенные при валидации"""
+        items = [{'part_id': sample_parts[0].id, 'quantity': 2, 'price': Decimal("180.00")}]
+        parts = SaleService.load_sale_parts(items)
+        assert SaleService.validate_sale_items(items, parts) == (True, [])
+        
+        with patch.object(Part, 'select', wraps=Part.select) as select:
+            sale, success = SaleService.create_sale(items, parts)
+        assert success and select.call_count == 0
+        assert Part.get_by_id(sample_parts[0].id).quantity == 13
+        
+        # По снимку отказ - ещё до транзакции
+        items[0]['quantity'] = 20
+        assert SaleService.create_sale(items, parts) == (None, False)
+        assert Sale.select().count() == 1
     
     def test_calculate_change_sufficient(self, temp_db):
         """Тест расчета сдачи (достаточно денег)"""